@@ -0,0 +1,333 @@
+# db.py
+
+from benchmarks.harness import percentiles, scratch_database
+from bot.cogs.utils import DBHelper
+
+import argparse
+import asyncio
+import asyncpg
+import datetime
+from dotenv import load_dotenv
+import itertools
+import json
+import logging
+import os
+import random
+import time
+
+SNOWFLAKE_BASE = 10 ** 17
+SHARD_COUNT = 16  # Shards sync_guilds is benchmarked with, each syncing its own guilds
+
+
+class RecordingConnection:
+    """ Proxy of a connection that records the statements run through it and their arguments. """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = []  # (statement, arguments) in the order they were run
+
+    def transaction(self):
+        return self.conn.transaction()
+
+    async def fetch(self, statement, *args):
+        self.statements.append((statement, args))
+        return await self.conn.fetch(statement, *args)
+
+    async def fetchrow(self, statement, *args):
+        self.statements.append((statement, args))
+        return await self.conn.fetchrow(statement, *args)
+
+    async def fetchval(self, statement, *args):
+        self.statements.append((statement, args))
+        return await self.conn.fetchval(statement, *args)
+
+    async def execute(self, statement, *args):
+        self.statements.append((statement, args))
+        return await self.conn.execute(statement, *args)
+
+    async def executemany(self, statement, rows):
+        rows = list(rows)
+
+        if rows:  # Each row runs the same plan so one is explained
+            self.statements.append((statement, tuple(rows[0])))
+
+        return await self.conn.executemany(statement, rows)
+
+
+class Workload:
+    """
+    Seeds a scratch schema with guilds, users, queues, bans, ratings and stats
+    and generates the arguments each DBHelper operation is benchmarked with.
+    Guild IDs are spaced like snowflakes so they spread over the shards.
+    """
+
+    def __init__(self, guilds=100_000, users=1_000_000, seed=0):
+        self.rng = random.Random(seed)
+        self.guild_ids = [SNOWFLAKE_BASE + (index << 22) + self.rng.randrange(1 << 22) for index in range(guilds)]
+        self.user_ids = [SNOWFLAKE_BASE + index for index in range(users)]
+        self.queue_guilds = self.guild_ids[:max(1, guilds // 10)]  # Guilds with players queued
+        self.ban_guilds = self.guild_ids[-max(1, guilds // 10):]  # Guilds with players banned
+        self.rated_users = self.user_ids[:max(10, users // 5)]  # Users who have played a match
+        self.new_ids = itertools.count(SNOWFLAKE_BASE * 2)  # IDs of the rows the benchmark inserts
+        self.joining_users = self.user_ids[users // 2:]  # Users the benchmark queues
+        self.queued = {}  # IDs of the users queued in each guild of the queue guilds
+
+    async def seed(self, conn):
+        """ Fill the tables and update the planner's statistics. """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        hour = datetime.timedelta(hours=1)
+        await conn.copy_records_to_table('guilds', records=[(guild_id,) for guild_id in self.guild_ids],
+                                         columns=['id'])
+        await conn.copy_records_to_table('users', records=[(user_id,) for user_id in self.user_ids], columns=['id'])
+
+        queued_users = []
+
+        for guild_id in self.queue_guilds:
+            self.queued[guild_id] = self.rng.sample(self.user_ids[:len(self.user_ids) // 2], 8)
+            queued_users.extend((guild_id, user_id) for user_id in self.queued[guild_id])
+
+        await conn.copy_records_to_table('queued_users', records=queued_users, columns=['guild_id', 'user_id'])
+
+        # A third of the bans are permanent, a third have expired and a third are still running
+        unban_times = [None, now - hour, now + 24 * hour]
+        banned_users = [(guild_id, user_id, unban_times[number % 3])
+                        for guild_id in self.ban_guilds
+                        for number, user_id in enumerate(self.rng.sample(self.user_ids, 20))]
+        await conn.copy_records_to_table('banned_users', records=banned_users,
+                                         columns=['guild_id', 'user_id', 'unban_time'])
+
+        await conn.copy_records_to_table('player_ratings', columns=['user_id', 'rating', 'matches'],
+                                         records=[(user_id, self.rng.gauss(1000, 200), self.rng.randrange(1, 100))
+                                                  for user_id in self.rated_users])
+        await conn.copy_records_to_table('player_stats', columns=['user_id', 'wins', 'losses', 'kills', 'deaths'],
+                                         records=[(user_id, *(self.rng.randrange(100) for _ in range(4)))
+                                                  for user_id in self.rated_users])
+        await conn.copy_records_to_table('in_match', columns=['user_id', 'match_id', 'expires_at'],
+                                         records=[(user_id, number // 10, now + hour)
+                                                  for number, user_id in enumerate(self.user_ids[-1000:])])
+        await conn.execute('ANALYZE;')
+
+    def operations(self):
+        """ Get a function running each operation with new arguments on a DBHelper by operation name. """
+        rng = self.rng
+        joins = itertools.count()
+
+        def players():
+            return rng.sample(self.rated_users, 10)
+
+        shards = [[] for _ in range(SHARD_COUNT)]
+
+        for guild_id in self.guild_ids:
+            shards[(guild_id >> 22) % SHARD_COUNT].append(guild_id)
+
+        def sync_guilds(db):
+            shard_id = rng.randrange(SHARD_COUNT)
+            return db.sync_guilds(*shards[shard_id], shard_ids=[shard_id], shard_count=SHARD_COUNT)
+
+        def queue_guild():
+            return rng.choice(self.queue_guilds)
+
+        def insert_queued_users(db):
+            # Pairs of guild and user from the users who were never seeded in a queue so none are queued twice
+            number = next(joins)
+            guild_id = self.queue_guilds[number // len(self.joining_users) % len(self.queue_guilds)]
+            return db.insert_queued_users(guild_id, self.joining_users[number % len(self.joining_users)])
+
+        def delete_queued_users(db):
+            guild_id = queue_guild()
+            return db.delete_queued_users(guild_id, rng.choice(self.queued[guild_id]))
+
+        def insert_banned_users(db):
+            unban_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+            return db.insert_banned_users(rng.choice(self.ban_guilds), rng.choice(self.user_ids),
+                                          unban_time=unban_time)
+
+        return {
+            'get_guild': lambda db: db.get_guild(rng.choice(self.guild_ids)),
+            'update_guild': lambda db: db.update_guild(rng.choice(self.guild_ids), capacity=rng.choice([6, 8, 10])),
+            'insert_guilds': lambda db: db.insert_guilds(next(self.new_ids)),
+            'sync_guilds': sync_guilds,
+            'insert_users': lambda db: db.insert_users(*(next(self.new_ids) for _ in range(10))),
+            'get_queued_users': lambda db: db.get_queued_users(queue_guild()),
+            'insert_queued_users': insert_queued_users,
+            'delete_queued_users': delete_queued_users,
+            'get_banned_users': lambda db: db.get_banned_users(rng.choice(self.ban_guilds)),
+            'insert_banned_users': insert_banned_users,
+            'get_ratings': lambda db: db.get_ratings(*players()),
+            'get_player_stats': lambda db: db.get_player_stats(*players()),
+            'get_in_match': lambda db: db.get_in_match(),
+            'upsert_in_match': lambda db: db.upsert_in_match(
+                next(self.new_ids), datetime.datetime.now(datetime.timezone.utc), *players())
+        }
+
+
+async def explain(conn, operation):
+    """Run an operation once and explain each statement it ran.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection
+        Connection to run the operation and the explains on. Everything runs
+        in transactions that are rolled back so the data isn't changed.
+    operation : callable
+        Function running the operation on a DBHelper.
+
+    Returns
+    -------
+    list
+        The statement, plan, execution time and sequentially scanned tables
+        of each statement.
+    """
+    recorder = RecordingConnection(conn)
+    transaction = conn.transaction()
+    await transaction.start()
+
+    try:
+        await operation(DBHelper(recorder))
+    finally:
+        await transaction.rollback()
+
+    explained = []
+
+    for statement, args in recorder.statements:
+        transaction = conn.transaction()
+        await transaction.start()
+
+        try:
+            plan = await conn.fetchval(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement.rstrip().rstrip(";")}',
+                                       *args)
+        finally:
+            await transaction.rollback()
+
+        plan = json.loads(plan)[0]
+        explained.append({
+            'statement': statement,
+            'execution_ms': plan['Execution Time'],
+            'seq_scans': sorted(set(_seq_scans(plan['Plan']))),
+            'plan': plan
+        })
+
+    return explained
+
+
+def _seq_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name']
+
+    for child in node.get('Plans', []):
+        yield from _seq_scans(child)
+
+
+async def measure(pool, operation, concurrency, duration):
+    """ Run an operation from a number of concurrent workers for a number of seconds and summarise its latency. """
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            async with pool.acquire() as conn:
+                start = time.perf_counter()
+                await operation(DBHelper(conn))
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {'calls': len(latencies), 'per_second': len(latencies) / elapsed, 'latency': percentiles(latencies)}
+
+
+async def benchmark(db_url, guilds, users, concurrencies, duration, names=None):
+    """ Seed a scratch schema and measure and explain each DBHelper operation. """
+    workload = Workload(guilds, users)
+    results = {'guilds': guilds, 'users': users, 'duration': duration, 'operations': {}}
+
+    async with scratch_database(db_url) as scratch_url:
+        conn = await asyncpg.connect(scratch_url)
+
+        try:
+            start = time.perf_counter()
+            await workload.seed(conn)
+            results['seed_seconds'] = time.perf_counter() - start
+            operations = workload.operations()
+
+            for name in names or operations:
+                results['operations'][name] = {'statements': await explain(conn, operations[name]), 'concurrency': {}}
+        finally:
+            await conn.close()
+
+        pool = await asyncpg.create_pool(scratch_url, min_size=max(concurrencies), max_size=max(concurrencies))
+
+        try:
+            for name, result in results['operations'].items():
+                for concurrency in concurrencies:
+                    result['concurrency'][str(concurrency)] = await measure(pool, operations[name], concurrency,
+                                                                            duration)
+        finally:
+            await pool.close()
+
+    return results
+
+
+def print_results(results, baseline=None):
+    """ Print the throughput and latency of each operation, compared with a baseline run if given. """
+    print(f'{results["guilds"]:,} guilds and {results["users"]:,} users seeded in {results["seed_seconds"]:.1f}s\n')
+    print(f'{"Operation":<22}{"Workers":>8}{"Calls/s":>10}{"p50 (ms)":>10}{"p99 (ms)":>10}{"Change":>10}  '
+          f'Sequential scans')
+
+    for name, result in results['operations'].items():
+        seq_scans = ', '.join(sorted({table for statement in result['statements'] for table in statement['seq_scans']}))
+
+        for concurrency, measured in result['concurrency'].items():
+            change = ''
+
+            try:
+                base = baseline['operations'][name]['concurrency'][concurrency]
+                change = f'{measured["per_second"] / base["per_second"] - 1:+.0%}'
+            except (KeyError, TypeError, ZeroDivisionError):
+                pass
+
+            print(f'{name:<22}{concurrency:>8}{measured["per_second"]:>10.1f}{measured["latency"]["p50"]:>10.2f}'
+                  f'{measured["latency"]["p99"]:>10.2f}{change:>10}  {seq_scans}')
+
+
+def run_benchmark():
+    """ Benchmark the DBHelper operations against a seeded scratch schema. """
+    load_dotenv()
+    logging.disable(logging.INFO)  # Applying the migrations logs every step
+    parser = argparse.ArgumentParser(description='Benchmark the database helper against a seeded scratch schema')
+    parser.add_argument('operations', nargs='*', metavar='operation',
+                        help='Operations to benchmark, all of them if none are given')
+    parser.add_argument('-g', '--guilds', type=int, default=100_000, help='Number of guilds to seed')
+    parser.add_argument('-u', '--users', type=int, default=1_000_000, help='Number of users to seed')
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='Numbers of concurrent workers to measure each operation with')
+    parser.add_argument('-d', '--duration', type=float, default=3.0,
+                        help='Seconds to measure each operation for at each concurrency')
+    parser.add_argument('-o', '--output', metavar='file', help='Write the results and query plans to a JSON file')
+    parser.add_argument('-b', '--baseline', metavar='file', help='Results of a previous run to compare with')
+    args = parser.parse_args()
+
+    known = Workload(1, 10).operations()
+    unknown = [name for name in args.operations if name not in known]
+
+    if unknown:
+        parser.error(f'unknown operations {", ".join(unknown)}, choose from {", ".join(known)}')
+
+    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
+    results = asyncio.run(benchmark(db_connect_url.format(**os.environ), args.guilds, args.users, args.concurrency,
+                                    args.duration, args.operations))
+    baseline = None
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, default=str)
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,592 @@
+# harness.py
+
+from bot.bot import LeagueBot
+from bot.cogs.match import ALL_MAPS, EMOJI_NUMBERS, MapVoteMenu, TeamDraftMenu
+from bot.cogs.utils import DBHelper, PlayerStats
+from bot.cogs.utils.metrics import DB_QUERY_SECONDS
+from bot.settings import BotSettings
+
+from aiohttp import web
+import asyncio
+import asyncpg
+import collections
+import contextlib
+import datetime
+import discord
+from discord.http import HTTPClient
+import inspect
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from yoyo import get_backend, read_migrations
+
+ABS_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ABS_ROOT_DIR, 'migrations')
+TIMESTAMP = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc).isoformat()
+READY_EMOJI = '✅'
+CUSTOM_EMOJI = re.compile(r'<a?:(\w+):(\d+)>')
+PLAYER_FIELDS = re.findall(r"player_data\['(\w+)'\]", inspect.getsource(PlayerStats.__init__))
+_snowflakes = itertools.count(10 ** 17)
+
+
+def snowflake():
+    """ Get a new ID that looks like a Discord snowflake. """
+    return next(_snowflakes)
+
+
+def user_data(user_id, bot=False):
+    return {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0001', 'avatar': None, 'bot': bot}
+
+
+@contextlib.asynccontextmanager
+async def scratch_database(db_url):
+    """Create a throwaway schema with every migration applied and drop it afterwards.
+
+    Parameters
+    ----------
+    db_url : str
+        URL of the PostgreSQL database to create the schema in.
+
+    Yields
+    ------
+    str
+        URL that connects with the scratch schema as the search path.
+    """
+    schema = f'bench_{uuid.uuid4().hex[:12]}'
+    conn = await asyncpg.connect(db_url)
+
+    try:
+        await conn.execute(f'CREATE SCHEMA {schema};')
+
+        def migrate():
+            backend = get_backend(f'{db_url}?schema={schema}')
+
+            with backend.lock():
+                backend.apply_migrations(backend.to_apply(read_migrations(MIGRATIONS_DIR)))
+
+        await asyncio.get_running_loop().run_in_executor(None, migrate)
+        yield f'{db_url}?search_path={schema}'
+    finally:
+        await conn.execute(f'DROP SCHEMA {schema} CASCADE;')
+        await conn.close()
+
+
+class FakeHTTPClient(HTTPClient):
+    """
+    Stand-in for discord.py's HTTP client that answers the REST calls the bot
+    makes locally after an optional latency, records them and echoes the
+    messages it sends back through the fake gateway like Discord does.
+    """
+
+    kinds = {
+        ('GET', '/users/@me'): 'get_user',
+        ('POST', '/channels/{channel_id}/messages'): 'send_message',
+        ('GET', '/channels/{channel_id}/messages'): 'logs_from',
+        ('PATCH', '/channels/{channel_id}/messages/{message_id}'): 'edit_message',
+        ('DELETE', '/channels/{channel_id}/messages/{message_id}'): 'delete_message',
+        ('PUT', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me'): 'add_reaction',
+        ('DELETE', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{member_id}'): 'remove_reaction',
+        ('DELETE', '/channels/{channel_id}/messages/{message_id}/reactions/{emoji}'): 'clear_single_reaction',
+        ('DELETE', '/channels/{channel_id}/messages/{message_id}/reactions'): 'clear_reactions',
+        ('POST', '/channels/{channel_id}/typing'): 'send_typing'
+    }
+
+    def __init__(self, bot_user, latency=0.0, loop=None):
+        super().__init__(loop=loop)
+        self.bot_user = bot_user
+        self.latency = latency  # Seconds each call takes
+        self.gateway = None
+        self.calls = collections.Counter()  # Number of calls by kind
+        self.messages = {}  # Payloads of the messages sent by message ID
+        self.waiters = []  # (channel ID, kinds, check, count, future) waiting for writes
+
+    def wait_for_write(self, channel_id, *kinds, check=None, count=1):
+        """ Get a future resolved with the result of the count-th write of one of the kinds to a channel. """
+        future = self.loop.create_future()
+        self.waiters.append([channel_id, kinds, check, count, future])
+        return future
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        kind = self.kinds.get((route.method, route.path), f'{route.method} {route.path}')
+        self.calls[kind] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        result = None
+
+        if kind == 'get_user':
+            result = self.bot_user
+        elif kind == 'send_message':
+            payload = kwargs.get('json', {})
+            result = self._message(route.channel_id, payload.get('content'), payload.get('embed'))
+            self.loop.call_soon(self.gateway.message_create, result)
+        elif kind == 'edit_message':
+            message_id = int(route.url.rsplit('/', 1)[1])
+            result = self.messages.setdefault(message_id, self._message(route.channel_id, None, None, message_id))
+            payload = kwargs.get('json', {})
+
+            if 'content' in payload:
+                result['content'] = payload['content'] or ''
+
+            if payload.get('embed') is not None:
+                result['embeds'] = [payload['embed']]
+
+            result['edited_timestamp'] = TIMESTAMP
+        elif kind == 'logs_from':
+            result = []
+
+        self._notify(route.channel_id, kind, result)
+        return result
+
+    def _message(self, channel_id, content, embed, message_id=None):
+        message_id = message_id or snowflake()
+        self.messages[message_id] = {
+            'id': str(message_id), 'channel_id': str(channel_id), 'guild_id': str(self.gateway.channels[channel_id]),
+            'author': self.bot_user, 'content': content or '', 'embeds': [embed] if embed else [],
+            'timestamp': TIMESTAMP, 'edited_timestamp': None, 'tts': False, 'mention_everyone': False,
+            'mentions': [], 'mention_roles': [], 'attachments': [], 'pinned': False, 'type': 0
+        }
+        return self.messages[message_id]
+
+    def _notify(self, channel_id, kind, result):
+        for waiter in list(self.waiters):
+            waiter_channel_id, kinds, check, count, future = waiter
+
+            if waiter_channel_id != channel_id or kind not in kinds or (check is not None and not check(result)):
+                continue
+
+            waiter[3] -= 1
+
+            if waiter[3] == 0:
+                self.waiters.remove(waiter)
+
+                if not future.done():
+                    future.set_result((kind, result))
+
+
+class FakeGateway:
+    """
+    Stand-in for the Discord gateway that loads guilds into the bot's cache
+    and dispatches messages and reactions through discord.py's own event
+    parsers.
+    """
+
+    def __init__(self, bot, guilds=1, members=10):
+        self.bot = bot
+        self.state = bot._connection
+        self.guilds = {}  # (first channel ID, member IDs) by guild ID
+        self.channels = {}  # Guild ID by channel ID
+        self.guild_channels = collections.defaultdict(list)  # Channel IDs by guild ID
+        self.closed = asyncio.Event()
+
+        for _ in range(guilds):
+            self.add_guild([snowflake()], [snowflake() for _ in range(members)])
+
+    def add_guild(self, channel_ids, member_ids):
+        """ Add a guild with channels and members to fill the cache with when connecting and return its ID. """
+        guild_id = snowflake()
+        self.guilds[guild_id] = (channel_ids[0], member_ids)
+
+        for channel_id in channel_ids:
+            self.channels[channel_id] = guild_id
+            self.guild_channels[guild_id].append(channel_id)
+
+        return guild_id
+
+    def connect(self):
+        """ Fill the cache with the fake guilds and dispatch the events of a fresh connection. """
+        bot_user = self.bot.http.bot_user
+        self.state.user = discord.ClientUser(state=self.state, data=bot_user)
+
+        for guild_id, (_, member_ids) in self.guilds.items():
+            members = [{'user': user_data(member_id), 'roles': [], 'joined_at': TIMESTAMP, 'deaf': False,
+                        'mute': False} for member_id in member_ids]
+            members.append({'user': bot_user, 'roles': [], 'joined_at': TIMESTAMP, 'deaf': False, 'mute': False})
+            self.state._add_guild_from_data({
+                'id': str(guild_id), 'name': f'guild{guild_id}', 'owner_id': str(member_ids[0]),
+                'member_count': len(members), 'members': members,
+                'channels': [{'id': str(channel_id), 'type': 0, 'name': f'channel{position}', 'position': position,
+                              'permission_overwrites': []}
+                             for position, channel_id in enumerate(self.guild_channels[guild_id])],
+                'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '104324689', 'position': 0}]
+            })
+
+        self.bot.dispatch('connect')
+        self.bot._ready.set()
+        self.bot.dispatch('ready')
+
+    def message_create(self, data):
+        self.state.parse_message_create(data)
+
+    def send_message(self, channel_id, user_id, content, mention_ids=(), message_id=None):
+        """ Dispatch a message from a member that mentions users and return its ID. """
+        bot_user = self.bot.http.bot_user
+        mentions = [bot_user if str(user_id) == bot_user['id'] else user_data(user_id) for user_id in mention_ids]
+        message_id = message_id or snowflake()
+        self.message_create({
+            'id': str(message_id), 'channel_id': str(channel_id), 'guild_id': str(self.channels[channel_id]),
+            'author': user_data(user_id), 'member': {'roles': [], 'joined_at': TIMESTAMP, 'deaf': False,
+                                                     'mute': False},
+            'content': content, 'embeds': [], 'timestamp': TIMESTAMP, 'edited_timestamp': None, 'tts': False,
+            'mention_everyone': False, 'mentions': mentions, 'mention_roles': [], 'attachments': [],
+            'pinned': False, 'type': 0
+        })
+        return message_id
+
+    def add_reaction(self, channel_id, message_id, user_id, emoji):
+        """ Dispatch a member's reaction to a message with a unicode or custom emoji. """
+        custom = CUSTOM_EMOJI.fullmatch(emoji)
+        self.state.parse_message_reaction_add({
+            'user_id': str(user_id), 'channel_id': str(channel_id), 'message_id': str(message_id),
+            'guild_id': str(self.channels[channel_id]),
+            'emoji': {'id': custom[2], 'name': custom[1]} if custom else {'id': None, 'name': emoji}
+        })
+
+
+class BenchBot(LeagueBot):
+    """ LeagueBot connected to the fake gateway and REST API instead of Discord. """
+
+    def __init__(self, *args, guilds=1, members=10, discord_latency=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        bot_user = user_data(snowflake(), bot=True)
+        self.http = self._connection.http = FakeHTTPClient(bot_user, discord_latency, loop=self.loop)
+        self.gateway = self.http.gateway = FakeGateway(self, guilds, members)
+
+    async def connect(self, *, reconnect=True):
+        self.gateway.connect()
+        await self.gateway.closed.wait()
+
+    async def close(self):
+        await super().close()
+        self.gateway.closed.set()
+
+
+class FakeApi:
+    """
+    Local stand-in for the CS:GO League API that links every user, returns
+    zeroed stats and starts matches on fake servers.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency  # Seconds each request takes
+        self.calls = collections.Counter()  # Number of requests by route
+        self.runner = None
+        self.url = None
+        self.match_ids = itertools.count(1)
+        self.app = web.Application(middlewares=[self.middleware])
+        self.app.router.add_get('/discord/check/{user_id}', self.check_linked)
+        self.app.router.add_get('/player/discord/{user_id}', self.player)
+        self.app.router.add_post('/players/discord', self.players)
+        self.app.router.add_post('/match/reserve', self.reserve)
+        self.app.router.add_post('/match/start', self.start_match)
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        self.calls[request.match_info.route.resource.canonical] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return await handler(request)
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    async def close(self):
+        await self.runner.cleanup()
+
+    @staticmethod
+    def _player(user_id):
+        player = dict.fromkeys(PLAYER_FIELDS, 0)
+        player.update({'steam': user_id, 'discord': user_id, 'discord_name': f'user{user_id}', 'id': user_id,
+                       'inMatch': False})
+        return player
+
+    async def check_linked(self, request):
+        return web.json_response({'linked': True})
+
+    async def player(self, request):
+        return web.json_response(self._player(int(request.match_info['user_id'])))
+
+    async def players(self, request):
+        data = await request.json()
+        return web.json_response([self._player(user_id) for user_id in data['discordIds']])
+
+    async def reserve(self, request):
+        raise web.HTTPNotFound()  # Makes the bot fall back to starting matches without a reservation
+
+    async def start_match(self, request):
+        return web.json_response({'match_id': next(self.match_ids), 'ip': '127.0.0.1', 'port': 27015})
+
+
+def emoji_file(directory):
+    """ Write an emoji file with a fake custom emoji for every map and return its path. """
+    path = os.path.join(directory, 'emojis.json')
+
+    with open(path, 'w') as f:
+        json.dump({m.dev_name: f'<:{m.dev_name}:{snowflake()}>' for m in ALL_MAPS}, f)
+
+    return path
+
+
+class Simulation:
+    """
+    Plays full matches in every fake guild at once, from filling the queue and
+    readying up to drafting the teams and voting for the map, and records the
+    latency of each interaction from the moment it's dispatched to the bot's
+    reply.
+    """
+
+    def __init__(self, bot, rounds=1, timeout=30.0, team_method='captains', map_method='random', rate=None,
+                 ramp=0.0):
+        self.bot = bot
+        self.gateway = bot.gateway
+        self.http = bot.http
+        self.rounds = rounds
+        self.timeout = timeout
+        self.team_method = team_method  # "captains", "autobalance" or "random"
+        self.map_method = map_method  # "vote" or "random"
+        self.rate = rate  # Interactions per second each guild makes, as many as the bot keeps up with if None
+        self.ramp = ramp  # Seconds over which the guilds start playing
+        self.latencies = collections.defaultdict(list)  # Seconds by interaction
+        self.db_calls = collections.Counter()  # Number of database helper calls by method before the run
+
+    async def setup(self):
+        """ Set every guild's team and map methods, with captains volunteering if they draft. """
+        await self.bot.wait_until_ready()
+
+        async with self.bot.db_pool.acquire() as conn:
+            db_helper = DBHelper(conn)
+            await db_helper.insert_guilds(*self.gateway.guilds)
+
+            for guild_id in self.gateway.guilds:
+                await db_helper.update_guild(guild_id, team_method=self.team_method, captain_method='volunteer',
+                                             map_method=self.map_method)
+
+    async def run(self):
+        """ Play the rounds in every guild concurrently and return the seconds it took. """
+        self.db_calls = db_calls()
+        guilds = list(self.gateway.guilds.values())
+        start = time.perf_counter()
+        await asyncio.gather(*(self._play_guild(channel_id, member_ids, self.ramp * index / len(guilds))
+                               for index, (channel_id, member_ids) in enumerate(guilds)))
+        return time.perf_counter() - start
+
+    async def _until(self, predicate):
+        """ Wait for the bot to reach a state, such as listening for the reactions of a menu, and return it. """
+        deadline = time.perf_counter() + self.timeout
+
+        while True:
+            result = predicate()
+
+            if result:
+                return result
+
+            if time.perf_counter() > deadline:
+                raise asyncio.TimeoutError()
+
+            await asyncio.sleep(0.001)
+
+    async def _pace(self):
+        """ Wait between a guild's interactions to keep to the rate. """
+        if self.rate:
+            await asyncio.sleep(1 / self.rate)
+
+    def _ready_check_listening(self, match):
+        """ Check if the ready check of a match is waiting for reactions. """
+        return any(match in (cell.cell_contents for cell in check.__closure__ or ())
+                   for _, check in self.bot._listeners.get('reaction_add', []))
+
+    def _menu_listening(self, menu_class, message_id):
+        """ Get the menu of a class on a message if it's waiting for reactions. """
+        for listener in self.bot.extra_events.get('on_reaction_add', []):
+            menu = getattr(listener, '__self__', None)
+
+            if isinstance(menu, menu_class) and menu.id == message_id:
+                return menu
+
+        return None
+
+    async def _interact(self, name, channel_id, dispatch, *kinds, check=None):
+        """ Dispatch an event and time how long the bot takes to make the expected write to the channel. """
+        await self._pace()
+        future = self.http.wait_for_write(channel_id, *kinds, check=check)
+        start = time.perf_counter()
+        dispatch()
+        _, result = await asyncio.wait_for(future, self.timeout)
+        self.latencies[name].append(time.perf_counter() - start)
+        return result
+
+    async def _finish_step(self, name, live, channel_id, dispatch, *kinds):
+        """ Make the last interaction of a step, timing it until the match goes live if it's the last step. """
+        if live:
+            return await self._interact('live', channel_id, dispatch, 'edit_message', check=self._server_posted)
+
+        return await self._interact(name, channel_id, dispatch, *kinds)
+
+    async def _play_guild(self, channel_id, member_ids, delay):
+        await asyncio.sleep(delay)
+        rounds = len(member_ids) // 10
+
+        for round_number in range(min(self.rounds, rounds)):
+            await self._play_round(channel_id, member_ids[round_number * 10:(round_number + 1) * 10])
+
+    async def _play_round(self, channel_id, player_ids):
+        """ Fill the queue, ready up, pick the teams and map and wait for the match to go live. """
+        gateway = self.gateway
+        drafting = self.team_method == 'captains'
+        voting = self.map_method == 'vote'
+
+        for user_id in player_ids[:-1]:
+            await self._interact('join', channel_id, lambda: gateway.send_message(channel_id, user_id, 'q!join'),
+                                 'send_message', 'edit_message')
+
+        # The last join pops the queue into a ready check
+        user_id = player_ids[-1]
+        ready_check = await self._interact('pop', channel_id,
+                                           lambda: gateway.send_message(channel_id, user_id, 'q!join'),
+                                           'send_message')
+        message_id = int(ready_check['id'])
+        guild = self.bot.get_guild(gateway.channels[channel_id])
+        match = self.bot.get_cog('MatchCog').player_match(guild.get_member(player_ids[0]))
+        await self._until(lambda: self._ready_check_listening(match))
+
+        for user_id in player_ids[:-1]:
+            await self._pace()
+            gateway.add_reaction(channel_id, message_id, user_id, READY_EMOJI)
+
+        await self._finish_step('ready', not drafting and not voting, channel_id,
+                                lambda: gateway.add_reaction(channel_id, message_id, player_ids[-1], READY_EMOJI),
+                                'clear_reactions')
+
+        if drafting:
+            # The first two pickers volunteer as captains and then follow the pick order
+            await self._until(lambda: self._menu_listening(TeamDraftMenu, message_id))
+            emojis = dict(zip((user.id for user in match.users), EMOJI_NUMBERS[1:]))
+            captains = [match.users[0].id, match.users[1].id]
+            pickees = [user.id for user in match.users[2:]]
+            pick_order = '12211221'
+
+            for pick_number, pickee in enumerate(pickees[:-2]):
+                captain = captains[int(pick_order[pick_number]) - 1]
+                await self._interact('pick', channel_id,
+                                     lambda: gateway.add_reaction(channel_id, message_id, captain, emojis[pickee]),
+                                     'edit_message')
+
+            # The last pick leaves the last player to the other captain and ends the draft
+            captain = captains[int(pick_order[len(pickees) - 2]) - 1]
+            await self._finish_step('pick', not voting, channel_id,
+                                    lambda: gateway.add_reaction(channel_id, message_id, captain, emojis[pickees[-2]]),
+                                    'edit_message')
+
+        if voting:
+            # Spread the votes over the maps
+            menu = await self._until(lambda: self._menu_listening(MapVoteMenu, message_id))
+            emojis = [self.bot.emoji_dict[m.dev_name] for m in menu.map_pool]
+            voters = [user.id for user in match.users]
+
+            for vote_number, voter in enumerate(voters[:-1]):
+                emoji = emojis[vote_number % len(emojis)]
+                await self._interact('vote', channel_id,
+                                     lambda: gateway.add_reaction(channel_id, message_id, voter, emoji),
+                                     'edit_message')
+
+            emoji = emojis[(len(voters) - 1) % len(emojis)]
+            await self._finish_step('vote', True, channel_id,
+                                    lambda: gateway.add_reaction(channel_id, message_id, voters[-1], emoji),
+                                    'edit_message')
+
+    @staticmethod
+    def _server_posted(message):
+        return any(embed.get('title') == 'Match server is ready!' for embed in message['embeds'])
+
+    def report(self, elapsed):
+        """ Summarise the interactions per second, latency percentiles and calls to each backend of the run. """
+        report = {'seconds': elapsed, 'interactions': sum(len(x) for x in self.latencies.values())}
+        report['per_second'] = report['interactions'] / elapsed
+        report['latency'] = {name: percentiles(latencies) for name, latencies in self.latencies.items()}
+        report['latency']['all'] = percentiles([x for latencies in self.latencies.values() for x in latencies])
+        report['discord_calls'] = dict(self.http.calls)
+        report['db_calls'] = dict(db_calls() - self.db_calls)
+        return report
+
+
+def db_calls():
+    """ Count the database helper calls the bot has made so far by method. """
+    calls = collections.Counter()
+
+    for (method, _), counts in DB_QUERY_SECONDS.counts.items():
+        calls[method] += sum(counts)
+
+    return calls
+
+
+def percentiles(latencies):
+    """ Get the median, 95th and 99th percentile and maximum of latencies in milliseconds. """
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {'count': len(ordered), 'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+            'max': ordered[-1] * 1000}
+
+
+async def simulate(db_url, guilds=10, rounds=1, discord_latency=0.0, api_latency=0.0, **options):
+    """Run the bot against the fake Discord and API and a scratch schema of the database.
+
+    Parameters
+    ----------
+    db_url : str
+        URL of the PostgreSQL database to create the scratch schema in.
+    guilds : int
+        Number of guilds playing at once.
+    rounds : int
+        Number of matches each guild drafts.
+    discord_latency : float
+        Seconds each Discord REST call takes.
+    api_latency : float
+        Seconds each API request takes.
+    **options
+        Team and map methods, rate, ramp and timeout of the simulation.
+
+    Returns
+    -------
+    dict
+        The simulation's report.
+    """
+    api = FakeApi(api_latency)
+    await api.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            async with scratch_database(db_url) as scratch_url:
+                # Keep every guild's messages of a round cached like a busy bot would need to
+                bot = BenchBot('token', api.url, 'key', scratch_url, emoji_file(directory), guilds=guilds,
+                               members=10 * rounds, discord_latency=discord_latency,
+                               settings=BotSettings(message_cache_size=max(1000, 50 * guilds)))
+                bot_task = asyncio.get_running_loop().create_task(bot.start('token'))
+
+                try:
+                    simulation = Simulation(bot, rounds, **options)
+                    await simulation.setup()
+                    elapsed = await simulation.run()
+                finally:
+                    await bot.close()
+                    await bot_task
+
+                report = simulation.report(elapsed)
+                report['api_calls'] = dict(api.calls)
+                return report
+    finally:
+        await api.close()
@@ -0,0 +1,93 @@
+# load.py
+
+from benchmarks.harness import simulate
+
+import argparse
+import asyncio
+from dotenv import load_dotenv
+import json
+import logging
+import os
+
+# Each scenario plays one match per guild by default, see Simulation for what the options do
+SCENARIOS = {
+    'smoke': {'guilds': 5, 'team_method': 'captains', 'map_method': 'vote'},
+    'queue': {'guilds': 200, 'team_method': 'autobalance', 'map_method': 'random'},
+    'draft': {'guilds': 200, 'team_method': 'captains', 'map_method': 'random'},
+    'vote': {'guilds': 200, 'team_method': 'random', 'map_method': 'vote'},
+    '1k-guilds': {'guilds': 1000, 'team_method': 'captains', 'map_method': 'vote', 'rate': 2.0, 'ramp': 30.0,
+                  'timeout': 60.0}
+}
+OVERRIDES = ['guilds', 'rounds', 'rate', 'ramp', 'timeout', 'discord_latency', 'api_latency']
+
+
+def scenario_options(name, args):
+    """ Get the options of a scenario with the ones given on the command line overriding its own. """
+    options = dict(SCENARIOS[name])
+
+    for option in OVERRIDES:
+        if getattr(args, option) is not None:
+            options[option] = getattr(args, option)
+
+    return options
+
+
+def print_report(name, options, report):
+    """ Print the latency of each interaction of a scenario and the calls it made to Discord, the API and the DB. """
+    print(f'{name}: {options["guilds"]} guilds, {report["interactions"]} interactions in {report["seconds"]:.2f}s '
+          f'({report["per_second"]:.1f}/s)')
+    print(f'    {"Interaction":<12}{"Count":>8}{"p50 (ms)":>10}{"p95 (ms)":>10}{"p99 (ms)":>10}{"max (ms)":>10}')
+
+    for interaction, latency in report['latency'].items():
+        print(f'    {interaction:<12}{latency["count"]:>8}{latency["p50"]:>10.2f}{latency["p95"]:>10.2f}'
+              f'{latency["p99"]:>10.2f}{latency["max"]:>10.2f}')
+
+    for backend, label in (('discord', 'Discord'), ('api', 'API'), ('db', 'Database')):
+        calls = sorted(report[f'{backend}_calls'].items(), key=lambda item: item[1], reverse=True)
+        print(f'    {label} calls ({sum(count for _, count in calls)}): '
+              + ', '.join(f'{call} {count}' for call, count in calls))
+
+    print()
+
+
+def run_load_test():
+    """ Play scripted scenarios against the fake Discord and API and report their throughput and latency. """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Load test the bot\'s queue and match flow without Discord')
+    parser.add_argument('scenarios', nargs='*', choices=list(SCENARIOS), default=['smoke'], metavar='scenario',
+                        help=f'Scenarios to play, any of {", ".join(SCENARIOS)}')
+    parser.add_argument('-g', '--guilds', type=int, help='Number of guilds playing at once')
+    parser.add_argument('-r', '--rounds', type=int, help='Number of matches played in each guild')
+    parser.add_argument('--rate', type=float, help='Interactions per second each guild makes, as fast as possible if 0')
+    parser.add_argument('--ramp', type=float, help='Seconds over which the guilds start playing')
+    parser.add_argument('--timeout', type=float, help='Seconds to wait for each reply before failing the scenario')
+    parser.add_argument('--discord-latency', type=float, help='Seconds each Discord REST call takes')
+    parser.add_argument('--api-latency', type=float, help='Seconds each API request takes')
+    parser.add_argument('--json', action='store_true', help='Print the full reports as JSON instead of tables')
+    parser.add_argument('-o', '--output', metavar='file', help='Also write the full reports to a JSON file')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # Logging every command would slow the bot down more than the load does
+    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
+    db_url = db_connect_url.format(**os.environ)
+    reports = {}
+
+    for name in args.scenarios:
+        options = scenario_options(name, args)
+        report = asyncio.run(simulate(db_url, **options))
+        report['options'] = options
+        reports[name] = report
+
+        if not args.json:
+            print_report(name, options, report)
+
+    if args.json:
+        print(json.dumps(reports, indent=4))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=4)
+
+
+if __name__ == '__main__':
+    run_load_test()
@@ -0,0 +1,164 @@
+# logging_stall.py
+
+from bot.cogs.logger import LOGGING_CONFIG, LogPipeline, log_lines
+
+import argparse
+import asyncio
+import json
+import logging
+from logging import handlers
+import os
+import tempfile
+import time
+
+
+class SlowStream:
+    """ Console stream that takes a while to write, like a terminal or pipe that can't keep up. """
+
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def formatter(name):
+    """ Create one of the bot's log formatters. """
+    formatter_config = LOGGING_CONFIG['formatters'][name]
+    return logging.Formatter(formatter_config['format'], formatter_config['datefmt'])
+
+
+def set_sinks(directory, write_delay):
+    """ Replace the root logger's handlers with the bot's console and file handlers writing to scratch files. """
+    root = logging.getLogger()
+
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    console_config = LOGGING_CONFIG['handlers']['console']
+    file_config = LOGGING_CONFIG['handlers']['file']
+    console = logging.StreamHandler(SlowStream(open(os.path.join(directory, 'console.log'), 'w'), write_delay))
+    console.setLevel(console_config['level'])
+    console.setFormatter(formatter(console_config['formatter']))
+    file = handlers.RotatingFileHandler(os.path.join(directory, 'bot.log'), maxBytes=file_config['maxBytes'],
+                                        encoding='utf-8')
+    file.setLevel(file_config['level'])
+    file.setFormatter(formatter(file_config['formatter']))
+    root.addHandler(console)
+    root.addHandler(file)
+
+
+async def command(number, payload):
+    """ Log what the bot logs for a command that makes an API request. """
+    log_lines(logging.INFO, 'Command "%s" issued', 'join',
+              sub_lines={'Caller': f'user#{number:04} ({number})', 'Guild': f'guild ({number % 100})'})
+    logger = logging.getLogger('csgoleague.api')
+    url = f'https://league.example/player/discord/{number}'
+    logger.info(f'Sending GET request to {url}')
+    await asyncio.sleep(0)
+    logger.info(f'Response received from {url} (0.01s)\n    Status: 200\n    Reason: OK')
+    logger.debug('Response JSON from %s: %s', url, payload)
+
+
+async def flood(commands, concurrency, payload, interval):
+    """ Run the commands while measuring how late the event loop wakes a ticker up. """
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            stalls.append(max(0.0, loop.time() - start - interval))
+
+    async def worker(numbers):
+        for number in numbers:
+            await command(number, payload)
+
+    ticker_task = asyncio.get_running_loop().create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(range(offset, commands, concurrency)) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return elapsed, stalls
+
+
+def run_mode(mode, args, payload):
+    """ Run the flood with the handlers on the event loop or behind the log pipeline and summarise it. """
+    with tempfile.TemporaryDirectory() as directory:
+        set_sinks(directory, args.write_delay)
+        pipeline = LogPipeline(queue_size=args.queue_size) if mode == 'pipeline' else None
+
+        if pipeline is not None:
+            pipeline.start()
+
+        try:
+            elapsed, stalls = asyncio.run(flood(args.commands, args.concurrency, payload, args.interval))
+        finally:
+            dropped = 0 if pipeline is None else pipeline.dropped
+            drain_start = time.perf_counter()
+
+            if pipeline is not None:
+                pipeline.stop()
+
+            drain = time.perf_counter() - drain_start
+            set_sinks(directory, 0)  # Close the scratch files before the directory is removed
+
+    ordered = sorted(stalls)
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'commands_per_second': args.commands / elapsed,
+        'stall_total_ms': sum(stalls) * 1000,
+        'stall_p99_ms': ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000 if ordered else 0.0,
+        'stall_max_ms': ordered[-1] * 1000 if ordered else 0.0,
+        'dropped': dropped,
+        'drain_seconds': drain
+    }
+
+
+def run_benchmark():
+    """ Compare how long logging a command flood stalls the event loop with and without the log pipeline. """
+    parser = argparse.ArgumentParser(description='Benchmark event loop stalls caused by logging')
+    parser.add_argument('-n', '--commands', type=int, default=20000, help='Number of commands to log')
+    parser.add_argument('-c', '--concurrency', type=int, default=100, help='Number of commands running at once')
+    parser.add_argument('-p', '--payload-kb', type=int, default=16,
+                        help='Approximate size of the API response JSON logged at debug level in KB')
+    parser.add_argument('-d', '--write-delay', type=float, default=0.0,
+                        help='Seconds each console write takes to emulate a slow terminal or pipe')
+    parser.add_argument('-q', '--queue-size', type=int, default=10000, help='Size of the log pipeline\'s queue')
+    parser.add_argument('-i', '--interval', type=float, default=0.001,
+                        help='Seconds between the ticks used to measure stalls')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON instead of a table')
+    args = parser.parse_args()
+
+    payload = {'matches': [{'id': i, 'kills': i % 30, 'deaths': i % 20, 'map': 'de_dust2'}
+                           for i in range(args.payload_kb * 1024 // 60)]}
+    results = [run_mode(mode, args, payload) for mode in ('direct', 'pipeline')]
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print(f'{"Mode":<10}{"Seconds":>9}{"Commands/s":>12}{"Stall (ms)":>12}{"p99 (ms)":>10}{"Max (ms)":>10}'
+          f'{"Dropped":>9}{"Drain (s)":>11}')
+
+    for result in results:
+        print(f'{result["mode"]:<10}{result["seconds"]:>9.2f}{result["commands_per_second"]:>12.0f}'
+              f'{result["stall_total_ms"]:>12.0f}{result["stall_p99_ms"]:>10.2f}{result["stall_max_ms"]:>10.2f}'
+              f'{result["dropped"]:>9}{result["drain_seconds"]:>11.2f}')
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,95 @@
+# loops.py
+
+from benchmarks.harness import simulate
+
+import argparse
+import asyncio
+from dotenv import load_dotenv
+import importlib.util
+import json
+import logging
+import os
+import subprocess
+import sys
+
+ABS_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOOPS = ['asyncio', 'uvloop']
+
+
+def available(loop_name):
+    """ Check if an event loop can be used in this environment. """
+    return loop_name == 'asyncio' or importlib.util.find_spec(loop_name) is not None
+
+
+def run_worker(args):
+    """ Run the simulation on one event loop and print its report as JSON. """
+    if args.worker == 'uvloop':
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    logging.disable(logging.INFO)  # Logging every command would dwarf the difference between the loops
+    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
+    report = asyncio.run(simulate(db_connect_url.format(**os.environ), args.guilds, args.rounds,
+                                  args.discord_latency, args.api_latency))
+    report['loop'] = args.worker
+    print(json.dumps(report))
+
+
+def run_loop(loop_name, args):
+    """ Run the simulation on an event loop in a fresh interpreter and return its report. """
+    command = [sys.executable, '-m', 'benchmarks.loops', '--worker', loop_name, '--guilds', str(args.guilds),
+               '--rounds', str(args.rounds), '--discord-latency', str(args.discord_latency),
+               '--api-latency', str(args.api_latency)]
+    result = subprocess.run(command, cwd=ABS_ROOT_DIR, stdout=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode().splitlines()[-1])
+
+
+def print_table(reports):
+    """ Print the throughput and overall latency of each loop's run. """
+    print(f'{"Loop":<10}{"Seconds":>10}{"Commands/s":>12}{"p50 (ms)":>10}{"p95 (ms)":>10}{"p99 (ms)":>10}')
+
+    for report in reports:
+        latency = report['latency']['all']
+        print(f'{report["loop"]:<10}{report["seconds"]:>10.2f}{report["per_second"]:>12.1f}'
+              f'{latency["p50"]:>10.2f}{latency["p95"]:>10.2f}{latency["p99"]:>10.2f}')
+
+    if len(reports) == 2:
+        baseline, other = reports
+        speedup = other['per_second'] / baseline['per_second']
+        print(f'\n{other["loop"]} handled {speedup:.2f}x the commands per second of {baseline["loop"]}')
+
+
+def run_benchmark():
+    """ Compare the bot's queue and team draft throughput on each event loop. """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Benchmark the bot on the asyncio and uvloop event loops')
+    parser.add_argument('-g', '--guilds', type=int, default=50, help='Number of guilds playing at once')
+    parser.add_argument('-r', '--rounds', type=int, default=2, help='Number of matches drafted in each guild')
+    parser.add_argument('--discord-latency', type=float, default=0.0, help='Seconds each Discord REST call takes')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Seconds each API request takes')
+    parser.add_argument('-l', '--loops', nargs='+', choices=LOOPS, default=LOOPS, help='Event loops to compare')
+    parser.add_argument('--json', action='store_true', help='Print the full reports as JSON instead of a table')
+    parser.add_argument('--worker', choices=LOOPS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    reports = []
+
+    for loop_name in args.loops:
+        if not available(loop_name):
+            print(f'Skipping {loop_name}, it isn\'t installed', file=sys.stderr)
+            continue
+
+        reports.append(run_loop(loop_name, args))
+
+    if args.json:
+        print(json.dumps(reports, indent=4))
+    else:
+        print_table(reports)
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,103 @@
+# plans.py
+
+from benchmarks.db import Workload, explain
+from benchmarks.harness import scratch_database
+
+import argparse
+import asyncio
+import asyncpg
+from dotenv import load_dotenv
+import logging
+import os
+import sys
+
+# Operations run on every command or reaction, which must not read a whole table
+HOT_OPERATIONS = [
+    'get_guild',
+    'update_guild',
+    'insert_users',
+    'get_queued_users',
+    'insert_queued_users',
+    'delete_queued_users',
+    'get_banned_users',
+    'insert_banned_users',
+    'get_ratings',
+    'get_player_stats',
+    'get_in_match',
+    'upsert_in_match'
+]
+
+
+async def check_plans(db_url, guilds, users, min_rows):
+    """Seed a scratch schema and find the hot statements that scan a large table sequentially.
+
+    Parameters
+    ----------
+    db_url : str
+        URL of the PostgreSQL database to create the scratch schema in.
+    guilds : int
+        Number of guilds to seed.
+    users : int
+        Number of users to seed.
+    min_rows : int
+        Number of rows from which a table counts as large.
+
+    Returns
+    -------
+    list
+        The operation, statement and large tables of each statement scanning
+        a large table sequentially.
+    """
+    workload = Workload(guilds, users)
+    regressions = []
+
+    async with scratch_database(db_url) as scratch_url:
+        conn = await asyncpg.connect(scratch_url)
+
+        try:
+            await workload.seed(conn)
+            operations = workload.operations()
+            large = set(await conn.fetchval(
+                'SELECT array_agg(relname::TEXT) FROM pg_class\n'
+                '    WHERE relkind = \'r\' AND relnamespace = current_schema()::REGNAMESPACE AND reltuples >= $1;',
+                min_rows
+            ) or [])
+
+            for name in HOT_OPERATIONS:
+                for explained in await explain(conn, operations[name]):
+                    tables = large.intersection(explained['seq_scans'])
+
+                    if tables:
+                        regressions.append((name, explained['statement'], sorted(tables)))
+        finally:
+            await conn.close()
+
+    return regressions
+
+
+def run_check():
+    """ Exit with an error if a hot statement scans a large table sequentially. """
+    load_dotenv()
+    logging.disable(logging.INFO)  # Applying the migrations logs every step
+    parser = argparse.ArgumentParser(description='Check the hot statements of the database helper use indexes')
+    parser.add_argument('-g', '--guilds', type=int, default=20_000, help='Number of guilds to seed')
+    parser.add_argument('-u', '--users', type=int, default=200_000, help='Number of users to seed')
+    parser.add_argument('-r', '--min-rows', type=int, default=10_000,
+                        help='Number of rows from which a sequential scan of a table fails the check')
+    args = parser.parse_args()
+
+    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
+    regressions = asyncio.run(check_plans(db_connect_url.format(**os.environ), args.guilds, args.users,
+                                          args.min_rows))
+
+    for name, statement, tables in regressions:
+        print(f'{name} scans {", ".join(tables)} sequentially:\n    {statement.replace(chr(10), chr(10) + "    ")}')
+
+    if regressions:
+        sys.exit(1)
+
+    print(f'None of the {len(HOT_OPERATIONS)} hot operations scan a table of {args.min_rows:,} rows or more')
+
+
+if __name__ == '__main__':
+    run_check()
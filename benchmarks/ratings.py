@@ -0,0 +1,64 @@
+# ratings.py
+
+from bot.cogs.utils.rating import apply_matches, recompute_ratings
+
+import argparse
+import numpy as np
+import time
+
+
+def synthetic_history(num_matches, num_players, team_size, seed=0):
+    """ Generate random match results between random players. """
+    rng = np.random.default_rng(seed)
+    user_ids = rng.choice(2 ** 62, size=num_players, replace=False) + 10 ** 17  # Snowflake sized IDs
+    results = []
+
+    for _ in range(num_matches):
+        players = user_ids[rng.choice(num_players, size=team_size * 2, replace=False)].tolist()
+        results.append((players[:team_size], players[team_size:], int(rng.integers(0, 3))))
+
+    return results
+
+
+def replay(results, initial=1000.0, k=32.0):
+    """ Replay the matches one by one as a reference for the vectorized recompute. """
+    ratings = {}
+
+    for team_one, team_two, winner in results:
+        user_ids = team_one + team_two
+        current = np.array([ratings.get(user_id, initial) for user_id in user_ids])
+        indexes = np.arange(len(user_ids))
+        apply_matches(current, indexes[None, :len(team_one)], indexes[None, len(team_one):], np.array([winner]), k)
+        ratings.update(zip(user_ids, current.tolist()))
+
+    return ratings
+
+
+def run_benchmark():
+    """ Time a full rating recompute over a synthetic match history. """
+    parser = argparse.ArgumentParser(description='Benchmark the local rating recompute')
+    parser.add_argument('-m', '--matches', type=int, default=1_000_000, help='Number of matches to replay')
+    parser.add_argument('-p', '--players', type=int, default=100_000, help='Number of distinct players')
+    parser.add_argument('-t', '--team-size', type=int, default=5, help='Number of players per team')
+    parser.add_argument('-c', '--check', type=int, default=10_000,
+                        help='Number of matches to check against a one by one replay')
+    args = parser.parse_args()
+
+    results = synthetic_history(args.matches, args.players, args.team_size)
+
+    if args.check:
+        sample = results[:args.check]
+        expected = replay(sample)
+        ratings = recompute_ratings(sample)
+        error = max(abs(ratings[user_id][0] - rating) for user_id, rating in expected.items())
+        print(f'Checked {len(sample)} matches against a one by one replay (max error {error:.2e})')
+
+    start = time.perf_counter()
+    ratings = recompute_ratings(results)
+    elapsed = time.perf_counter() - start
+    print(f'Recomputed {len(ratings)} ratings from {len(results)} matches in {elapsed:.2f}s '
+          f'({len(results) / elapsed:,.0f} matches/s)')
+
+
+if __name__ == '__main__':
+    run_benchmark()
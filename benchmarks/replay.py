@@ -0,0 +1,403 @@
+# replay.py
+
+from benchmarks.harness import BenchBot, FakeApi, db_calls, emoji_file, percentiles, scratch_database, snowflake
+from bot.cogs.utils import DBHelper
+from bot.cogs.utils.recording import custom_emoji_name, mentioned_aliases, read_recording, restore_mentions
+from bot.settings import BotSettings
+
+import argparse
+import asyncio
+import collections
+from dotenv import load_dotenv
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+
+class Replay:
+    """
+    Plays a recording of the messages and reactions a bot received into a
+    BenchBot. The events of each guild are sent in order at their recorded pace
+    scaled by a speed, each after the bot handled the one before like people
+    wait for its reply, so a slower bot makes the replay take longer instead
+    of reordering it. Reactions to a match's menus are sent to the menu of the
+    match the reacting member is in.
+    """
+
+    menu_wait = 5.0  # Seconds to wait for the menu a reaction was recorded on
+
+    def __init__(self, bot, sessions, speed=1.0, timeout=30.0):
+        self.bot = bot
+        self.gateway = bot.gateway
+        self.speed = speed  # Multiple of the recorded pace, as fast as the bot handles the events if 0
+        self.timeout = timeout
+        self.bot_id = int(bot.http.bot_user['id'])
+        self.ids = {}  # Replay ID by session and alias
+        self.streams = collections.defaultdict(list)  # Session, seconds from the start and event by session and guild
+        self.messages = {}  # ID of the menu each recorded message was replayed as by session and alias
+        self.pending = {}  # Futures resolved with the command name once a message is handled by message ID
+        self.latencies = collections.defaultdict(list)  # Seconds by command, or "reaction"
+        self.skipped = collections.Counter()  # Events that couldn't be replayed by reason
+        self.db_calls = collections.Counter()  # Number of database helper calls by method before the replay
+        self._layout(sessions)
+
+    def _id(self, session, alias):
+        """ Get the ID an alias of a session is replayed with. """
+        if alias == 0:
+            return self.bot_id
+
+        return self.ids.setdefault((session, alias), snowflake())
+
+    def _layout(self, sessions):
+        """ Add a guild to the gateway for each guild in the recording, with its channels and members. """
+        guilds = collections.defaultdict(lambda: (set(), set()))  # Channel and member aliases by session and guild
+        offset = 0.0  # Seconds from the start of the replay to the start of the session
+
+        for session, events in enumerate(sessions):
+            for event in events:
+                self.streams[session, event[2]].append((session, offset + event[1], event))
+                channels, members = guilds[session, event[2]]
+                channels.add(event[3])
+                members.add(event[4])
+
+                if event[0] == 'm':
+                    for kind, alias in mentioned_aliases(event[5]):
+                        if kind == '#':
+                            channels.add(alias)
+                        elif kind.startswith('@') and kind != '@&':
+                            members.add(alias)
+
+            offset += events[-1][1] if events else 0.0
+
+        for (session, guild_alias), (channels, members) in guilds.items():
+            guild_id = self.gateway.add_guild([self._id(session, alias) for alias in sorted(channels)],
+                                              [self._id(session, alias) for alias in sorted(members) if alias != 0])
+            self.ids[session, guild_alias] = guild_id
+
+    async def setup(self, team_method=None, map_method=None):
+        """ Add the guilds to the database and set their team and map methods if given. """
+        await self.bot.wait_until_ready()
+
+        async with self.bot.db_pool.acquire() as conn:
+            db_helper = DBHelper(conn)
+            await db_helper.insert_guilds(*self.gateway.guilds)
+
+            if team_method or map_method:
+                methods = {'team_method': team_method, 'map_method': map_method}
+                methods = {column: method for column, method in methods.items() if method}
+
+                for guild_id in self.gateway.guilds:
+                    await db_helper.update_guild(guild_id, **methods)
+
+    async def run(self):
+        """ Replay every guild's events concurrently and return the seconds it took. """
+        self.db_calls = db_calls()
+        self.bot.add_listener(self._command_done, 'on_command_completion')
+        self.bot.add_listener(self._command_failed, 'on_command_error')
+        start = time.perf_counter()
+
+        try:
+            await asyncio.gather(*(self._play_stream(stream) for stream in self.streams.values()))
+            await self._drain()
+        finally:
+            self.bot.remove_listener(self._command_done, 'on_command_completion')
+            self.bot.remove_listener(self._command_failed, 'on_command_error')
+
+        return time.perf_counter() - start
+
+    async def _drain(self):
+        """ Wait for the matches the replay started to finish setting up and the bot's writes to be sent. """
+        match_cog = self.bot.get_cog('MatchCog')
+        outbound = self.bot.outbound
+        deadline = time.perf_counter() + self.timeout
+
+        while match_cog.matches or any(outbound.depths().values()):
+            if time.perf_counter() > deadline:
+                self.skipped['unfinished match'] += len(match_cog.matches)
+                return
+
+            await asyncio.sleep(0.01)
+
+    async def _command_done(self, ctx):
+        future = self.pending.pop(ctx.message.id, None)
+
+        if future is not None and not future.done():
+            future.set_result(ctx.command.qualified_name)
+
+    async def _command_failed(self, ctx, error):
+        future = self.pending.pop(ctx.message.id, None)
+
+        if future is not None and not future.done():
+            future.set_result(ctx.command.qualified_name if ctx.command is not None else 'unknown')
+
+    async def _play_stream(self, stream):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        for session, seconds, event in stream:
+            if self.speed:
+                await asyncio.sleep(max(0.0, start + seconds / self.speed - loop.time()))
+
+            if event[0] == 'm':
+                await self._replay_message(session, event)
+            else:
+                await self._replay_reaction(session, event)
+
+    async def _replay_message(self, session, event):
+        """ Send a recorded message and wait for the bot to handle its command if it has one. """
+        _, _, _, channel_alias, author_alias, command = event
+        channel_id = self._id(session, channel_alias)
+        author_id = self._id(session, author_alias)
+
+        if not command:
+            self.gateway.send_message(channel_id, author_id, '')
+            return
+
+        mentions = mentioned_aliases(command)
+        content = restore_mentions(command, {alias: self._id(session, alias) for _, alias in mentions})
+        mention_ids = [self._id(session, alias) for kind, alias in mentions if kind in ('@', '@!')]
+        message_id = snowflake()
+        future = self.pending[message_id] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self.gateway.send_message(channel_id, author_id, content, mention_ids, message_id)
+
+        try:
+            name = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(message_id, None)
+            self.skipped['unanswered message'] += 1
+        else:
+            self.latencies[name].append(time.perf_counter() - start)
+
+    async def _replay_reaction(self, session, event):
+        """ Add a recorded reaction to the menu it was on and wait for the bot's writes to the channel. """
+        _, _, guild_alias, channel_alias, user_alias, message_alias, emoji = event
+        channel_id = self._id(session, channel_alias)
+        user_id = self._id(session, user_alias)
+        message_id = await self._menu(session, message_alias, self.ids[session, guild_alias], user_id)
+
+        if message_id is None:
+            self.skipped['reaction to a message that isn\'t a menu'] += 1
+            return
+
+        name = custom_emoji_name(emoji)
+
+        if name is not None:
+            emoji = self.bot.emoji_dict.get(name, f'<:{name}:{snowflake()}>')
+
+        start = time.perf_counter()
+        self.gateway.add_reaction(channel_id, message_id, user_id, emoji)
+        await self._settle(channel_id)
+        self.latencies['reaction'].append(time.perf_counter() - start)
+
+    async def _menu(self, session, message_alias, guild_id, user_id):
+        """ Wait for the menu of the match a member is in to listen for reactions and return its message ID. """
+        member = self.bot.get_guild(guild_id).get_member(user_id)
+        match_cog = self.bot.get_cog('MatchCog')
+        replayed_id = self.messages.get((session, message_alias))
+        deadline = time.perf_counter() + self.menu_wait
+
+        while time.perf_counter() < deadline:
+            match = match_cog.player_match(member)
+
+            if match is not None and match.message is not None and self._listening(match):
+                message_id = match.message.id
+
+                # A message recorded before this one stands for the menu so this reaction was to another message
+                if replayed_id is None and message_id in self.messages.values():
+                    return None
+
+                if replayed_id in (None, message_id):
+                    self.messages[session, message_alias] = message_id
+                    return message_id
+
+            await asyncio.sleep(0.001)
+
+        return None
+
+    def _listening(self, match):
+        """ Check if the ready check or a menu of a match is waiting for reactions. """
+        return any(match in (cell.cell_contents for cell in check.__closure__ or ())
+                   for _, check in self.bot._listeners.get('reaction_add', [])) or \
+            any(getattr(getattr(listener, '__self__', None), 'id', None) == match.message.id
+                for listener in self.bot.extra_events.get('on_reaction_add', []))
+
+    async def _settle(self, channel_id):
+        """ Wait for the writes to a channel the bot queued while handling an event to be sent. """
+        outbound = self.bot.outbound
+        deadline = time.perf_counter() + self.timeout
+        await asyncio.sleep(0)  # Let the listeners run up to their first write
+
+        while outbound.channel_depths().get(channel_id) or any(bucket[0] == channel_id for bucket in outbound.busy):
+            if time.perf_counter() > deadline:
+                self.skipped['unsettled reaction'] += 1
+                return
+
+            await asyncio.sleep(0.001)
+
+    def report(self, elapsed):
+        """ Summarise the latency of each command and reactions and the calls to each backend of the replay. """
+        events = sum(len(stream) for stream in self.streams.values())
+        report = {'seconds': elapsed, 'events': events, 'per_second': events / elapsed}
+        report['latency'] = {name: percentiles(latencies) for name, latencies in self.latencies.items()}
+
+        if self.latencies:
+            report['latency']['all'] = percentiles([x for latencies in self.latencies.values() for x in latencies])
+
+        report['skipped'] = dict(self.skipped)
+        report['discord_calls'] = dict(self.bot.http.calls)
+        report['db_calls'] = dict(db_calls() - self.db_calls)
+        return report
+
+
+async def replay(db_url, sessions, speed=1.0, discord_latency=0.0, api_latency=0.0, timeout=30.0, team_method=None,
+                 map_method=None):
+    """Replay a recording against the fake Discord and API and a scratch schema of the database.
+
+    Parameters
+    ----------
+    db_url : str
+        URL of the PostgreSQL database to create the scratch schema in.
+    sessions : list
+        Events of each session of the recording.
+    speed : float
+        Multiple of the recorded pace to replay at, as fast as possible if 0.
+    discord_latency : float
+        Seconds each Discord REST call takes.
+    api_latency : float
+        Seconds each API request takes.
+    timeout : float
+        Seconds to wait for the bot to handle each event.
+    team_method : str
+        Team method to set in every guild, the default if None.
+    map_method : str
+        Map method to set in every guild, the default if None.
+
+    Returns
+    -------
+    dict
+        The replay's report.
+    """
+    api = FakeApi(api_latency)
+    await api.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            async with scratch_database(db_url) as scratch_url:
+                guilds = len({(session, event[2]) for session, events in enumerate(sessions) for event in events})
+                bot = BenchBot('token', api.url, 'key', scratch_url, emoji_file(directory), guilds=0,
+                               discord_latency=discord_latency,
+                               settings=BotSettings(message_cache_size=max(1000, 50 * guilds)))
+                replayer = Replay(bot, sessions, speed, timeout)
+                bot_task = asyncio.get_running_loop().create_task(bot.start('token'))
+
+                try:
+                    await replayer.setup(team_method, map_method)
+                    elapsed = await replayer.run()
+                finally:
+                    await bot.close()
+                    await bot_task
+
+                report = replayer.report(elapsed)
+                report['api_calls'] = dict(api.calls)
+                return report
+    finally:
+        await api.close()
+
+
+def compare(baseline, report, threshold=0.2, min_count=5):
+    """ List the commands that got slower and the calls that were made more often than in a baseline replay. """
+    regressions = []
+
+    for name, latency in report['latency'].items():
+        base = baseline['latency'].get(name)
+
+        if base is None or min(base['count'], latency['count']) < min_count:
+            continue
+
+        for stat in ('p50', 'p95'):
+            # Differences under a millisecond are noise however big they are relatively
+            if latency[stat] > base[stat] * (1 + threshold) and latency[stat] - base[stat] > 1:
+                regressions.append(f'{name} {stat} latency went from {base[stat]:.2f}ms to {latency[stat]:.2f}ms')
+
+    for backend, label in (('discord_calls', 'Discord'), ('api_calls', 'API'), ('db_calls', 'Database')):
+        for call, count in report[backend].items():
+            base = baseline.get(backend, {}).get(call, 0)
+
+            if count > base * (1 + threshold) and count - base >= min_count:
+                regressions.append(f'{label} calls to {call} went from {base} to {count}')
+
+    return regressions
+
+
+def print_report(report):
+    """ Print the latency of each command and the calls the replay made to Discord, the API and the DB. """
+    print(f'Replayed {report["events"]} events in {report["seconds"]:.2f}s ({report["per_second"]:.1f}/s)')
+    print(f'    {"Command":<16}{"Count":>8}{"p50 (ms)":>10}{"p95 (ms)":>10}{"p99 (ms)":>10}{"max (ms)":>10}')
+
+    for name, latency in report['latency'].items():
+        print(f'    {name:<16}{latency["count"]:>8}{latency["p50"]:>10.2f}{latency["p95"]:>10.2f}'
+              f'{latency["p99"]:>10.2f}{latency["max"]:>10.2f}')
+
+    for backend, label in (('discord', 'Discord'), ('api', 'API'), ('db', 'Database')):
+        calls = sorted(report[f'{backend}_calls'].items(), key=lambda item: item[1], reverse=True)
+        print(f'    {label} calls ({sum(count for _, count in calls)}): '
+              + ', '.join(f'{call} {count}' for call, count in calls))
+
+    if report['skipped']:
+        print('    Skipped: ' + ', '.join(f'{count} {reason}' for reason, count in report['skipped'].items()))
+
+
+def run_replay():
+    """ Replay a recording and compare it with a previous run. """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Replay recorded messages and reactions against the bot without '
+                                                 'Discord and flag regressions from a previous replay')
+    parser.add_argument('recording', help='File written by the bot with RECORD_FILE set')
+    parser.add_argument('-s', '--speed', type=float, default=1.0,
+                        help='Multiple of the recorded pace to replay at, 0 to replay as fast as possible')
+    parser.add_argument('--team-method', choices=['captains', 'autobalance', 'random'],
+                        help='Team method to set in every guild')
+    parser.add_argument('--map-method', choices=['captains', 'vote', 'random'], help='Map method to set in every guild')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for the bot to handle each event')
+    parser.add_argument('--discord-latency', type=float, default=0.0, help='Seconds each Discord REST call takes')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Seconds each API request takes')
+    parser.add_argument('-o', '--output', metavar='file', help='Write the report to a JSON file to compare with later')
+    parser.add_argument('-b', '--baseline', metavar='file', help='Report of a previous replay to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fraction latencies and call counts can grow by before they count as regressions')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON instead of a table')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # Logging every event would slow the bot down more than the replay does
+    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
+    report = asyncio.run(replay(db_connect_url.format(**os.environ), read_recording(args.recording), args.speed,
+                                args.discord_latency, args.api_latency, args.timeout, args.team_method,
+                                args.map_method))
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+
+        if regressions:
+            print('\nRegressions from the baseline:\n' + '\n'.join(f'    {line}' for line in regressions),
+                  file=sys.stderr)
+            sys.exit(1)
+
+        print('\nNo regressions from the baseline')
+
+
+if __name__ == '__main__':
+    run_replay()
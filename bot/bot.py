@@ -3,39 +3,69 @@
 import discord
 from discord.ext import commands
 
+import asyncio
+import asyncpg
+import collections
 import logging
 import os.path
 import sys
 import json
+import time
 
 from aiohttp import ClientSession
 
 from . import cogs
+from .cluster import HealthReporter
 from .resources import Sessions, Config
+from .settings import BotSettings
 
 _CWD = os.path.dirname(os.path.abspath(__file__))
 INTENTS_JSON = os.path.join(_CWD, 'intents.json')
+MIGRATIONS_DIR = os.path.join(_CWD, os.pardir, 'migrations')
 
 
 class LeagueBot(commands.AutoShardedBot):
     """ Sub-classed AutoShardedBot modified to fit the needs of the application. """
 
-    def __init__(self, discord_token, api_base_url, api_key, db_pool, emoji_dict, donate_url=None):
+    def __init__(self, discord_token, api_base_url, api_key, db_url, emoji_file, donate_url=None, settings=None,
+                 shard_ids=None, shard_count=None, cluster_id=None, health_queue=None):
         """ Set attributes and configure bot. """
+        settings = settings or BotSettings()
+
         # Call parent init
         with open(INTENTS_JSON) as f:
             intents_attrs = json.load(f)
 
         intents = discord.Intents(**intents_attrs)
-        super().__init__(command_prefix=('q!', 'Q!'), case_insensitive=True, intents=intents)
+        # Reactions are only dispatched for cached messages so the cache has to outlast the match menus
+        super().__init__(command_prefix=('q!', 'Q!'), case_insensitive=True, intents=intents, shard_ids=shard_ids,
+                         shard_count=shard_count, max_messages=settings.message_cache_size)
 
         # Set argument attributes
         self.discord_token = discord_token
         self.api_base_url = api_base_url
         self.api_key = api_key
-        self.db_pool = db_pool
-        self.emoji_dict = emoji_dict
+        self.db_url = db_url
+        self.emoji_file = emoji_file
+        self.settings = settings
+        self.db_pool = None  # Created with the emojis when the bot starts
+        # Reads that may be served by the replica go through this, writes always use the primary pool
+        self.db_reads = cogs.utils.ReplicaRouter(self, settings.db_replica_url, max_lag=settings.db_replica_max_lag)
+        self.emoji_dict = {}
         self.donate_url = donate_url
+        self.typing_metrics = collections.Counter()  # Number of commands that deferred and fired the typing indicator
+        self.server_pool = None if settings.server_registry is None else \
+            cogs.utils.ServerPool(self, settings.server_registry, spares=settings.server_spares)
+        self.ratings = cogs.utils.RatingEngine(self)
+        self.history = cogs.utils.MatchHistory(self)
+        self.in_match = cogs.utils.InMatchRegistry(self)
+        self.outbound = cogs.utils.OutboundScheduler(self)
+        self.lag_monitor = cogs.utils.LoopLagMonitor(self)
+        cogs.utils.TRACER.configure(settings.trace_file, settings.trace_sample_rate, self.loop)
+        self.cluster_id = cluster_id  # Index of the worker process when running as a cluster
+        self.health_reporter = None if health_queue is None else HealthReporter(self, health_queue, cluster_id)
+        self.startup_timings = {}  # Seconds each startup phase took by phase
+        self.started_at = None
 
         # Set constants
         self.description = 'An easy to use, fully automated system to set up and play CS:GO pickup games'
@@ -55,20 +85,146 @@ class LeagueBot(commands.AutoShardedBot):
         # Add check to not respond to DM'd commands
         self.add_check(lambda ctx: ctx.guild is not None)
 
-        # Trigger typing before every command
-        self.before_invoke(commands.Context.trigger_typing)
+        # Trigger typing for commands that are slow to reply
+        self.before_invoke(self.defer_typing)
+        self.after_invoke(self.cancel_typing)
+
+    async def _timed(self, phase, coro):
+        """ Await a startup phase and record how long it took. """
+        start = time.perf_counter()
+        result = await coro
+        self.startup_timings[phase] = time.perf_counter() - start
+        return result
+
+    async def _create_pool(self):
+        self.db_pool = cogs.utils.MeteredPool(await asyncpg.create_pool(self.db_url))
+        await self.db_reads.start()
+
+    async def _load_emojis(self):
+        def load():
+            with open(self.emoji_file) as f:
+                return json.load(f)
+
+        self.emoji_dict = await self.loop.run_in_executor(None, load)
+
+    async def _check_schema(self):
+        """ Refuse to start with a database that's missing migrations the code relies on. """
+        conn = await asyncpg.connect(self.db_url)
+
+        try:
+            applied = await cogs.utils.DBHelper(conn).get_applied_migrations()
+        except asyncpg.UndefinedTableError:
+            applied = []
+        finally:
+            await conn.close()
 
-        # Add cogs
+        migrations = {file[:-3] for file in os.listdir(MIGRATIONS_DIR) if file.endswith('.py')}
+        missing = sorted(migrations.difference(applied))
+
+        if missing:
+            raise RuntimeError(f'Database is missing migrations {", ".join(missing)}, run "python3 migrate.py up"')
+
+    async def _setup_cogs(self):
+        """ Add the cogs. """
         self.add_cog(cogs.LoggingCog(self))
         self.add_cog(cogs.HelpCog(self))
         self.add_cog(cogs.AuthCog(self))
         self.add_cog(cogs.QueueCog(self))
         self.add_cog(cogs.MatchCog(self))
         self.add_cog(cogs.StatsCog(self))
+        self.add_cog(cogs.AdminCog(self))
 
         if self.donate_url:
             self.add_cog(cogs.DonateCog(self))
 
+        # Only one worker of a cluster can listen on the events port
+        if self.settings.events_port and not self.cluster_id:
+            self.add_cog(cogs.EventsCog(self))
+
+        if self.settings.metrics_port:
+            self.add_cog(cogs.MetricsCog(self))
+
+        if self.settings.record_file:
+            self.add_cog(cogs.RecorderCog(self))
+
+    async def _load_state(self):
+        """ Load the players in a match and the server pool from the database. """
+        awaitables = [self._timed('in match', self.in_match.start())]
+
+        if self.server_pool is not None and not self.settings.defer_startup:
+            awaitables.append(self._timed('server pool', self.server_pool.start()))
+
+        await asyncio.gather(*awaitables)
+
+    async def _deferred_startup(self):
+        """ Do the startup work that was deferred until the bot was ready. """
+        try:
+            await self._timed('guilds', self.sync_guilds())
+
+            if self.server_pool is not None:
+                await self._timed('server pool', self.server_pool.start())
+        except Exception as e:
+            self.logger.error(f'Deferred startup failed: {e}')
+        else:
+            self.log_startup_timings('Deferred startup finished')
+
+    def log_startup_timings(self, title):
+        """ Log how long each startup phase took. """
+        timings = '\n'.join(f'    {phase:<12} {seconds:>8.3f}s' for phase, seconds in self.startup_timings.items())
+        self.logger.info(f'{title}:\n{timings}')
+
+    async def start(self, token, *, bot=True, reconnect=True):
+        """ Override parent start to set the bot up concurrently and time each phase before connecting. """
+        self.started_at = time.perf_counter()
+        cogs.utils.instrument_http(self.http)
+        cogs.utils.trace_http(self.http)
+        await asyncio.gather(
+            self._timed('database', self._create_pool()),
+            self._timed('emojis', self._load_emojis()),
+            self._timed('schema', self._check_schema()),
+            self._timed('login', self.login(token, bot=bot)),
+            self._timed('cogs', self._setup_cogs())
+        )
+        await self._timed('state', self._load_state())
+        self.startup_timings['setup'] = time.perf_counter() - self.started_at
+
+        if self.settings.lag_threshold is not None:
+            self.lag_monitor.start(self.settings.lag_threshold)
+
+        await self.connect(reconnect=reconnect)
+
+    async def sync_guilds(self):
+        """ Synchronize the guilds the bot is in with the guilds table. """
+        async with self.db_pool.acquire() as conn:
+            db = cogs.utils.DBHelper(conn)
+            inserted, _ = await db.sync_guilds(*(guild.id for guild in self.guilds), shard_ids=self.shard_ids,
+                                               shard_count=self.shard_count)
+
+        self.db_reads.wrote(*inserted)
+
+    async def defer_typing(self, ctx):
+        """ Start typing only if the command takes longer than the typing delay to reply. """
+        self.typing_metrics['deferred'] += 1
+        ctx.defer_typing(self.settings.typing_delay)
+
+    async def cancel_typing(self, ctx):
+        """ Stop the deferred typing indicator of a command that finished without sending anything. """
+        ctx.cancel_typing()
+
+    async def invoke(self, ctx):
+        """ Override parent method to trace a sample of the commands. """
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+
+        guild_id = ctx.guild.id if ctx.guild is not None else None
+
+        with cogs.utils.TRACER.trace(ctx.command.qualified_name, guild=guild_id) as span:
+            await super().invoke(ctx)
+
+            if span is not None:
+                span.attributes['failed'] = ctx.command_failed
+
     async def get_context(self, message, *, cls=None):
         """ Override parent method to use LeagueContext """
         return await super().get_context(message, cls=cls or cogs.utils.LeagueContext)
@@ -97,20 +253,32 @@ class LeagueBot(commands.AutoShardedBot):
 
     @commands.Cog.listener()
     async def on_connect(self):
+        if self.health_reporter is not None:
+            self.health_reporter.start()
+
         Sessions.requests = ClientSession(
             loop=self.loop,
             headers={"authentication": self.api_key},
             json_serialize=lambda x: json.dumps(x, ensure_ascii=False),
             raise_for_status=True,
-            trace_configs=[cogs.TRACE_CONFIG]
+            trace_configs=[cogs.TRACE_CONFIG, cogs.utils.API_TRACE_CONFIG]
         )
 
     @commands.Cog.listener()
     async def on_ready(self):
-        """ Synchronize the guilds the bot is in with the guilds table. """
-        async with self.db_pool.acquire() as conn:
-            db = cogs.utils.DBHelper(conn)
-            await db.sync_guilds(*(guild.id for guild in self.guilds))
+        """ Synchronize the guilds the bot is in with the guilds table, logging the startup timings the first time. """
+        if 'ready' in self.startup_timings:
+            await self.sync_guilds()
+            return
+
+        self.startup_timings['ready'] = time.perf_counter() - self.started_at
+
+        if self.settings.defer_startup:
+            self.log_startup_timings('Bot ready')
+            self.loop.create_task(self._deferred_startup())
+        else:
+            await self._timed('guilds', self.sync_guilds())
+            self.log_startup_timings('Bot ready')
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
@@ -119,6 +287,8 @@ class LeagueBot(commands.AutoShardedBot):
             db = cogs.utils.DBHelper(conn)
             await db.insert_guilds(guild.id)
 
+        self.db_reads.wrote(guild.id)
+
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         """ Delete the recently removed guild from the guilds table. """
@@ -133,7 +303,45 @@ class LeagueBot(commands.AutoShardedBot):
     async def close(self):
         """ Override parent close to close the API session and DB connection pool. """
         await super().close()
-        await self.db_pool.close()
+        match_cog = self.get_cog('MatchCog')
+
+        if match_cog is not None:
+            await match_cog.checkpointer.close()
+
+        events_cog = self.get_cog('EventsCog')
+
+        if events_cog is not None:
+            await events_cog.close()
+
+        metrics_cog = self.get_cog('MetricsCog')
+
+        if metrics_cog is not None:
+            await metrics_cog.close()
+
+        queue_cog = self.get_cog('QueueCog')
+
+        if queue_cog is not None:
+            queue_cog.close()
+
+        recorder_cog = self.get_cog('RecorderCog')
+
+        if recorder_cog is not None:
+            await recorder_cog.close()
+
+        if self.server_pool is not None:
+            await self.server_pool.close()
+
+        await self.in_match.close()
+        await self.outbound.close()
+        self.lag_monitor.stop()
+
+        if self.health_reporter is not None:
+            await self.health_reporter.close()
+
+        await self.db_reads.close()
+
+        if self.db_pool is not None:
+            await self.db_pool.close()
 
         if hasattr(Sessions, 'requests'):
             self.logger.info('Closing API helper client session')
@@ -0,0 +1,271 @@
+# cluster.py
+
+import asyncio
+import collections
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+LOGGER = logging.getLogger('csgoleague.cluster')
+
+
+def split_shards(shard_count, clusters):
+    """ Split the shard IDs into contiguous ranges, one for each cluster. """
+    size, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+
+    for cluster_id in range(clusters):
+        end = start + size + (cluster_id < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+
+    return ranges
+
+
+class HealthReporter:
+    """
+    Periodically sends a worker's health and metrics to the supervisor of
+    the cluster it was spawned in.
+    """
+
+    def __init__(self, bot, health_queue, cluster_id: int, interval: float = 10):
+        """ Set attributes. """
+        self.bot = bot
+        self.health_queue = health_queue
+        self.cluster_id = cluster_id
+        self.interval = interval
+        self.task = None
+
+    def start(self) -> None:
+        """ Start reporting in the background. """
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self._report_loop())
+
+    async def close(self) -> None:
+        """ Stop reporting. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def report(self) -> dict:
+        """ Get the worker's current health and metrics. """
+        match_cog = self.bot.get_cog('MatchCog')
+        counters = {f'typing_{key}': value for key, value in self.bot.typing_metrics.items()}
+        counters.update({f'outbound_{key}': value for key, value in self.bot.outbound.metrics.items()})
+
+        return {
+            'cluster_id': self.cluster_id,
+            'pid': os.getpid(),
+            'time': time.time(),
+            'ready': self.bot.is_ready(),
+            'latencies': {shard_id: None if math.isnan(latency) else latency
+                          for shard_id, latency in self.bot.latencies},
+            'guilds': len(self.bot.guilds),
+            'active_matches': 0 if match_cog is None else len(match_cog.matches),
+            'in_match': len(self.bot.in_match),
+            'outbound': self.bot.outbound.depths(),
+            'counters': counters
+        }
+
+    async def _report_loop(self):
+        while True:
+            try:
+                self.health_queue.put_nowait(self.report())
+            except Exception as e:
+                LOGGER.error(f'Unable to report the health of cluster {self.cluster_id}: {e}')
+
+            await asyncio.sleep(self.interval)
+
+
+class _Worker:
+    """ State of one of the supervised worker processes. """
+
+    def __init__(self, cluster_id, shard_ids):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.started_at = None
+        self.restart_at = 0  # Monotonic time the worker can be restarted at
+        self.failures = 0  # Consecutive exits without staying up for long
+        self.health = None  # Last report received from the worker
+
+
+class ClusterSupervisor:
+    """
+    Runs the bot as a cluster of worker processes that each hold a range of
+    the shards, restarting workers that exit or stop reporting their health
+    with exponential backoff and aggregating the health reports they send.
+    """
+
+    def __init__(self, target, shard_count: int, clusters: int, *, base_backoff: float = 5, max_backoff: float = 300,
+                 stable_after: float = 600, hung_after: float = 300, report_interval: float = 60,
+                 health_file: str = None):
+        """ Set attributes. """
+        self.target = target  # Function run in each worker with shard_ids, shard_count, cluster_id and health_queue
+        self.shard_count = shard_count
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after  # Seconds a worker has to stay up for its backoff to reset
+        self.hung_after = hung_after  # Seconds without a health report before a worker is restarted
+        self.report_interval = report_interval
+        self.health_file = health_file  # Path the aggregated health is written to every report if set
+        self.context = multiprocessing.get_context('spawn')
+        self.health_queue = self.context.Queue()
+        self.workers = [_Worker(cluster_id, shard_ids)
+                        for cluster_id, shard_ids in enumerate(split_shards(shard_count, min(clusters, shard_count)))]
+        self.stopping = False
+
+    def run(self) -> None:
+        """ Supervise the workers until the launcher is interrupted or terminated. """
+        signal.signal(signal.SIGTERM, self._stop)
+        next_report = time.monotonic() + self.report_interval
+
+        try:
+            while not self.stopping:
+                self._receive_health(timeout=1)
+                now = time.monotonic()
+
+                for worker in self.workers:
+                    self._supervise(worker, now)
+
+                if now >= next_report:
+                    self._report()
+                    next_report = now + self.report_interval
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._terminate()
+
+    def health(self) -> dict:
+        """Get the health and metrics aggregated across the workers.
+
+        Returns
+        -------
+        dict
+            Number of workers up and ready, totals of the workers' gauges and
+            counters, the slowest shard latency and the workers that haven't
+            reported for longer than two report intervals.
+        """
+        now = time.time()
+        reports = [worker.health for worker in self.workers if worker.health is not None]
+        latencies = [latency for report in reports for latency in report['latencies'].values() if latency is not None]
+        outbound = collections.Counter()
+        counters = collections.Counter()
+
+        for report in reports:
+            outbound.update(report['outbound'])
+            counters.update(report['counters'])
+
+        return {
+            'workers': len(self.workers),
+            'alive': sum(worker.process is not None and worker.process.is_alive() for worker in self.workers),
+            'ready': sum(report['ready'] for report in reports),
+            'shards': self.shard_count,
+            'guilds': sum(report['guilds'] for report in reports),
+            'active_matches': sum(report['active_matches'] for report in reports),
+            'in_match': max((report['in_match'] for report in reports), default=0),  # Every worker loads all of them
+            'max_latency': max(latencies, default=None),
+            'outbound': dict(outbound),
+            'counters': dict(counters),
+            'restarts': {worker.cluster_id: worker.failures for worker in self.workers if worker.failures},
+            'stale': [worker.cluster_id for worker in self.workers
+                      if worker.health is None or now - worker.health['time'] > 2 * self.report_interval]
+        }
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _spawn(self, worker):
+        """ Start a worker process for a cluster's shards. """
+        kwargs = {'shard_ids': worker.shard_ids, 'shard_count': self.shard_count, 'cluster_id': worker.cluster_id,
+                  'health_queue': self.health_queue}
+        worker.process = self.context.Process(target=self.target, kwargs=kwargs, name=f'cluster-{worker.cluster_id}')
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.health = None
+        LOGGER.info(f'Started cluster {worker.cluster_id} (pid {worker.process.pid}) with shards '
+                    f'{worker.shard_ids[0]}-{worker.shard_ids[-1]} of {self.shard_count}')
+
+    def _supervise(self, worker, now):
+        """ Start a worker that's due to start and schedule the restart of one that exited. """
+        if worker.process is None:
+            if now >= worker.restart_at:
+                self._spawn(worker)
+
+            return
+
+        last_seen = worker.started_at if worker.health is None else worker.health['received']
+
+        if worker.process.is_alive():
+            if now - last_seen > self.hung_after:
+                LOGGER.error(f'Cluster {worker.cluster_id} hasn\'t reported for {self.hung_after}s, restarting it')
+                worker.process.terminate()
+                worker.process.join(10)
+
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+            else:
+                return
+
+        # Back off workers that keep exiting soon after starting
+        if now - worker.started_at >= self.stable_after:
+            worker.failures = 0
+
+        worker.failures += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (worker.failures - 1))
+        worker.restart_at = now + backoff
+        LOGGER.error(f'Cluster {worker.cluster_id} exited with code {worker.process.exitcode}, '
+                     f'restarting in {backoff:.0f}s')
+        worker.process.close()
+        worker.process = None
+        worker.health = None
+
+    def _receive_health(self, timeout):
+        """ Store the health reports the workers sent, waiting up to a timeout for the first one. """
+        try:
+            while True:
+                report = self.health_queue.get(timeout=timeout)
+                report['received'] = time.monotonic()
+                self.workers[report['cluster_id']].health = report
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    def _report(self):
+        """ Log the aggregated health and write it to the health file. """
+        health = self.health()
+        LOGGER.info(f'{health["ready"]}/{health["workers"]} clusters ready, {health["guilds"]} guilds, '
+                    f'{health["active_matches"]} active matches, max latency {health["max_latency"]}')
+
+        if health['stale']:
+            LOGGER.warning(f'No recent health report from clusters {health["stale"]}')
+
+        if self.health_file is not None:
+            temp_file = f'{self.health_file}.tmp'
+
+            with open(temp_file, 'w') as f:
+                json.dump(health, f)
+
+            os.replace(temp_file, self.health_file)
+
+    def _terminate(self):
+        """ Stop every worker. """
+        LOGGER.info('Stopping the cluster')
+
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(30)
+
+                if worker.process.is_alive():
+                    worker.process.kill()
@@ -1,20 +1,29 @@
 # __init__.py
 
+from .admin import AdminCog
 from .auth import AuthCog
-from .logger import LoggingCog, TRACE_CONFIG
+from .logger import LoggingCog, LogPipeline, TRACE_CONFIG
 from .donate import DonateCog
+from .events import EventsCog
 from .help import HelpCog
 from .queue import QueueCog
 from .stats import StatsCog
 from .match import MatchCog
+from .metrics import MetricsCog
+from .recorder import RecorderCog
 
 __all__ = [
+    AdminCog,
     AuthCog,
     LoggingCog,
+    LogPipeline,
     TRACE_CONFIG,
     DonateCog,
+    EventsCog,
     HelpCog,
     QueueCog,
     StatsCog,
-    MatchCog
+    MatchCog,
+    MetricsCog,
+    RecorderCog
 ]
@@ -0,0 +1,164 @@
+# admin.py
+
+import asyncio
+from discord.ext import commands
+import os
+import threading
+
+from .utils import AllocationTracer, SamplingProfiler
+
+
+def _truncate(text, length=72):
+    return text if len(text) <= length else '...' + text[-(length - 3):]
+
+
+class AdminCog(commands.Cog):
+    """ Cog for the bot owner's diagnostics commands. """
+
+    max_seconds = 300  # Longest a profile can run for
+
+    def __init__(self, bot):
+        """ Set attributes. """
+        self.bot = bot
+        self.profiling = False
+        self.tracing = False
+
+    def _parse_seconds(self, args, default=10):
+        """ Get the number of seconds to profile for from a command's arguments or None if it isn't valid. """
+        if not args:
+            return default
+
+        try:
+            seconds = float(args[0])
+        except ValueError:
+            return None
+
+        return seconds if 1 <= seconds <= self.max_seconds else None
+
+    @commands.command(usage='lag [on|off] [<threshold ms>]',
+                      brief='Toggle or view the event loop lag monitor (need owner perms)')
+    @commands.is_owner()
+    async def lag(self, ctx, *args):
+        """ Start or stop the event loop lag monitor and show what it measured. """
+        monitor = self.bot.lag_monitor
+        state = args[0].lower() if args else None
+
+        if state not in (None, 'on', 'off'):
+            embed = self.bot.embed_template(title=f'{args[0]} is not "on" or "off"')
+            await ctx.send(embed=embed)
+            return
+
+        if state == 'on':
+            try:
+                threshold = float(args[1]) / 1000 if len(args) > 1 else None
+            except ValueError:
+                embed = self.bot.embed_template(title=f'{args[1]} is not a number of milliseconds')
+                await ctx.send(embed=embed)
+                return
+
+            monitor.start(threshold)
+        elif state == 'off':
+            monitor.stop()
+
+        title = f'Lag monitor is {"on" if monitor.running else "off"} ' \
+                f'(stall threshold {monitor.threshold * 1000:.0f}ms)'
+        percentiles = monitor.percentiles()
+
+        if percentiles is None:
+            description = 'No lag measured yet'
+        else:
+            description = f'Recent lag: p50 {percentiles["p50"] * 1000:.1f}ms, ' \
+                          f'p99 {percentiles["p99"] * 1000:.1f}ms, max {percentiles["max"] * 1000:.1f}ms'
+
+        embed = self.bot.embed_template(title=title, description=description)
+
+        for stall in monitor.recent_stalls():
+            location = stall['stack'][-1].strip().split('\n')[0] if stall['stack'] else 'unknown'
+            value = f'Cog `{stall["cog"]}`, command `{stall["command"]}`\n`{location}`'
+            embed.add_field(name=f'Blocked for {stall["seconds"] * 1000:.0f}ms', value=value, inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(usage='profile [<seconds>]',
+                      brief='Sample where the bot spends its CPU time for a while (need owner perms)')
+    @commands.is_owner()
+    async def profile(self, ctx, *args):
+        """ Take a sampling profile of the event loop and post the functions it spent the most time in. """
+        seconds = self._parse_seconds(args)
+
+        if seconds is None:
+            embed = self.bot.embed_template(title=f'Seconds must be a number from 1 to {self.max_seconds}')
+            await ctx.send(embed=embed)
+            return
+
+        if self.profiling:
+            embed = self.bot.embed_template(title='A profile is already being taken')
+            await ctx.send(embed=embed)
+            return
+
+        self.profiling = True
+
+        try:
+            profiler = SamplingProfiler(threading.get_ident())
+            await self.bot.loop.run_in_executor(None, profiler.run, seconds)
+            path = await self.bot.loop.run_in_executor(None, profiler.write, self.bot.settings.profile_dir)
+        finally:
+            self.profiling = False
+
+        own, cumulative = profiler.top_functions(8)
+        busy = profiler.samples - profiler.idle
+        title = f'Profiled the event loop for {seconds:g}s, busy in {busy} of {profiler.samples} samples'
+        embed = self.bot.embed_template(title=title)
+
+        for name, functions in (('Own time', own), ('Including calls', cumulative)):
+            lines = [f'{count / max(busy, 1):>6.1%} {_truncate(label)}' for label, count in functions]
+            embed.add_field(name=name, value='```' + ('\n'.join(lines) or 'No busy samples') + '```', inline=False)
+
+        embed.set_footer(text=f'Stacks written to {os.path.abspath(path)}')
+        await ctx.send(embed=embed)
+
+    @commands.command(usage='memory [<seconds>]',
+                      brief='Trace what allocates memory for a while (need owner perms)')
+    @commands.is_owner()
+    async def memory(self, ctx, *args):
+        """ Diff tracemalloc snapshots from before and after a period and post the top allocation sites. """
+        seconds = self._parse_seconds(args)
+
+        if seconds is None:
+            embed = self.bot.embed_template(title=f'Seconds must be a number from 1 to {self.max_seconds}')
+            await ctx.send(embed=embed)
+            return
+
+        if self.tracing:
+            embed = self.bot.embed_template(title='Memory is already being traced')
+            await ctx.send(embed=embed)
+            return
+
+        self.tracing = True
+        tracer = AllocationTracer()
+
+        try:
+            await self.bot.loop.run_in_executor(None, tracer.start)
+
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                await self.bot.loop.run_in_executor(None, tracer.stop)
+
+            top = await self.bot.loop.run_in_executor(None, tracer.top_allocations, 8)
+            path = await self.bot.loop.run_in_executor(None, tracer.write, self.bot.settings.profile_dir)
+        finally:
+            self.tracing = False
+
+        lines = []
+
+        for stat in top:
+            frame = stat.traceback[0]
+            location = _truncate(f'{frame.filename}:{frame.lineno}', 52)
+            lines.append(f'{stat.size_diff / 1024:>+9.1f} KiB {stat.count_diff:>+7} {location}')
+
+        title = f'Memory allocated over {seconds:g}s and still held'
+        description = '```' + ('\n'.join(lines) or 'Nothing was allocated') + '```'
+        embed = self.bot.embed_template(title=title, description=description)
+        embed.set_footer(text=f'Snapshots and diff written to {os.path.abspath(path)}')
+        await ctx.send(embed=embed)
@@ -0,0 +1,181 @@
+# events.py
+
+from aiohttp import web
+import asyncio
+from discord.ext import commands
+import hmac
+import json
+import logging
+
+from .utils import MatchResult
+
+
+class EventsCog(commands.Cog):
+    """ Cog running the endpoint game servers push match start, end and result events to. """
+
+    flush_interval = 1.0  # Seconds between writing batches of results to the match history
+    max_attempts = 5  # Times a result is retried before it's dropped
+
+    def __init__(self, bot):
+        """ Set attributes. """
+        self.bot = bot
+        self.results = []  # Results waiting to be written by the next flush
+        self.attempts = {}  # Failed writes of results still being retried by match ID
+        self.runner = None
+        self.flush_task = None
+        self.logger = logging.getLogger('csgoleague.events')
+
+        self.app = web.Application()
+        self.app.router.add_post('/events', self.post_events)
+        self.handlers = {  # Parser checking an event and handler applying its parsed arguments by event type
+            'match_start': (self._parse_match_start, self.match_start),
+            'match_end': (self._parse_match_end, self.match_end),
+            'match_result': (self._parse_match_result, self.match_result)
+        }
+
+    def cog_unload(self):
+        """ Stop serving events and write the results that are still pending. """
+        self.bot.loop.create_task(self.close())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """ Start serving events the first time the bot is ready. """
+        if self.runner is not None:
+            return
+
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        settings = self.bot.settings
+        site = web.TCPSite(self.runner, settings.events_host, settings.events_port)
+        await site.start()
+        self.flush_task = self.bot.loop.create_task(self._flush_loop())
+        self.logger.info(f'Listening for match events on {settings.events_host}:{settings.events_port}')
+
+    async def close(self):
+        """ Stop the endpoint and flush the pending results. """
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+        await self.flush()
+
+    async def post_events(self, request):
+        """ Handle a POST of one event or a list of events. """
+        key = request.headers.get('authentication', '')
+
+        if not hmac.compare_digest(key.encode(), self.bot.settings.events_key.encode()):
+            return web.json_response({'error': 'Invalid authentication'}, status=401)
+
+        try:
+            events = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({'error': 'Body must be JSON'}, status=400)
+
+        if not isinstance(events, list):
+            events = [events]
+
+        # Parse every event before applying any so an invalid event rejects the whole batch
+        try:
+            parsed = []
+
+            for event in events:
+                parse, handler = self.handlers[event['type']]
+                parsed.append((handler, parse(event)))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            return web.json_response({'error': f'Invalid event: {e!r}'}, status=400)
+
+        for handler, args in parsed:
+            await handler(*args)
+
+        return web.json_response({'success': True})
+
+    @staticmethod
+    def _parse_match_start(event):
+        user_ids = [int(user_id) for user_id in event['team_one'] + event['team_two']]
+        return int(event['match_id']), user_ids
+
+    @staticmethod
+    def _parse_match_end(event):
+        return (int(event['match_id']),)
+
+    @staticmethod
+    def _parse_match_result(event):
+        return (MatchResult.from_dict(event),)
+
+    async def match_start(self, match_id, user_ids):
+        """ Mark the players of a match as in a match once they're on the server. """
+        await self.bot.in_match.add(match_id, user_ids)
+
+        # Players have joined so the pooled server no longer needs the no-show timeout
+        if self.bot.server_pool is not None:
+            server = await self.bot.server_pool.match_server(match_id)
+
+            if server is not None:
+                self.bot.loop.create_task(self.bot.server_pool.confirm(server))
+
+    async def match_end(self, match_id):
+        """ Free the players and the pooled server of a match that ended. """
+        await self.bot.in_match.remove(match_id)
+
+        if self.bot.server_pool is not None:
+            server = await self.bot.server_pool.match_server(match_id)
+
+            if server is not None:
+                self.bot.loop.create_task(self.bot.server_pool.release(server))
+
+    async def match_result(self, result):
+        """ Queue a finished match's result to be written to the match history and end the match. """
+        self.results.append(result)
+        await self.match_end(result.match_id)
+
+    async def _flush_loop(self):
+        """ Periodically write the pending results. """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f'Unable to write match results: {e}')
+
+    async def flush(self):
+        """ Write the pending results to the match history in one batch. """
+        if not self.results:
+            return
+
+        results = self.results
+        self.results = []
+        written = results
+
+        try:
+            await self.bot.history.record_results(*results)
+        except Exception as e:
+            # Write the results one by one so a single bad result can't hold up the rest
+            self.logger.warning(f'Unable to write a batch of {len(results)} results, retrying individually: {e}')
+            written = []
+
+            for result in results:
+                try:
+                    await self.bot.history.record_result(result)
+                except Exception as e:
+                    attempts = self.attempts.get(result.match_id, 0) + 1
+
+                    if attempts < self.max_attempts:
+                        self.attempts[result.match_id] = attempts
+                        self.results.append(result)
+                    else:
+                        self.attempts.pop(result.match_id, None)
+                        self.logger.error(f'Dropping the result of match {result.match_id}: {e}')
+                else:
+                    self.attempts.pop(result.match_id, None)
+                    written.append(result)
+
+        # Stats cached for the queue no longer include the written matches
+        queue_cog = self.bot.get_cog('QueueCog')
+
+        if queue_cog is not None and written:
+            queue_cog.expire_stats(*(user_id for result in written for user_id in result.users))
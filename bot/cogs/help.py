@@ -3,6 +3,8 @@
 from discord.ext import commands
 import Levenshtein as lev
 
+from .utils import Priority
+
 GITHUB = 'https://github.com/csgo-league/csgo-league-bot'  # TODO: Use git API to get link to repo?
 SERVER_INV = 'https://discord.gg/b5MhANU'
 
@@ -60,7 +62,7 @@ class HelpCog(commands.Cog):
                 embed_title += f' Use `{prefix}help` for a list of commands'
 
             embed = self.bot.embed_template(title=embed_title)
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, priority=Priority.INFO)
 
     @commands.command(brief='Display the help menu')
     async def help(self, ctx):
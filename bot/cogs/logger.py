@@ -3,12 +3,17 @@
 import __main__
 import aiohttp
 import asyncio
+import datetime
 from discord.ext import commands
+import json
 import logging
-from logging import config
+from logging import config, handlers
 from os import path
+import queue
 import traceback
 
+from .utils.tracing import TRACER
+
 
 LOGGING_CONFIG = {
     'version': 1,
@@ -61,6 +66,119 @@ LOGGING_CONFIG = {
 config.dictConfig(LOGGING_CONFIG)
 
 
+class JsonFormatter(logging.Formatter):
+    """ Formats records as single line JSON objects for log collectors. """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage()
+        }
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(handlers.QueueHandler):
+    """
+    Queues records for a listener thread without ever blocking the event loop,
+    dropping them and counting the drops while the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        """ Set attributes. """
+        super().__init__(log_queue)
+        self.dropped = 0  # Number of records dropped since the handler was created
+        self.unreported = 0  # Number of dropped records the log doesn't mention yet
+
+    def prepare(self, record):
+        """ Leave the formatting to the listener thread, log arguments mustn't be changed after logging them. """
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.unreported:
+                self.queue.put_nowait(self._drop_record())
+                self.unreported = 0
+
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.unreported += 1
+
+    def _drop_record(self):
+        msg = f'Dropped {self.unreported} log records because the log queue was full'
+        return logging.LogRecord('csgoleague.logging', logging.WARNING, __file__, 0, msg, None, None)
+
+
+class _BlockingQueueListener(handlers.QueueListener):
+    """ Queue listener that waits for room in a full queue to stop instead of failing. """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """
+    Moves the root logger's handlers onto a background thread fed through a
+    bounded queue so formatting records and writing them to the console and
+    the log file doesn't block the event loop.
+    """
+
+    def __init__(self, queue_size=10000, json_format=False):
+        """ Set attributes. """
+        self.queue_size = queue_size
+        self.json_format = json_format  # Write records as JSON lines instead of the default format
+        self.handler = None
+        self.listener = None
+
+    @property
+    def dropped(self):
+        """ Get the number of records dropped because the queue was full. """
+        return 0 if self.handler is None else self.handler.dropped
+
+    def start(self):
+        """ Start writing the root logger's records from the listener thread. """
+        root = logging.getLogger()
+        sinks = root.handlers[:]
+
+        if self.json_format:
+            for sink in sinks:
+                sink.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(self.queue_size)
+        self.handler = DroppingQueueHandler(log_queue)
+        self.listener = _BlockingQueueListener(log_queue, *sinks, respect_handler_level=True)
+
+        for sink in sinks:
+            root.removeHandler(sink)
+
+        root.addHandler(self.handler)
+        self.listener.start()
+
+    def stop(self):
+        """ Write the queued records and give the handlers back to the root logger. """
+        if self.listener is None:
+            return
+
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        self.listener.stop()
+
+        for sink in self.listener.handlers:
+            root.addHandler(sink)
+
+        self.listener = None
+
+
 def indent(string, n=4):
     """"""
     indent = ' ' * n
@@ -145,8 +263,34 @@ async def end_request_log(session, ctx, params):
                 f'    Status: {params.response.status}\n'
                 f'    Reason: {params.response.reason}')
     resp_json = await params.response.json()
-    logger.debug(f'Response JSON from {params.url}: {resp_json}')
+    logger.debug('Response JSON from %s: %s', params.url, resp_json)  # Formatted off the event loop by the log pipeline
+
+
+async def start_request_span(session, ctx, params):
+    """ Time the request in a span of the trace it's made in. """
+    # Name the span after the route so requests for different players are summarized together
+    route = '/'.join('{id}' if part.isdigit() else part for part in params.url.path.split('/'))
+    ctx.span_context = TRACER.span(f'{params.method} {route}', 'api', url=str(params.url))
+    ctx.span = ctx.span_context.__enter__()
+
+
+async def end_request_span(session, ctx, params):
+    """"""
+    if ctx.span is not None:
+        ctx.span.attributes['status'] = params.response.status
+
+    ctx.span_context.__exit__(None, None, None)
+
+
+async def exception_request_span(session, ctx, params):
+    """"""
+    exc = params.exception
+    ctx.span_context.__exit__(type(exc), exc, exc.__traceback__)
+
 
 TRACE_CONFIG = aiohttp.TraceConfig()
 TRACE_CONFIG.on_request_start.append(start_request_log)
+TRACE_CONFIG.on_request_start.append(start_request_span)
 TRACE_CONFIG.on_request_end.append(end_request_log)
+TRACE_CONFIG.on_request_end.append(end_request_span)
+TRACE_CONFIG.on_request_exception.append(exception_request_span)
@@ -2,13 +2,19 @@
 
 import aiohttp
 import asyncio
+from datetime import datetime, timedelta, timezone
 import discord
 from discord.ext import commands
+import enum
+import json
+import logging
 import random
 import sys
 import traceback
+import uuid
 
-from .utils import Map, MatchServer, PlayerStats, TeamMethod, CaptainMethod, MapMethod
+from .utils import (DBHelper, Map, MatchCheckpointer, PlayerStats, Priority, ServerReservation, TeamMethod,
+                    CaptainMethod, MapMethod)
 
 
 EMOJI_NUMBERS = [u'\u0030\u20E3',
@@ -35,7 +41,7 @@ class PickError(ValueError):
 class TeamDraftMenu(discord.Message):
     """ Message containing the components for a team draft. """
 
-    def __init__(self, ctx, bot, users):
+    def __init__(self, ctx, bot, users, players=None, ratings=None, on_change=None):
         """ Copy constructor from a message and specific team draft args. """
         # Copy all attributes from message object
         for attr_name in ctx.message.__slots__:
@@ -54,9 +60,34 @@ class TeamDraftMenu(discord.Message):
         self.pick_order = '12211221'
         self.pick_number = None
         self.users_left = None
-        self.players = None
+        self.players = players  # Stats of the users in the same order, fetched at draft time if not given
+        self.ratings = ratings  # Ratings of the users in the same order, RankMe scores are used if not given
         self.teams = None
         self.future = None
+        self.on_change = on_change
+
+    @property
+    def checkpoint(self):
+        """ Get the current status of the team draft formatted for a match checkpoint. """
+        if self.teams is None:
+            return None
+
+        return {
+            'pick_number': self.pick_number,
+            'users_left': [user.id for user in self.users_left],
+            'teams': [[user.id for user in team] for team in self.teams]
+        }
+
+    def restore(self, checkpoint):
+        """ Resume the team draft from a match checkpoint. """
+        self.pick_number = checkpoint['pick_number']
+        self.users_left = [self.guild.get_member(user_id) for user_id in checkpoint['users_left']]
+        self.teams = [[self.guild.get_member(user_id) for user_id in team] for team in checkpoint['teams']]
+
+    def _changed(self):
+        """ Notify the owner of the menu that the draft status has changed. """
+        if self.on_change is not None:
+            self.on_change()
 
     @property
     def _active_picker(self):
@@ -92,7 +123,7 @@ class TeamDraftMenu(discord.Message):
         for index, (emoji, user) in enumerate(self.pick_emojis.items()):
             if not any(user in team for team in self.teams):
                 users_left_str += f'{emoji}  [{user.display_name}]({self.players[index].league_profile})  | \
-                                    {self.players[index].score}\n'
+                                    {self.ratings[index]:.0f}\n'
             else:
                 users_left_str += f':heavy_multiplication_x:  ~~{user.display_name}~~\n'
 
@@ -137,7 +168,7 @@ class TeamDraftMenu(discord.Message):
 
     async def _update_menu(self, title):
         """ Update the message to reflect the current status of the team draft. """
-        await self.edit(embed=self._draft_embed(title))
+        await self.bot.outbound.submit(self.channel, self.edit(embed=self._draft_embed(title)), Priority.CRITICAL)
 
     async def _process_pick(self, reaction, user):
         """ Handler function for player pick reactions. """
@@ -149,7 +180,8 @@ class TeamDraftMenu(discord.Message):
         pick = self.pick_emojis.get(str(reaction.emoji), None)
 
         if pick is None or pick not in self.users_left:
-            await self.remove_reaction(reaction, user)
+            await self.bot.outbound.submit(self.channel, self.remove_reaction(reaction, user), Priority.INFO,
+                                           'reactions')
             return
 
         # Attempt to pick the player for the team
@@ -158,7 +190,9 @@ class TeamDraftMenu(discord.Message):
         except PickError as e:  # Player not picked
             title = e.message
         else:  # Player picked
-            await self.clear_reaction(reaction.emoji)
+            self._changed()
+            await self.bot.outbound.submit(self.channel, self.clear_reaction(reaction.emoji), Priority.CRITICAL,
+                                           'reactions')
             title = f'**Team {user.display_name}** picked {pick.display_name}'
 
         if len(self.users_left) == 1:
@@ -173,52 +207,70 @@ class TeamDraftMenu(discord.Message):
 
         await self._update_menu(title)
 
-    async def draft(self):
-        """ Start the team draft and return the teams after it's finished. """
+    async def draft(self, timeout=600):
+        """ Start or resume the team draft and return the teams after it's finished. """
         # Initialize draft
+        start = self.bot.loop.time()
         config = await self.ctx.guild_config()
-        self.users_left = self.users.copy()  # Copy users to edit players remaining in the player pool
-        self.players = [x async for x in PlayerStats.from_users(self.users)]
-        self.teams = [[], []]
-        self.pick_number = 0
-        captain_method = config.captain_method
 
-        # Check captain methods
-        if captain_method == CaptainMethod.RANK:
-            players_stats = [x async for x in PlayerStats.from_users(self.users_left)]
-            players_stats.sort(reverse=True, key=lambda x: x.score)
-
-            for team in self.teams:
-                captain = self.guild.get_member(players_stats.pop(0).discord)
-                self.users_left.remove(captain)
-                team.append(captain)
-        elif captain_method == CaptainMethod.RANDOM:
-            temp_users = self.users_left.copy()
-            random.shuffle(temp_users)
-
-            for team in self.teams:
-                captain = temp_users.pop()
-                self.users_left.remove(captain)
-                team.append(captain)
-        elif captain_method == CaptainMethod.VOLUNTEER:
-            pass
-        else:
-            raise ValueError(f'Captain method "{captain_method}" isn\'t valid')
+        if self.players is None:
+            self.players = [x async for x in PlayerStats.from_users(self.users)]
+
+        if self.ratings is None:
+            self.ratings = [player.score for player in self.players]
+
+        if self.teams is None:  # Not resumed from a checkpoint
+            self.users_left = self.users.copy()  # Copy users to edit players remaining in the player pool
+            self.teams = [[], []]
+            self.pick_number = 0
+            captain_method = config.captain_method
+
+            # Check captain methods
+            if captain_method == CaptainMethod.RANK:
+                ranked = sorted(zip(self.ratings, self.users), reverse=True, key=lambda x: x[0])
+
+                for team in self.teams:
+                    captain = ranked.pop(0)[1]
+                    self.users_left.remove(captain)
+                    team.append(captain)
+            elif captain_method == CaptainMethod.RANDOM:
+                temp_users = self.users_left.copy()
+                random.shuffle(temp_users)
+
+                for team in self.teams:
+                    captain = temp_users.pop()
+                    self.users_left.remove(captain)
+                    team.append(captain)
+            elif captain_method == CaptainMethod.VOLUNTEER:
+                pass
+            else:
+                raise ValueError(f'Captain method "{captain_method}" isn\'t valid')
+
+            self._changed()
 
         # Edit input message and add emoji button reactions
-        await self.edit(embed=self._draft_embed('Team draft has begun!'))
+        await self.bot.outbound.submit(self.channel, self.edit(embed=self._draft_embed('Team draft has begun!')),
+                                       Priority.CRITICAL)
+        logging.getLogger('csgoleague.match').debug(
+            f'Team draft menu rendered {self.bot.loop.time() - start:.3f}s after the draft started'
+        )
 
         items = self.pick_emojis.items()
         for emoji, user in items:
             if user in self.users_left:
-                await self.add_reaction(emoji)
+                await self.bot.outbound.submit(self.channel, self.add_reaction(emoji), Priority.CRITICAL, 'reactions')
 
         # Add listener handlers and wait until there are no users left to pick
-        self.future = self.bot.loop.create_future()
-        self.bot.add_listener(self._process_pick, name='on_reaction_add')
-        await asyncio.wait_for(self.future, 600)
-        self.bot.remove_listener(self._process_pick, name='on_reaction_add')
-        await self.clear_reactions()
+        if self.users_left:
+            self.future = self.bot.loop.create_future()
+            self.bot.add_listener(self._process_pick, name='on_reaction_add')
+
+            try:
+                await asyncio.wait_for(self.future, timeout)
+            finally:
+                self.bot.remove_listener(self._process_pick, name='on_reaction_add')
+
+        await self.bot.outbound.submit(self.channel, self.clear_reactions(), Priority.CRITICAL, 'reactions')
 
         # Return class to original state after team drafting is done
         picked_teams = self.teams
@@ -247,7 +299,7 @@ ALL_MAPS = [
 class MapDraftMenu(discord.Message):
     """ Message containing the components for a map draft. """
 
-    def __init__(self, ctx, bot):
+    def __init__(self, ctx, bot, on_change=None):
         """ Copy constructor from a message and specific team draft args. """
         # Copy all attributes from message object
         for attr_name in ctx.message.__slots__:
@@ -268,6 +320,33 @@ class MapDraftMenu(discord.Message):
         self.maps_left = None
         self.ban_number = None
         self.future = None
+        self.on_change = on_change
+
+    @property
+    def checkpoint(self):
+        """ Get the current status of the map draft formatted for a match checkpoint. """
+        if self.maps_left is None:
+            return None
+
+        return {
+            'captains': [captain.id for captain in self.captains],
+            'map_pool': [m.dev_name for m in self.map_pool],
+            'maps_left': [m.dev_name for m in self.maps_left.values()],
+            'ban_number': self.ban_number
+        }
+
+    def restore(self, checkpoint):
+        """ Resume the map draft from a match checkpoint. """
+        self.captains = [self.guild.get_member(user_id) for user_id in checkpoint['captains']]
+        self.map_pool = [m for m in self.all_maps if m.dev_name in checkpoint['map_pool']]
+        self.maps_left = {self.bot.emoji_dict[m.dev_name]: m
+                          for m in self.map_pool if m.dev_name in checkpoint['maps_left']}
+        self.ban_number = checkpoint['ban_number']
+
+    def _changed(self):
+        """ Notify the owner of the menu that the draft status has changed. """
+        if self.on_change is not None:
+            self.on_change()
 
     @property
     def _active_picker(self):
@@ -303,10 +382,11 @@ class MapDraftMenu(discord.Message):
 
     async def _update_menu(self, title):
         """ Update the message to reflect the current status of the map draft. """
-        await self.edit(embed=self._draft_embed(title))
-        awaitables = [self.clear_reaction(self.bot.emoji_dict[m.dev_name])
+        await self.bot.outbound.submit(self.channel, self.edit(embed=self._draft_embed(title)), Priority.CRITICAL)
+        awaitables = [self.bot.outbound.submit(self.channel, self.clear_reaction(self.bot.emoji_dict[m.dev_name]),
+                                               Priority.CRITICAL, 'reactions')
                       for m in self.map_pool if self.bot.emoji_dict[m.dev_name] not in self.maps_left]
-        await asyncio.gather(*awaitables, loop=self.bot.loop)
+        await asyncio.gather(*awaitables)
 
     async def _process_ban(self, reaction, user):
         """ Handler function for map ban reactions. """
@@ -316,7 +396,8 @@ class MapDraftMenu(discord.Message):
 
         # Check that user is the active captain and reaction in left maps
         if user != self._active_picker or str(reaction) not in [m for m in self.maps_left]:
-            await self.remove_reaction(reaction, user)
+            await self.bot.outbound.submit(self.channel, self.remove_reaction(reaction, user), Priority.INFO,
+                                           'reactions')
             return
 
         # Ban map if the emoji is valid
@@ -326,9 +407,11 @@ class MapDraftMenu(discord.Message):
             return
 
         self.ban_number += 1
+        self._changed()
 
         # Clear banned map reaction
-        await self.clear_reaction(self.bot.emoji_dict[map_ban.dev_name])
+        await self.bot.outbound.submit(self.channel, self.clear_reaction(self.bot.emoji_dict[map_ban.dev_name]),
+                                       Priority.CRITICAL, 'reactions')
 
         # Check if the draft is over
         if len(self.maps_left) == 1:
@@ -339,31 +422,41 @@ class MapDraftMenu(discord.Message):
 
         await self._update_menu(f'**{user.display_name}** banned {map_ban.name}')
 
-    async def draft(self, captain_1, captain_2):
-        """ Start the team draft and return the teams after it's finished. """
+    async def draft(self, captain_1, captain_2, timeout=600):
+        """ Start or resume the map draft and return the map pick after it's finished. """
         # Initialize draft
-        config = await self.ctx.guild_config()
-        self.captains = [captain_1, captain_2]
-        mp_dict = config.map_pool.to_dict
-        self.map_pool = [m for m in self.all_maps if mp_dict[m.dev_name]]
-        self.maps_left = {self.bot.emoji_dict[m.dev_name]: m for m in self.map_pool}
-        self.ban_number = 0
+        if self.maps_left is None:  # Not resumed from a checkpoint
+            config = await self.ctx.guild_config()
+            self.captains = [captain_1, captain_2]
+            mp_dict = config.map_pool.to_dict
+            self.map_pool = [m for m in self.all_maps if mp_dict[m.dev_name]]
+            self.maps_left = {self.bot.emoji_dict[m.dev_name]: m for m in self.map_pool}
+            self.ban_number = 0
+
+            if len(self.map_pool) % 2 == 0:
+                self.captains.reverse()
 
-        if len(self.map_pool) % 2 == 0:
-            self.captains.reverse()
+            self._changed()
 
         # Edit input message and add emoji button reactions
-        await self.edit(embed=self._draft_embed('Map bans have begun!'))
+        await self.bot.outbound.submit(self.channel, self.edit(embed=self._draft_embed('Map bans have begun!')),
+                                       Priority.CRITICAL)
 
-        for m in self.map_pool:
-            await self.add_reaction(self.bot.emoji_dict[m.dev_name])
+        for m in self.maps_left.values():
+            await self.bot.outbound.submit(self.channel, self.add_reaction(self.bot.emoji_dict[m.dev_name]),
+                                           Priority.CRITICAL, 'reactions')
 
         # Add listener handlers and wait until there are no maps left to ban
-        self.future = self.bot.loop.create_future()
-        self.bot.add_listener(self._process_ban, name='on_reaction_add')
-        await asyncio.wait_for(self.future, 600)
-        self.bot.remove_listener(self._process_ban, name='on_reaction_add')
-        await self.clear_reactions()
+        if len(self.maps_left) > 1:
+            self.future = self.bot.loop.create_future()
+            self.bot.add_listener(self._process_ban, name='on_reaction_add')
+
+            try:
+                await asyncio.wait_for(self.future, timeout)
+            finally:
+                self.bot.remove_listener(self._process_ban, name='on_reaction_add')
+
+        await self.bot.outbound.submit(self.channel, self.clear_reactions(), Priority.CRITICAL, 'reactions')
 
         # Return class to original state after map drafting is done
         map_pick = list(self.maps_left.values())[0]  # Get map pick before setting self.maps_left to None
@@ -379,7 +472,7 @@ class MapDraftMenu(discord.Message):
 class MapVoteMenu(discord.Message):
     """ Message containing the components for a map draft. """
 
-    def __init__(self, ctx, bot, users):
+    def __init__(self, ctx, bot, users, on_change=None):
         """ Copy constructor from a message and specific team draft args. """
         # Copy all attributes from message object
         for attr_name in ctx.message.__slots__:
@@ -400,6 +493,32 @@ class MapVoteMenu(discord.Message):
         self.map_choices = None
         self.map_votes = None
         self.future = None
+        self.on_change = on_change
+
+    @property
+    def checkpoint(self):
+        """ Get the current status of the map vote formatted for a match checkpoint. """
+        if self.map_votes is None:
+            return None
+
+        return {
+            'voted_users': [user.id for user in self.voted_users],
+            'map_pool': [m.dev_name for m in self.map_pool],
+            'map_votes': {m.dev_name: self.map_votes[self.bot.emoji_dict[m.dev_name]] for m in self.map_pool}
+        }
+
+    def restore(self, checkpoint):
+        """ Resume the map vote from a match checkpoint. """
+        self.voted_users = {self.guild.get_member(user_id) for user_id in checkpoint['voted_users']}
+        maps = {m.dev_name: m for m in self.all_maps}
+        self.map_pool = [maps[dev_name] for dev_name in checkpoint['map_pool']]
+        self.map_choices = self.map_pool
+        self.map_votes = {self.bot.emoji_dict[dev_name]: votes for dev_name, votes in checkpoint['map_votes'].items()}
+
+    def _changed(self):
+        """ Notify the owner of the menu that the vote status has changed. """
+        if self.on_change is not None:
+            self.on_change()
 
     def _vote_embed(self):
         embed = self.bot.embed_template(title='Map vote started! (1 min)')
@@ -419,7 +538,8 @@ class MapVoteMenu(discord.Message):
         # Add map vote if it is valid
         if user not in self.users or user in self.voted_users or \
                 str(reaction) not in [self.bot.emoji_dict[m.dev_name] for m in self.map_pool]:
-            await self.remove_reaction(reaction, user)
+            await self.bot.outbound.submit(self.channel, self.remove_reaction(reaction, user), Priority.INFO,
+                                           'reactions')
             return
 
         try:
@@ -428,41 +548,48 @@ class MapVoteMenu(discord.Message):
             return
 
         self.voted_users.add(user)
+        self._changed()
         embed = self._vote_embed()
-        await self.edit(embed=embed)
+        await self.bot.outbound.submit(self.channel, self.edit(embed=embed), Priority.CRITICAL)
 
         # Check if the voting is over
         if len(self.voted_users) == len(self.users):
             if self.future is not None:
                 self.future.set_result(None)
 
-    async def vote(self):
-        """"""
-        self.voted_users = set()
-        config = await self.ctx.guild_config()
-        mp_dict = config.map_pool.to_dict
-        self.map_pool = [m for m in self.all_maps if mp_dict[m.dev_name]]
-        random.shuffle(self.map_pool)
-        self.map_choices = self.map_pool
-        self.map_votes = {
-            self.bot.emoji_dict[m.dev_name]: 0 for m in self.map_pool}
+    async def vote(self, timeout=60):
+        """ Start or resume the map vote and return the winning map after it's finished. """
+        if self.map_votes is None:  # Not resumed from a checkpoint
+            self.voted_users = set()
+            config = await self.ctx.guild_config()
+            mp_dict = config.map_pool.to_dict
+            self.map_pool = [m for m in self.all_maps if mp_dict[m.dev_name]]
+            random.shuffle(self.map_pool)
+            self.map_choices = self.map_pool
+            self.map_votes = {
+                self.bot.emoji_dict[m.dev_name]: 0 for m in self.map_pool}
+            self._changed()
+
         embed = self._vote_embed()
-        await self.edit(embed=embed)
+        await self.bot.outbound.submit(self.channel, self.edit(embed=embed), Priority.CRITICAL)
 
         for map_option in self.map_choices:
-            await self.add_reaction(self.bot.emoji_dict[map_option.dev_name])
+            await self.bot.outbound.submit(self.channel, self.add_reaction(self.bot.emoji_dict[map_option.dev_name]),
+                                           Priority.CRITICAL, 'reactions')
 
         # Add listener handlers and wait until there are no maps left to ban
-        self.future = self.bot.loop.create_future()
-        self.bot.add_listener(self._process_vote, name='on_reaction_add')
+        if len(self.voted_users) < len(self.users):
+            self.future = self.bot.loop.create_future()
+            self.bot.add_listener(self._process_vote, name='on_reaction_add')
 
-        try:
-            await asyncio.wait_for(self.future, 60)
-        except asyncio.TimeoutError:
-            pass
+            try:
+                await asyncio.wait_for(self.future, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.bot.remove_listener(self._process_vote, name='on_reaction_add')
 
-        self.bot.remove_listener(self._process_vote, name='on_reaction_add')
-        await self.clear_reactions()
+        await self.bot.outbound.submit(self.channel, self.clear_reactions(), Priority.CRITICAL, 'reactions')
 
         # Gather results
         winners_emoji = []
@@ -488,33 +615,478 @@ class MapVoteMenu(discord.Message):
         return winner_map
 
 
+class MatchState(enum.Enum):
+    """ Enum for the phases of a match's lifecycle. """
+    READY_CHECK = enum.auto()
+    TEAM_SELECTION = enum.auto()
+    MAP_SELECTION = enum.auto()
+    SERVER_ALLOCATION = enum.auto()
+    LIVE = enum.auto()
+    CANCELLED = enum.auto()
+    FAILED = enum.auto()
+
+    def __str__(self):
+        return self.name.lower()
+
+
+class Match:
+    """ A group of popped players moved through the ready check, team and map selection and server allocation. """
+
+    ready_emoji = '✅'
+    ready_timeout = 60
+    draft_timeout = 600
+    vote_timeout = 60
+
+    def __init__(self, cog, ctx, users, stats=None, match_id=None):
+        """ Set attributes. """
+        self.id = match_id or uuid.uuid4()
+        self.cog = cog
+        self.bot = cog.bot
+        self.ctx = ctx
+        self.guild = ctx.guild
+        self.users = users
+        self.stats = stats or {}  # Stats of the players by user ID, prefetched while they were queued
+        self.popped_at = self.bot.loop.time()
+        self.state = MatchState.READY_CHECK
+        self.message = None
+        self.readied = set()
+        self.team_one = None
+        self.team_two = None
+        self.map_pick = None
+        self.server = None
+        self.reservation_task = None  # Server reserved in the background while the players draft
+        self.menu = None
+        self.resume_draft = {}  # Menu status from the checkpoint the match was resumed from
+        self.deadline = None  # When the current phase times out
+        self.task = None
+        self.logger = logging.getLogger('csgoleague.match')
+
+    def __repr__(self):
+        return f'<Match id={self.id} guild={self.guild.id} state={self.state}>'
+
+    @classmethod
+    async def from_checkpoint(cls, cog, checkpoint):
+        """ Rebuild a match from its row in the matches table and reattach it to its Discord message. """
+        guild = cog.bot.get_guild(checkpoint['guild_id'])
+
+        if guild is None:
+            raise ValueError(f'Guild {checkpoint["guild_id"]} is no longer available')
+
+        channel = guild.get_channel(checkpoint['channel_id'])
+
+        if channel is None:
+            raise ValueError(f'Channel {checkpoint["channel_id"]} no longer exists')
+
+        message = await channel.fetch_message(checkpoint['message_id'])
+        ctx = await cog.bot.get_context(message)
+        users = [guild.get_member(user_id) for user_id in checkpoint['users']]
+
+        if None in users:
+            raise ValueError('A player has left the guild')
+
+        match = cls(cog, ctx, users, match_id=checkpoint['id'])
+        match.message = message
+        match.state = MatchState[checkpoint['state'].upper()]
+        match.team_one = match._get_members(checkpoint['team_one'])
+        match.team_two = match._get_members(checkpoint['team_two'])
+        match.map_pick = next((m for m in ALL_MAPS if m.dev_name == checkpoint['map_pick']), None)
+        match.resume_draft = json.loads(checkpoint['draft'])
+        match.deadline = checkpoint['deadline']
+
+        if match.state is MatchState.READY_CHECK:
+            readied_ids = set(match.resume_draft.get('readied', []))
+
+            # Pick up anyone who readied up while the bot was offline
+            for reaction in message.reactions:
+                if reaction.emoji == cls.ready_emoji:
+                    readied_ids.update([user.id async for user in reaction.users()])
+
+            match.readied = {user for user in match.users if user.id in readied_ids}
+
+        return match
+
+    def _get_members(self, user_ids):
+        """ Get the guild members of a list of user IDs, if there is one. """
+        if user_ids is None:
+            return None
+
+        return [self.guild.get_member(user_id) for user_id in user_ids]
+
+    @property
+    def checkpoint_row(self):
+        """ Get the current status of the match formatted for the matches table. """
+        if self.menu is not None and self.menu.checkpoint is not None:
+            draft = self.menu.checkpoint
+        elif self.state is MatchState.READY_CHECK:
+            draft = {'readied': [user.id for user in self.readied]}
+        else:
+            draft = {}
+
+        return (
+            self.id,
+            self.guild.id,
+            self.message.channel.id,
+            self.message.id,
+            str(self.state),
+            [user.id for user in self.users],
+            None if self.team_one is None else [user.id for user in self.team_one],
+            None if self.team_two is None else [user.id for user in self.team_two],
+            None if self.map_pick is None else self.map_pick.dev_name,
+            json.dumps(draft),
+            self.deadline
+        )
+
+    def checkpoint(self):
+        """ Schedule the match's current status to be persisted. """
+        if self.message is not None:
+            self.cog.checkpointer.mark(self)
+
+    async def players_stats(self):
+        """ Get the stats of the players in the same order as the users, only fetching the ones not prefetched. """
+        missing = [user for user in self.users if user.id not in self.stats]
+
+        if missing:
+            self.stats.update({x.discord: x async for x in PlayerStats.from_users(missing)})
+
+        return [self.stats[user.id] for user in self.users]
+
+    async def player_ratings(self):
+        """ Get the ratings of the players in the same order as the users. """
+        return await self.cog.player_ratings(self.users)
+
+    def _set_state(self, state):
+        """ Move the match to a new lifecycle state. """
+        self.logger.info(f'Match {self.id} in guild {self.guild.id} moved from {self.state} to {state}')
+        self.state = state
+        self.menu = None
+        self.resume_draft = {}
+        self.deadline = None
+
+        if state in (MatchState.LIVE, MatchState.CANCELLED, MatchState.FAILED):
+            self.cog.checkpointer.discard(self.id)
+        else:
+            self.checkpoint()
+
+    def _time_left(self, timeout):
+        """ Get the seconds left in the current phase, starting its deadline if it hasn't been yet. """
+        now = datetime.now(timezone.utc)
+
+        if self.deadline is None:
+            self.deadline = now + timedelta(seconds=timeout)
+            self.checkpoint()
+
+        return max((self.deadline - now).total_seconds(), 0)
+
+    def _resume_menu(self, menu, key):
+        """ Attach a menu to the match and restore its status if the match was resumed mid-menu. """
+        if key in self.resume_draft:
+            menu.restore(self.resume_draft)
+
+        self.menu = menu
+        return menu
+
+    def start(self):
+        """ Schedule the match lifecycle as its own task and return the task. """
+        self.task = self.bot.loop.create_task(self.run())
+        return self.task
+
+    def cancel(self):
+        """ Cancel the match lifecycle task if it is still running. """
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def run(self):
+        """ Run the match through the rest of its lifecycle, starting from its current state. """
+        cancelled = False
+
+        try:
+            if self.state is MatchState.READY_CHECK:
+                if not await self._ready_check():
+                    self._set_state(MatchState.CANCELLED)
+                    return
+
+                self._set_state(MatchState.TEAM_SELECTION)
+
+            # Get a server ready while the teams and map are being picked
+            self._reserve_server()
+
+            if self.state is MatchState.TEAM_SELECTION:
+                await self._select_teams()
+                self._set_state(MatchState.MAP_SELECTION)
+
+            if self.state is MatchState.MAP_SELECTION:
+                await self._select_map()
+                self._set_state(MatchState.SERVER_ALLOCATION)
+
+            if self.state is MatchState.SERVER_ALLOCATION:
+                await self._allocate_server()
+        except asyncio.TimeoutError:
+            self._set_state(MatchState.CANCELLED)
+            embed = self.bot.embed_template(title='Match cancelled!', description='The draft timed out')
+            await self._edit_message(embed)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise  # Keep the checkpoint so the match is resumed when the bot restarts
+        except Exception:
+            # Everyone readied up unless the match failed during the ready check
+            readied = [user for user in self.users
+                       if self.state is not MatchState.READY_CHECK or user in self.readied]
+            self._set_state(MatchState.FAILED)
+            await self._fail(readied)
+            raise
+        finally:
+            # A cancelled match is resumed after the restart so its reservation is left to expire instead
+            if self.state is not MatchState.LIVE and not cancelled:
+                await self._release_reservation()
+
+    async def _fail(self, readied):
+        """ Tell the players their match failed and put the ones who readied up back in the queue. """
+        awaitables = [self.bot.get_cog('QueueCog').requeue(self.ctx, readied, self.stats)]
+
+        if self.message is not None:
+            embed = self.bot.embed_template(title='Match failed!', description='Something went wrong setting it up')
+            embed.set_footer(text='The players who readied up have been put back in the queue')
+            awaitables.append(self._edit_message(embed))
+
+        for result in await asyncio.gather(*awaitables, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.warning(f'Unable to clean up after match {self.id} failed: {result!r}')
+
+    async def _edit_message(self, embed):
+        """ Edit the match message ahead of the bot's less urgent writes. """
+        await self.bot.outbound.submit(self.message.channel, self.message.edit(embed=embed), Priority.CRITICAL)
+
+    def _reserve_server(self):
+        """ Start reserving a server from the local pool if there is one or else from the API. """
+        reserve = ServerReservation.reserve if self.bot.server_pool is None else self.bot.server_pool.reserve
+        self.reservation_task = self.bot.loop.create_task(reserve())
+        return self.reservation_task
+
+    async def _reservation(self):
+        """ Get the server reserved during the draft, reserving one now if that failed. """
+        try:
+            return await self.reservation_task
+        except aiohttp.ClientResponseError as e:
+            self.logger.warning(f'Unable to reserve a server during the draft of match {self.id}: {e}')
+            return await self._reserve_server()
+
+    async def _release_reservation(self):
+        """ Give back the server reserved for a match that isn't going ahead. """
+        if self.reservation_task is None:
+            return
+
+        if not self.reservation_task.done():
+            self.reservation_task.cancel()  # The API expires reservations that are never committed
+            return
+
+        if self.reservation_task.cancelled() or self.reservation_task.exception() is not None:
+            return
+
+        try:
+            await self.reservation_task.result().release()
+        except Exception as e:
+            self.logger.warning(f'Unable to release the server reserved for match {self.id}: {e}')
+
+    async def _ready_check(self):
+        """ Notify everyone to ready up and wait for them to do so. """
+        if self.message is None:  # Not resumed from a checkpoint
+            user_mentions = ''.join(user.mention for user in self.users)
+            description = f'React with the {self.ready_emoji} below to ready up (1 min)'
+            burst_embed = self.bot.embed_template(title='Queue has filled up!', description=description)
+            self.message = await self.ctx.send(user_mentions, embed=burst_embed, priority=Priority.CRITICAL)
+            await self.bot.outbound.submit(self.message.channel, self.message.add_reaction(self.ready_emoji),
+                                           Priority.CRITICAL, 'reactions')
+
+        def all_ready(reaction, user):
+            """ Check if all players in the match have readied up. """
+            # Check if this is a reaction we care about
+            if reaction.message.id != self.message.id or user not in self.users or reaction.emoji != self.ready_emoji:
+                return False
+
+            self.readied.add(user)
+            self.checkpoint()
+            return self.readied.issuperset(self.users)  # All popped users have reacted
+
+        try:
+            if not self.readied.issuperset(self.users):
+                timeout = self._time_left(self.ready_timeout)
+                await self.bot.wait_for('reaction_add', timeout=timeout, check=all_ready)
+        except asyncio.TimeoutError:  # Not everyone readied up
+            unreadied = set(self.users) - self.readied
+            readied = [user for user in self.users if user in self.readied]
+            awaitables = [
+                self.bot.outbound.submit(self.message.channel, self.message.clear_reactions(), Priority.CRITICAL,
+                                         'reactions'),
+                self.bot.get_cog('QueueCog').requeue(self.ctx, readied, self.stats)
+            ]
+            await asyncio.gather(*awaitables)
+            description = '\n'.join(':heavy_multiplication_x:  ' + user.mention for user in unreadied)
+            burst_embed = self.bot.embed_template(title='Not everyone was ready!', description=description)
+            burst_embed.set_footer(text='The players who readied up have been put back in the queue')
+            await self._edit_message(burst_embed)
+            return False
+
+        self.logger.debug(f'Match {self.id} passed its ready check {self.bot.loop.time() - self.popped_at:.3f}s '
+                          'after the queue popped')
+        await self.bot.outbound.submit(self.message.channel, self.message.clear_reactions(), Priority.CRITICAL,
+                                       'reactions')
+        return True
+
+    async def _select_teams(self):
+        """ Create the teams with the guild's team method. """
+        config = await self.ctx.guild_config()
+        team_method = config.team_method
+
+        if team_method == TeamMethod.AUTOBALANCE:
+            self.team_one, self.team_two = await self.cog.autobalance_teams(self.users, await self.player_ratings())
+        elif team_method == TeamMethod.CAPTAINS:
+            menu_ctx = await self.bot.get_context(self.message)
+            ratings = await self.player_ratings()
+            players = await self.players_stats()
+            menu = TeamDraftMenu(menu_ctx, self.bot, self.users, players, ratings, on_change=self.checkpoint)
+            self._resume_menu(menu, 'teams')
+            self.team_one, self.team_two = await menu.draft(self._time_left(self.draft_timeout))
+        elif team_method == TeamMethod.RANDOM:
+            self.team_one, self.team_two = await self.cog.randomize_teams(self.users)
+        else:
+            raise ValueError(f'Team method "{team_method}" isn\'t valid')
+
+    async def _select_map(self):
+        """ Pick the map with the guild's map method. """
+        config = await self.ctx.guild_config()
+        map_method = config.map_method
+
+        if map_method == MapMethod.CAPTAINS:
+            menu_ctx = await self.bot.get_context(self.message)
+            menu = MapDraftMenu(menu_ctx, self.bot, on_change=self.checkpoint)
+            self._resume_menu(menu, 'ban_number')
+            timeout = self._time_left(self.draft_timeout)
+            self.map_pick = await menu.draft(self.team_one[0], self.team_two[0], timeout)
+        elif map_method == MapMethod.VOTE:
+            menu_ctx = await self.bot.get_context(self.message)
+            menu = MapVoteMenu(menu_ctx, self.bot, self.users, on_change=self.checkpoint)
+            self._resume_menu(menu, 'map_votes')
+            self.map_pick = await menu.vote(self._time_left(self.vote_timeout))
+        elif map_method == MapMethod.RANDOM:
+            self.map_pick = await self.cog.random_map(self.ctx)
+        else:
+            raise ValueError(f'Map method "{map_method}" isn\'t valid')
+
+    async def _allocate_server(self):
+        """ Start the match on the reserved server and post its connection info. """
+        if not self.reservation_task.done():  # Only show players the wait if there is one
+            burst_embed = self.bot.embed_template(description='Fetching server...')
+            await self._edit_message(burst_embed)
+
+        # Check if able to get a match server and edit message embed accordingly
+        try:
+            reservation = await self._reservation()
+            self.server = await reservation.commit(self.team_one, self.team_two, self.map_pick.dev_name)
+        except aiohttp.ClientResponseError as e:
+            self._set_state(MatchState.FAILED)
+            description = 'Sorry! Looks like there aren\'t any servers available at this time. ' \
+                          'Please try again later.'
+            burst_embed = self.bot.embed_template(title='There was a problem!', description=description)
+            traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)  # Print exception to stderr
+        else:
+            self._set_state(MatchState.LIVE)
+            burst_embed = self._server_embed()
+
+        await self._edit_message(burst_embed)
+
+        if self.state is MatchState.LIVE:
+            try:
+                await self.bot.in_match.add(self.server.id, (user.id for user in self.users))
+                await self.bot.history.record_start(self.server.id, self.guild, self.map_pick.dev_name,
+                                                    self.team_one, self.team_two)
+            except Exception as e:
+                self.logger.error(f'Unable to record match {self.id} in the match history: {e}')
+
+    def _server_embed(self):
+        """ Generate the embed with the match server's connection info. """
+        description = f'URL: {self.server.connect_url}\nCommand: `{self.server.connect_command}`'
+        embed = self.bot.embed_template(title='Match server is ready!', description=description)
+        embed.set_author(name=f'Match #{self.server.id}', url=self.server.match_page, icon_url=self.map_pick.icon_url)
+
+        for team in [self.team_one, self.team_two]:
+            team_name = f'__Team {team[0].display_name}__'
+            embed.add_field(name=team_name, value='\n'.join(user.mention for user in team))
+
+        embed.set_thumbnail(url=self.map_pick.image_url)
+        embed.set_footer(text='Server will close after 5 minutes if anyone doesn\'t join')
+        return embed
+
+
 class MatchCog(commands.Cog):
     """ Handles everything needed to create matches. """
 
     def __init__(self, bot):
         """ Set attributes. """
         self.bot = bot
-        self.pending_ready_tasks = {}
+        self.matches = {}  # Registry of active matches by match ID
+        self.match_players = {}  # Active match of each player by user ID
+        self.checkpointer = MatchCheckpointer(bot)
+        self.resumed = False
         self.all_maps = ALL_MAPS
+        self.logger = logging.getLogger('csgoleague.match')
+
+    def cog_unload(self):
+        """ Cancel every active match when the cog is removed. """
+        for match in list(self.matches.values()):
+            match.cancel()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """ Resume the matches that were in progress when the bot last shut down. """
+        if self.resumed:
+            return
+
+        self.resumed = True
+        self.checkpointer.start()
+
+        async with self.bot.db_pool.acquire() as conn:
+            checkpoints = await DBHelper(conn).get_matches(*(guild.id for guild in self.bot.guilds))
+
+        for checkpoint in checkpoints:
+            try:
+                match = await Match.from_checkpoint(self, checkpoint)
+            except (ValueError, discord.NotFound, discord.Forbidden) as e:
+                self.logger.warning(f'Unable to resume match {checkpoint["id"]}: {e}')
+                self.checkpointer.discard(checkpoint['id'])
+                continue
+            except Exception as e:
+                # Keep the checkpoint of a match that may be resumable after the next restart, e.g. if Discord errored
+                self.logger.error(f'Unable to resume match {checkpoint["id"]}, keeping its checkpoint: {e!r}')
+                continue
+
+            self.logger.info(f'Resuming match {match.id} in guild {match.guild.id} from {match.state}')
+            self._register(match)
 
-    async def draft_teams(self, ctx, users):
-        """ Create a TeamDraftMenu from an existing message and run the draft. """
-        menu = TeamDraftMenu(ctx, self.bot, users)
-        teams = await menu.draft()
-        return teams[0], teams[1]
+    def active_matches(self, guild=None):
+        """ Get the active matches, optionally only those in a specific guild. """
+        return [match for match in self.matches.values() if guild is None or match.guild == guild]
 
-    async def autobalance_teams(self, users):
-        """ Balance teams based on players' RankMe score. """
+    def player_match(self, user):
+        """ Get the active match a user is in, if any. """
+        return self.match_players.get(user.id)
+
+    async def player_ratings(self, users):
+        """ Get users' local ratings in order, users without any rated matches having the initial rating. """
+        # RankMe scores aren't on the rating scale so unrated users are seeded like the rating engine seeds them
+        ratings = await self.bot.ratings.get_ratings([user.id for user in users])
+        return [ratings[user.id][0] for user in users]
+
+    async def autobalance_teams(self, users, ratings=None):
+        """ Balance teams based on players' ratings, getting the ratings if they aren't given in order. """
         # Only balance teams with even amounts of players
         if len(users) % 2 != 0:
             raise ValueError('Users argument must have even length')
 
-        # Get players and sort by RankMe score
-        stats_dict = dict(
-            zip([x async for x in PlayerStats.from_users(users)], users)
-        )
-        players = list(stats_dict.keys())
-        players.sort(key=lambda x: x.score)
+        if ratings is None:
+            ratings = await self.player_ratings(users)
+
+        # Get players and sort by rating
+        players = sorted(zip(ratings, users), key=lambda x: x[0])
 
         # Balance teams
         team_size = len(players) // 2
@@ -526,12 +1098,12 @@ class MatchCog(commands.Cog):
                 team_two.append(players.pop())
             elif len(team_two) >= team_size:
                 team_one.append(players.pop())
-            elif sum(p.score for p in team_one) < sum(p.score for p in team_two):
+            elif sum(p[0] for p in team_one) < sum(p[0] for p in team_two):
                 team_one.append(players.pop())
             else:
                 team_two.append(players.pop())
 
-        return list(map(stats_dict.get, team_one)), list(map(stats_dict.get, team_two))
+        return [p[1] for p in team_one], [p[1] for p in team_two]
 
     @staticmethod
     async def randomize_teams(users):
@@ -541,18 +1113,6 @@ class MatchCog(commands.Cog):
         team_size = len(temp_users) // 2
         return temp_users[:team_size], temp_users[team_size:]
 
-    async def draft_maps(self, ctx, captain_1, captain_2):
-        """"""
-        menu = MapDraftMenu(ctx, self.bot)
-        map_pick = await menu.draft(captain_1, captain_2)
-        return map_pick
-
-    async def vote_maps(self, ctx, users):
-        """"""
-        menu = MapVoteMenu(ctx, self.bot, users)
-        voted_map = await menu.vote()
-        return voted_map
-
     async def random_map(self, ctx):
         """"""
         config = await ctx.guild_config()
@@ -560,109 +1120,34 @@ class MatchCog(commands.Cog):
         map_pool = [m for m in self.all_maps if mp_dict[m.dev_name]]
         return random.choice(map_pool)
 
-    async def start_match(self, ctx, users):
-        """ Ready all the users up and start a match. """
-        # Notify everyone to ready up
-        user_mentions = ''.join(user.mention for user in users)
-        ready_emoji = '✅'
-        description = f'React with the {ready_emoji} below to ready up (1 min)'
-        burst_embed = self.bot.embed_template(title='Queue has filled up!', description=description)
-        ready_message = await ctx.send(user_mentions, embed=burst_embed)
-        await ready_message.add_reaction(ready_emoji)
-
-        # Wait for everyone to ready up
-        reactors = set()  # Track who has readied up
-
-        def all_ready(reaction, user):
-            """ Check if all players in the queue have readied up. """
-            # Check if this is a reaction we care about
-            if reaction.message.id != ready_message.id or user not in users or reaction.emoji != ready_emoji:
-                return False
+    def start_match(self, ctx, users, stats=None):
+        """ Move the popped users into a new match, run its lifecycle in the background and return it. """
+        match = Match(self, ctx, users, stats)
+        self._register(match)
+        return match
 
-            reactors.add(user)
-
-            if reactors.issuperset(users):  # All queued users have reacted
-                return True
-            else:
-                return False
-
-        try:
-            if ctx.guild in self.pending_ready_tasks:
-                self.pending_ready_tasks[ctx.guild].close()
+    def _register(self, match):
+        """ Add a match to the registry and start its lifecycle task. """
+        self.matches[match.id] = match
 
-            self.pending_ready_tasks[ctx.guild] = self.bot.wait_for('reaction_add', timeout=60.0, check=all_ready)
-            await self.pending_ready_tasks[ctx.guild]
-        except asyncio.TimeoutError:  # Not everyone readied up
-            unreadied = set(users) - reactors
-            awaitables = [
-                ready_message.clear_reactions(),
-                ctx.dequeue_users(*unreadied)
-            ]
-            await asyncio.gather(*awaitables, loop=self.bot.loop)
-            description = '\n'.join(':heavy_multiplication_x:  ' + user.mention for user in unreadied)
-            title = 'Not everyone was ready!'
-            burst_embed = self.bot.embed_template(title=title, description=description)
-            burst_embed.set_footer(text='The missing players have been removed from the queue')
-            await ready_message.edit(embed=burst_embed)
-            return False  # Not everyone readied up
-        else:  # Everyone readied up
-            self.pending_ready_tasks.pop(ctx.guild)
-            # Attempt to make teams and start match
-            awaitables = [
-                ready_message.clear_reactions(),
-                ctx.guild_config()
-            ]
-            results = await asyncio.gather(*awaitables, loop=self.bot.loop)
-            team_method = results[1].team_method
-            map_method = results[1].map_method
-
-            ready_ctx = await self.bot.get_context(ready_message)
-
-            # Create teams
-            if team_method == TeamMethod.AUTOBALANCE:
-                team_one, team_two = await self.autobalance_teams(users)
-            elif team_method == TeamMethod.CAPTAINS:
-                team_one, team_two = await self.draft_teams(ready_ctx, users)
-            elif team_method == TeamMethod.RANDOM:
-                team_one, team_two = await self.randomize_teams(users)
-            else:
-                raise ValueError(f'Team method "{team_method}" isn\'t valid')
-
-            # Get map pick
-            if map_method == MapMethod.CAPTAINS:
-                map_pick = await self.draft_maps(ready_ctx, team_one[0], team_two[0])
-            elif map_method == MapMethod.VOTE:
-                map_pick = await self.vote_maps(ready_ctx, users)
-            elif map_method == MapMethod.RANDOM:
-                map_pick = await self.random_map(ctx)
-            else:
-                raise ValueError(f'Map method "{map_method}" isn\'t valid')
+        for user in match.users:
+            self.match_players[user.id] = match
 
-            burst_embed = self.bot.embed_template(description='Fetching server...')
-            await ready_message.edit(embed=burst_embed)
+        match.start().add_done_callback(lambda task: self._match_done(match, task))
 
-            # Check if able to get a match server and edit message embed accordingly
-            try:
-                match = await MatchServer.new_match(team_one, team_two, map_pick.dev_name)  # API start match
-            except aiohttp.ClientResponseError as e:
-                description = 'Sorry! Looks like there aren\'t any servers available at this time. ' \
-                              'Please try again later.'
-                burst_embed = self.bot.embed_template(title='There was a problem!', description=description)
-                traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)  # Print exception to stderr
-            else:
-                description = f'URL: {match.connect_url}\nCommand: `{match.connect_command}`'
-                burst_embed = self.bot.embed_template(title='Match server is ready!', description=description)
-                burst_embed.set_author(name=f'Match #{match.id}', url=match.match_page, icon_url=map_pick.icon_url)
+    def _match_done(self, match, task):
+        """ Remove a match from the registry once its lifecycle task is over and log any exception. """
+        self.matches.pop(match.id, None)
 
-                for team in [team_one, team_two]:
-                    team_name = f'__Team {team[0].display_name}__'
-                    burst_embed.add_field(name=team_name, value='\n'.join(user.mention for user in team))
+        for user in match.users:
+            if self.match_players.get(user.id) is match:
+                self.match_players.pop(user.id)
 
-                burst_embed.set_thumbnail(url=map_pick.image_url)
-                burst_embed.set_footer(text='Server will close after 5 minutes if anyone doesn\'t join')
+        if not task.cancelled() and task.exception() is not None:
+            logging_cog = self.bot.get_cog('LoggingCog')
 
-            await ready_message.edit(embed=burst_embed)
-            return True  # Everyone readied up
+            if logging_cog is not None:
+                logging_cog.log_exception(f'Uncaught exception in match {match.id}:', task.exception())
 
     @commands.command(usage='teams [{captains|autobalance|random}]',
                       brief='Set or view the team creation method (need admin perms)')
@@ -754,17 +1239,74 @@ class MatchCog(commands.Cog):
         embed = self.bot.embed_template(title=title)
         await ctx.send(embed=embed)
 
+    @commands.command(brief='View the match server pool utilisation (need admin perms)')
+    @commands.has_permissions(administrator=True)
+    async def servers(self, ctx):
+        """ Display how many pooled match servers are in each state. """
+        if self.bot.server_pool is None:
+            embed = self.bot.embed_template(title='Match servers are provided by the API without a local pool')
+        else:
+            metrics = self.bot.server_pool.utilisation()
+            description = '```ml\n' \
+                          f' Free:          {metrics["free"]:>5} \n' \
+                          f' Reserved:      {metrics["reserved"]:>5} \n' \
+                          f' In Match:      {metrics["in_match"]:>5} \n' \
+                          f' Draining:      {metrics["draining"]:>5} \n' \
+                          f' Utilisation:   {metrics["utilisation"] * 100:>4.0f}% ' \
+                          '```'
+            embed = self.bot.embed_template(title='Match server pool', description=description)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(usage='drain <ip>:<port> ...',
+                      brief='Stop handing out pooled match servers and shut them down once free (need owner perms)')
+    @commands.is_owner()
+    async def drain(self, ctx, *addresses):
+        """ Drain pooled match servers so they're decommissioned once their current match is over. """
+        if self.bot.server_pool is None:
+            embed = self.bot.embed_template(title='Match servers are provided by the API without a local pool')
+            await ctx.send(embed=embed)
+            return
+
+        drained = []
+        unknown = []
+
+        for address in addresses:
+            ip, _, port = address.rpartition(':')
+            server = self.bot.server_pool.find(ip, int(port)) if port.isdigit() else None
+
+            if server is None:
+                unknown.append(address)
+            else:
+                await self.bot.server_pool.drain(server)
+                drained.append(address)
+
+        title = f'Draining {", ".join(drained) if drained else "no servers"}'
+
+        if unknown:
+            title += f' ({", ".join(unknown)} not in the pool)'
+
+        embed = self.bot.embed_template(title=title)
+        await ctx.send(embed=embed)
+
+    @servers.error
+    async def servers_error(self, ctx, error):
+        """ Respond to a permissions error with an explanation message. """
+        if isinstance(error, commands.MissingPermissions):
+            missing_perm = error.missing_perms[0].replace('_', ' ')
+            embed = self.bot.embed_template(title=f'Cannot view the server pool without {missing_perm} permission!')
+            await ctx.send(embed=embed, priority=Priority.INFO)
+
     @teams.error
     @captains.error
     @maps.error
     async def config_error(self, ctx, error):
         """ Respond to a permissions error with an explanation message. """
         if isinstance(error, commands.MissingPermissions):
-            await ctx.trigger_typing()
             missing_perm = error.missing_perms[0].replace('_', ' ')
             title = f'Cannot set {ctx.command.name} method without {missing_perm} permission!'
             embed = self.bot.embed_template(title=title)
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, priority=Priority.INFO)
 
     @commands.command(usage='mpool {+|-}<map name> ...',
                       brief='Add or remove maps from the map pool (need admin perms)')
@@ -0,0 +1,124 @@
+# metrics.py
+
+from aiohttp import web
+from discord.ext import commands
+import logging
+import math
+
+from .utils.metrics import COMMAND_SECONDS, METRICS, Counter, Gauge
+
+
+class MetricsCog(commands.Cog):
+    """ Cog timing commands and serving the bot's metrics in the Prometheus text format. """
+
+    def __init__(self, bot):
+        """ Set attributes. """
+        self.bot = bot
+        self.runner = None
+        self.port = bot.settings.metrics_port + (bot.cluster_id or 0)  # Each worker of a cluster gets its own port
+        self.logger = logging.getLogger('csgoleague.metrics')
+
+        self.app = web.Application()
+        self.app.router.add_get('/metrics', self.get_metrics)
+
+        METRICS.register(Gauge('csgoleague_active_matches', 'Matches being set up or played',
+                               function=lambda: {(): len(self._matches())}))
+        METRICS.register(Gauge('csgoleague_match_states', 'Matches being set up or played by state', ('state',),
+                               function=self._match_states))
+        METRICS.register(Gauge('csgoleague_in_match_players', 'Players in a live match',
+                               function=lambda: {(): len(self.bot.in_match)}))
+        METRICS.register(Gauge('csgoleague_guilds', 'Guilds the bot is in',
+                               function=lambda: {(): len(self.bot.guilds)}))
+        METRICS.register(Gauge('csgoleague_shard_latency_seconds', 'Heartbeat latency of each shard', ('shard',),
+                               function=self._latencies))
+        METRICS.register(Gauge('csgoleague_outbound_writes', 'Discord writes waiting in the outbound scheduler',
+                               ('priority',), function=self._outbound_depths))
+        METRICS.register(Counter('csgoleague_outbound_writes_total', 'Discord writes the outbound scheduler handled',
+                                 ('result',), function=self._outbound_metrics))
+        METRICS.register(Counter('csgoleague_typing_total', 'Commands that deferred and fired the typing indicator',
+                                 ('result',), function=self._typing_metrics))
+        METRICS.register(Gauge('csgoleague_db_replica_lag_seconds',
+                               'Most seconds the database replica is behind the primary',
+                               function=self._replica_lag))
+        METRICS.register(Counter('csgoleague_db_reads_total', 'Database reads routed to the primary or the replica',
+                                 ('pool',), function=self._db_reads))
+        METRICS.register(Counter('csgoleague_log_records_dropped_total',
+                                 'Log records dropped because the log queue was full',
+                                 function=self._log_records_dropped))
+
+    def cog_unload(self):
+        """ Stop serving the metrics. """
+        self.bot.loop.create_task(self.close())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """ Start serving the metrics the first time the bot is ready. """
+        if self.runner is not None:
+            return
+
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.bot.settings.metrics_host, self.port)
+        await site.start()
+        self.logger.info(f'Serving metrics on {self.bot.settings.metrics_host}:{self.port}')
+
+    async def close(self):
+        """ Stop the endpoint. """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        ctx.invoked_at = self.bot.loop.time()
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        COMMAND_SECONDS.observe(self.bot.loop.time() - ctx.invoked_at, ctx.command.qualified_name, 'ok')
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        # Errors raised before the command is invoked, e.g. for unknown commands, aren't timed
+        if getattr(ctx, 'invoked_at', None) is not None:
+            COMMAND_SECONDS.observe(self.bot.loop.time() - ctx.invoked_at, ctx.command.qualified_name, 'error')
+
+    async def get_metrics(self, request):
+        """ Handle a scrape of the metrics. """
+        return web.Response(text=METRICS.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    def _matches(self):
+        match_cog = self.bot.get_cog('MatchCog')
+        return [] if match_cog is None else list(match_cog.matches.values())
+
+    def _match_states(self):
+        states = {}
+
+        for match in self._matches():
+            key = (match.state.name.lower(),)
+            states[key] = states.get(key, 0) + 1
+
+        return states
+
+    def _latencies(self):
+        return {(str(shard_id),): latency for shard_id, latency in self.bot.latencies if not math.isnan(latency)}
+
+    def _outbound_depths(self):
+        return {(priority,): depth for priority, depth in self.bot.outbound.depths().items()}
+
+    def _outbound_metrics(self):
+        return {(result,): count for result, count in self.bot.outbound.metrics.items()}
+
+    def _typing_metrics(self):
+        return {(result,): count for result, count in self.bot.typing_metrics.items()}
+
+    def _replica_lag(self):
+        lag = self.bot.db_reads.lag
+        return {} if lag is None else {(): lag}
+
+    def _db_reads(self):
+        return {(pool,): count for pool, count in self.bot.db_reads.reads.items()}
+
+    @staticmethod
+    def _log_records_dropped():
+        return {(): sum(getattr(handler, 'dropped', 0) for handler in logging.getLogger().handlers)}
@@ -1,23 +1,135 @@
 # queue.py
 
 from discord.ext import commands
-import discord
+import aiohttp
 import asyncio
 from datetime import datetime, timedelta, timezone
+import logging
 import re
 
-from .utils import Player
+from .utils import DBHelper, Player, PlayerStats, Priority, QueueDisplay
 
 
 class QueueCog(commands.Cog):
     """ Cog to manage queues of players among multiple servers. """
 
     time_arg_pattern = re.compile(r'\b((?:(?P<days>[0-9]+)d)|(?:(?P<hours>[0-9]+)h)|(?:(?P<minutes>[0-9]+)m))\b')
+    prefetch_margin = 2  # Refresh the queued players' stats once the queue is this many players from popping
+    stats_max_age = 300  # Seconds before a queued player's stats are considered stale
+    ban_expiry_interval = 300  # Seconds between deleting the bans that have expired
 
     def __init__(self, bot):
         """ Set attributes. """
         self.bot = bot
-        self.last_queue_msgs = {}
+        self.display = QueueDisplay(bot, self.queue_embed)
+        self.queued_stats = {}  # Stats and the loop time they were fetched at by guild ID then user ID
+        self.prefetch_tasks = {}
+        self.prefetch_pending = set()  # IDs of the guilds with players who joined while their stats were fetched
+        self.expiry_task = None
+        self.logger = logging.getLogger('csgoleague.queue')
+
+    def cog_unload(self):
+        """ Stop deleting expired bans. """
+        self.close()
+
+    def close(self):
+        """ Stop deleting expired bans. """
+        if self.expiry_task is not None:
+            self.expiry_task.cancel()
+            self.expiry_task = None
+
+    def cache_stats(self, guild, *players_stats):
+        """ Keep the stats of queued players so the match doesn't have to fetch them again. """
+        guild_stats = self.queued_stats.setdefault(guild.id, {})
+        fetched_at = self.bot.loop.time()
+
+        for player_stats in players_stats:
+            guild_stats[player_stats.discord] = (player_stats, fetched_at)
+
+    def uncache_stats(self, guild, *users):
+        """ Forget the stats of users that have left the queue and return them by user ID. """
+        guild_stats = self.queued_stats.get(guild.id, {})
+        return {user.id: guild_stats.pop(user.id)[0] for user in users if user is not None and user.id in guild_stats}
+
+    def expire_stats(self, *user_ids):
+        """ Mark the cached stats of users in any guild's queue as stale so they are fetched again. """
+        for guild_stats in self.queued_stats.values():
+            for user_id in user_ids:
+                if user_id in guild_stats:
+                    guild_stats[user_id] = (guild_stats[user_id][0], float('-inf'))
+
+    def prefetch_stats(self, ctx, queued_users, capacity):
+        """ Fetch the queued players' stats in the background once the queue is about to pop. """
+        if capacity - len(queued_users) > self.prefetch_margin:
+            return
+
+        task = self.prefetch_tasks.get(ctx.guild.id)
+
+        if task is None or task.done():
+            self.prefetch_tasks[ctx.guild.id] = self.bot.loop.create_task(self._prefetch(ctx))
+        else:  # Fetch the players who joined since once the running fetch is done
+            self.prefetch_pending.add(ctx.guild.id)
+
+    async def _prefetch(self, ctx):
+        """ Refresh the queued players' stats until no one has joined since the last refresh and return them all. """
+        players_stats = []
+
+        while True:
+            self.prefetch_pending.discard(ctx.guild.id)
+            players_stats += await self._refresh_stats(ctx)
+
+            if ctx.guild.id not in self.prefetch_pending:
+                return players_stats
+
+    async def _refresh_stats(self, ctx):
+        """ Fetch the stats of the queued players who have none cached or whose cached stats have gone stale. """
+        guild_stats = self.queued_stats.setdefault(ctx.guild.id, {})
+        now = self.bot.loop.time()
+        stale = [user for user in await ctx.queued_users()
+                 if user.id not in guild_stats or now - guild_stats[user.id][1] > self.stats_max_age]
+
+        if not stale:
+            return []
+
+        try:
+            players_stats = [x async for x in PlayerStats.from_users(stale)]
+        except aiohttp.ClientError as e:
+            self.logger.warning(f'Unable to refresh the stats of queued players in guild {ctx.guild.id}: {e}')
+            return []
+
+        # Only keep the stats of players who are still queued, a pop takes the rest from the returned stats
+        queued_ids = {user.id for user in await ctx.queued_users()}
+        self.cache_stats(ctx.guild, *(x for x in players_stats if x.discord in queued_ids))
+        return players_stats
+
+    async def _popped_stats(self, ctx, users):
+        """ Get the stats of a popped queue's players, waiting for a fetch in progress and fetching any it missed. """
+        stats = self.uncache_stats(ctx.guild, *users)
+        task = self.prefetch_tasks.pop(ctx.guild.id, None)
+        self.prefetch_pending.discard(ctx.guild.id)
+
+        if task is not None and not task.cancelled():
+            try:
+                prefetched = await task
+            except Exception as e:
+                self.logger.warning(f'Unable to prefetch the stats of popped players in guild {ctx.guild.id}: {e}')
+                prefetched = []
+
+            user_ids = {user.id for user in users}
+
+            for player_stats in prefetched:
+                if player_stats.discord in user_ids:
+                    stats.setdefault(player_stats.discord, player_stats)
+
+        missing = [user for user in users if user.id not in stats]
+
+        if missing:
+            try:
+                stats.update({x.discord: x async for x in PlayerStats.from_users(missing)})
+            except aiohttp.ClientError as e:  # The match fetches them again
+                self.logger.warning(f'Unable to fetch the stats of popped players in guild {ctx.guild.id}: {e}')
+
+        return stats
 
     async def queue_embed(self, ctx, title=None):
         """ Method to create the queue embed for a guild. """
@@ -36,17 +148,32 @@ class QueueCog(commands.Cog):
         embed.set_footer(text='Players will receive a notification when the queue fills up')
         return embed
 
-    async def update_last_msg(self, ctx, embed):
-        """ Send embed message and delete the last one sent. """
-        msg = self.last_queue_msgs.get(ctx.guild)
+    async def _expire_bans_loop(self):
+        """ Periodically delete the bans that have expired, which are already ignored when reading the bans. """
+        while True:
+            await asyncio.sleep(self.ban_expiry_interval)
 
-        if msg is not None:
             try:
-                await msg.delete()
-            except discord.errors.NotFound:
-                pass
-
-        self.last_queue_msgs[ctx.guild] = await ctx.send(embed=embed)
+                async with self.bot.db_pool.acquire() as conn:
+                    expired = await DBHelper(conn).delete_expired_banned_users()
+            except Exception as e:
+                self.logger.error(f'Unable to delete expired bans: {e}')
+                continue
+
+            if expired:
+                self.logger.info(f'Deleted {expired} expired bans')
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """ Start deleting expired bans the first time the bot is ready. """
+        if self.expiry_task is None:
+            self.expiry_task = self.bot.loop.create_task(self._expire_bans_loop())
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """ Count the messages sent after each guild's queue display. """
+        if message.guild is not None:
+            self.display.message_sent(message)
 
     @commands.command(brief='Join the queue')
     async def join(self, ctx):
@@ -57,16 +184,14 @@ class QueueCog(commands.Cog):
             title = f'Unable to add **{ctx.author.display_name}**: Their account is not linked'
         else:  # Message author is linked
             awaitables = [
-                player.get_stats(),
                 ctx.queued_users(),
                 ctx.guild_config(),
                 ctx.queue_banlist()
             ]
-            results = await asyncio.gather(*awaitables, loop=self.bot.loop)
-            player_stats = results[0]
-            queued_users = results[1]
-            capacity = results[2].capacity
-            banned_users = results[3]
+            results = await asyncio.gather(*awaitables)
+            queued_users = results[0]
+            capacity = results[1].capacity
+            banned_users = results[2]
 
             if ctx.author in banned_users:  # Author is banned from joining the queue
                 title = f'Unable to add **{ctx.author.display_name}**: Banned'
@@ -79,38 +204,57 @@ class QueueCog(commands.Cog):
                 title = f'Unable to add **{ctx.author.display_name}**: Already in the queue'
             elif len(queued_users) >= capacity:  # Queue full
                 title = f'Unable to add **{ctx.author.display_name}**: Queue is full'
-            elif not player_stats:  # Couldn't get player from API TODO: Remove this and raise exception in ApiHelper
-                title = f'Unable to add **{ctx.author.display_name}**: Cannot verify match status'
-            elif player_stats.in_match:  # User is already in a match
+            elif self.bot.get_cog('MatchCog').player_match(ctx.author) is not None:  # User is setting up a match
+                title = f'Unable to add **{ctx.author.display_name}**: Already in a match'
+            elif ctx.author in self.bot.in_match:  # User is already in a match
                 title = f'Unable to add **{ctx.author.display_name}**: Already in a match'
             else:  # User can be added
                 await ctx.enqueue_users(ctx.author)
                 queued_users += [ctx.author]
                 title = f'**{ctx.author.display_name}** has been added to the queue'
 
-                # Check and burst queue if full
+                # Check and burst queue if full, the display then shows the emptied queue
                 if len(queued_users) == capacity:
-                    match_cog = self.bot.get_cog('MatchCog')
+                    await self.pop_queue(ctx, queued_users)
+                else:
+                    self.prefetch_stats(ctx, queued_users, capacity)
+
+        # Update queue display message
+        self.display.update(ctx, title)
+
+    async def pop_queue(self, ctx, queued_users):
+        """ Move a full queue into a new match and free the queue immediately. """
+        popped = await ctx.dequeue_users(*queued_users)
+
+        if len(popped) != len(queued_users):  # Another pop has already taken some of these users
+            await ctx.enqueue_users(*popped)
+            return None
 
-                    try:
-                        all_readied = await match_cog.start_match(ctx, queued_users)
-                    except asyncio.TimeoutError:
-                        return
+        # Get every player's stats before the match starts so the draft doesn't have to fetch any
+        stats = await self._popped_stats(ctx, queued_users)
+        return self.bot.get_cog('MatchCog').start_match(ctx, queued_users, stats)
 
-                    if all_readied:
-                        await ctx.empty_queue()
+    async def requeue(self, ctx, users, stats=None):
+        """ Put users back in the queue after their match fell through, popping it again if it fills up. """
+        queued_users = await ctx.queued_users()
+        capacity = (await ctx.guild_config()).capacity
+        users = [user for user in users if user not in queued_users][:capacity - len(queued_users)]
 
-                    return
+        if not users:
+            return
 
-        embed = await self.queue_embed(ctx, title)
+        await ctx.enqueue_users(*users)
+        self.cache_stats(ctx.guild, *(stats[user.id] for user in users if stats and user.id in stats))
+        queued_users += users
 
-        # Delete last queue message
-        await self.update_last_msg(ctx, embed)
+        if len(queued_users) == capacity:
+            await self.pop_queue(ctx, queued_users)
 
     @commands.command(brief='Leave the queue')
     async def leave(self, ctx):
         """ Check if the member can be remobed from the guild and remove them if so. """
         removed = await ctx.dequeue_users(ctx.author)
+        self.uncache_stats(ctx.guild, *removed)
         name = ctx.author.nick if ctx.author.nick is not None else ctx.author.display_name
 
         if ctx.author in removed:
@@ -118,19 +262,15 @@ class QueueCog(commands.Cog):
         else:
             title = f'**{name}** isn\'t in the queue'
 
-        embed = await self.queue_embed(ctx, title)
-
         # Update queue display message
-        await self.update_last_msg(ctx, embed)
+        self.display.update(ctx, title)
 
     @commands.command(brief='Display who is currently in the queue')
     async def view(self, ctx):
         """ Display the queue as an embed list of mentioned names. """
         title = 'Players in queue for PUGs'
-        embed = await self.queue_embed(ctx, title)
-
         # Update queue display message
-        await self.update_last_msg(ctx, embed)
+        self.display.update(ctx, title)
 
     @commands.command(usage='remove <user mention>',
                       brief='Remove the mentioned user from the queue (need server kick perms)')
@@ -144,6 +284,7 @@ class QueueCog(commands.Cog):
             await ctx.send(embed=embed)
         else:
             removed = await ctx.dequeue_users(removee)
+            self.uncache_stats(ctx.guild, *removed)
             name = removee.nick if removee.nick is not None else removee.display_name
 
             if removee in removed:
@@ -151,30 +292,25 @@ class QueueCog(commands.Cog):
             else:
                 title = f'**{name}** is not in the queue'
 
-            embed = await self.queue_embed(ctx, title)
-
             # Update queue display message
-            await self.update_last_msg(ctx, embed)
+            self.display.update(ctx, title)
 
     @commands.command(brief='Empty the queue (need server kick perms)')
     @commands.has_permissions(kick_members=True)
     async def empty(self, ctx):
         """ Reset the guild queue list to empty. """
-        await ctx.empty_queue()
-        embed = await self.queue_embed(ctx, 'The queue has been emptied')
-
+        self.uncache_stats(ctx.guild, *await ctx.empty_queue())
         # Update queue display message
-        await self.update_last_msg(ctx, embed)
+        self.display.update(ctx, 'The queue has been emptied')
 
     @remove.error
     @empty.error
     async def remove_error(self, ctx, error):
         """ Respond to a permissions error with an explanation message. """
         if isinstance(error, commands.MissingPermissions):
-            await ctx.trigger_typing()
             missing_perm = error.missing_perms[0].replace('_', ' ')
             embed = self.bot.embed_template(title=f'Cannot remove players without {missing_perm} permission!')
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, priority=Priority.INFO)
 
     @commands.command(usage='cap [<new capacity>]',
                       brief='Set or view the capacity of the queue (need admin perms)')
@@ -202,7 +338,7 @@ class QueueCog(commands.Cog):
                     title = f'Capacity is outside of valid range ({lower_bound}-{upper_bound})'
                     embed = self.bot.embed_template(title=title)
                 else:
-                    await ctx.empty_queue()
+                    self.uncache_stats(ctx.guild, *await ctx.empty_queue())
                     await ctx.set_guild_config(capacity=new_cap)
                     embed = self.bot.embed_template(title=f'Queue capacity set to {new_cap}')
                     embed.set_footer(text='The queue has been emptied because of the capacity change')
@@ -213,10 +349,9 @@ class QueueCog(commands.Cog):
     async def cap_error(self, ctx, error):
         """ Respond to a permissions error with an explanation message. """
         if isinstance(error, commands.MissingPermissions):
-            await ctx.trigger_typing()
             missing_perm = error.missing_perms[0].replace('_', ' ')
             embed = self.bot.embed_template(title=f'Cannot change queue capacity without {missing_perm} permission!')
-            await ctx.send(embed=embed)
+            await ctx.send(embed=embed, priority=Priority.INFO)
 
     @staticmethod
     def timedelta_str(tdelta):
@@ -264,7 +399,7 @@ class QueueCog(commands.Cog):
         await ctx.ban_from_queue(*ctx.message.mentions, unban_time=unban_time)
 
         # Remove banned users from the queue
-        await ctx.dequeue_users(*ctx.message.mentions)
+        self.uncache_stats(ctx.guild, *await ctx.dequeue_users(*ctx.message.mentions))
 
         # Generate embed and send message
         banned_users_str = ', '.join(f'**{user.display_name}**' for user in ctx.message.mentions)
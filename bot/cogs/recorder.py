@@ -0,0 +1,70 @@
+# recorder.py
+
+import asyncio
+from discord.ext import commands
+import logging
+import os
+
+from .utils.recording import EventRecorder
+
+
+class RecorderCog(commands.Cog):
+    """ Cog recording the messages and reactions the bot receives to replay in benchmarks. """
+
+    flush_interval = 1.0  # Seconds between writes to the recording
+
+    def __init__(self, bot):
+        """ Set attributes. """
+        self.bot = bot
+        self.recorder = None  # Created once the bot knows its own user
+        self.task = None
+        self.logger = logging.getLogger('csgoleague.recorder')
+
+        # Each worker of a cluster gets its own file
+        self.path = bot.settings.record_file
+
+        if bot.cluster_id is not None:
+            root, ext = os.path.splitext(self.path)
+            self.path = f'{root}.{bot.cluster_id}{ext}'
+
+    def cog_unload(self):
+        """ Stop recording. """
+        self.bot.loop.create_task(self.close())
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """ Start recording the first time the bot is ready. """
+        if self.recorder is not None:
+            return
+
+        self.recorder = EventRecorder(self.path, self.bot.user.id, self.bot.command_prefix, self.bot.loop)
+        self.task = self.bot.loop.create_task(self._flush_loop())
+        self.logger.info(f'Recording messages and reactions to {self.path}')
+
+    async def close(self):
+        """ Stop recording and write the events that haven't been written. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        if self.recorder is not None:
+            await self.recorder.flush()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if self.recorder is not None and message.guild is not None and message.author != self.bot.user:
+            self.recorder.record_message(message)
+
+    @commands.Cog.listener()
+    async def on_reaction_add(self, reaction, user):
+        if self.recorder is not None and reaction.message.guild is not None and user != self.bot.user:
+            self.recorder.record_reaction(reaction, user)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            try:
+                await self.recorder.flush()
+            except OSError as e:
+                self.logger.error(f'Unable to write to the recording {self.path}: {e}')
@@ -3,8 +3,6 @@
 from discord.ext import commands
 import math
 
-from .utils import PlayerStats
-
 
 def align_text(text, length, align='center'):
     """ Center the text within whitespace of input length. """
@@ -37,21 +35,22 @@ class StatsCog(commands.Cog):
 
     @commands.command(brief='See your stats')
     async def stats(self, ctx):
-        """ Send an embed containing stats data parsed from the player object returned from the API. """
+        """ Send an embed containing the player's stats from their match history or the API. """
 
         try:
             user = ctx.message.mentions[0]
         except IndexError:
             user = ctx.author
 
-        stats = await PlayerStats.from_user(user)
+        stats = await self.bot.history.get_stats([user])
 
         if stats:
+            stats = stats[0]
             win_percent_str = f'{stats.win_percent * 100:.2f}%'
             hs_percent_str = f'{stats.hs_percent * 100:.2f}%'
             fb_percent_str = f'{stats.first_blood_rate * 100:.2f}%'
             description = '```ml\n' \
-                          f' RankMe Score:      {stats.score:>6} \n' \
+                          f' {stats.score_name + ":":<18} {stats.score:>6} \n' \
                           f' Matches Played:    {stats.matches_played:>6} \n' \
                           f' Win Percentage:    {win_percent_str:>6} \n' \
                           f' KD Ratio:          {stats.kd_ratio:>6.2f} \n' \
@@ -60,7 +59,12 @@ class StatsCog(commands.Cog):
                           f' First Blood Rate:  {fb_percent_str:>6} ' \
                           '```'
             embed = self.bot.embed_template(description=description)
-            embed.set_author(name=user.display_name, url=stats.league_profile, icon_url=user.avatar_url_as(size=128))
+            author = {'name': user.display_name, 'icon_url': user.avatar_url_as(size=128)}
+
+            if stats.league_profile:
+                author['url'] = stats.league_profile
+
+            embed.set_author(**author)
         else:
             title = f'Unable to get **{ctx.author.display_name}**\'s stats: Their account not linked'
             embed = self.bot.embed_template(title=title)
@@ -69,23 +73,18 @@ class StatsCog(commands.Cog):
 
     @commands.command(brief='See the top players in the server')
     async def leaders(self, ctx):
-        """ Send an embed containing the leaderboard data parsed from the player objects returned from the API. """
+        """ Send an embed containing the leaderboard of the players rated from their local match history. """
         num = 5  # Easily modfiy the number of players on the leaderboard
-        players_stats = [x async for x in PlayerStats.from_users(ctx.guild.members)]
+        # Players without local history only have API scores, which aren't on the rating scale, so they're left out
+        players_stats = await self.bot.history.get_leaders(ctx.guild, num)
 
         if not players_stats:
             embed = self.bot.embed_template(title='Nobody on this server is ranked!')
             await ctx.send(embed=embed)
         else:
-            players_stats.sort(key=lambda u: (u.score, u.matches_played), reverse=True)
-
-            # Select the top players only
-            if len(players_stats) > num:
-                players_stats = players_stats[:num]
-
             # Generate leaderboard text
             data = [['Player'] + ctx._get_members([player.discord for player in players_stats]),
-                    ['Score'] + [str(player.score) for player in players_stats],
+                    ['Rating'] + [str(player.score) for player in players_stats],
                     ['Winrate'] + [f'{player.win_percent * 100:.2f}%' for player in players_stats],
                     ['Played'] + [str(player.matches_played) for player in players_stats]]
             data[0] = [data[0][0]] + \
@@ -107,3 +106,13 @@ class StatsCog(commands.Cog):
             title = '__CS:GO League Server Leaderboard__'
             embed = self.bot.embed_template(title=title, description=description)
             await ctx.send(embed=embed)
+
+    @commands.command(brief='Recompute every rating from the match history (need owner perms)')
+    @commands.is_owner()
+    async def recompute(self, ctx):
+        """ Replay the whole match history to rebuild the local ratings. """
+        start = self.bot.loop.time()
+        rated = await self.bot.ratings.recompute()
+        title = f'Recomputed the ratings of {rated} players in {self.bot.loop.time() - start:.2f}s'
+        embed = self.bot.embed_template(title=title)
+        await ctx.send(embed=embed)
@@ -1,21 +1,57 @@
 # __init__.py
 
+from .checkpoint import MatchCheckpointer
 from .config import TeamMethod, CaptainMethod, MapMethod
 from .context import LeagueContext
 from .db import DBHelper
+from .history import MatchHistory, MatchResult
+from .in_match import InMatchRegistry
+from .lag import LoopLagMonitor
 from .map import Map, MapPool
-from .player import Player, PlayerStats
-from .server import MatchServer
+from .metrics import API_TRACE_CONFIG, METRICS, MeteredPool, instrument_http
+from .outbound import OutboundScheduler, Priority
+from .player import LocalPlayerStats, Player, PlayerStats
+from .profiler import AllocationTracer, SamplingProfiler
+from .queue_display import QueueDisplay
+from .rating import RatingEngine
+from .replica import ReplicaRouter
+from .server import MatchServer, ServerReservation
+from .server_pool import ApiServerRegistry, FakeServerRegistry, ServerPool, ServerState
+from .tracing import TRACER, trace_http
 
 __all__ = [
+    MatchCheckpointer,
     TeamMethod,
     CaptainMethod,
     MapMethod,
     LeagueContext,
     DBHelper,
+    MatchHistory,
+    MatchResult,
+    InMatchRegistry,
+    LoopLagMonitor,
     Map,
     MapPool,
+    API_TRACE_CONFIG,
+    METRICS,
+    MeteredPool,
+    instrument_http,
+    OutboundScheduler,
+    Priority,
+    LocalPlayerStats,
     Player,
     PlayerStats,
-    MatchServer
+    AllocationTracer,
+    SamplingProfiler,
+    QueueDisplay,
+    RatingEngine,
+    ReplicaRouter,
+    MatchServer,
+    ServerReservation,
+    ApiServerRegistry,
+    FakeServerRegistry,
+    ServerPool,
+    ServerState,
+    TRACER,
+    trace_http
 ]
@@ -0,0 +1,87 @@
+# checkpoint.py
+
+import asyncio
+import logging
+
+from .db import DBHelper
+
+
+class MatchCheckpointer:
+    """
+    Collects match state changes and writes them to the matches table in
+    batches so that checkpointing doesn't add latency to picks, bans or votes.
+    """
+
+    def __init__(self, bot, interval: float = 1.0):
+        """ Set attributes. """
+        self.bot = bot
+        self.interval = interval
+        self.pending = {}  # Matches with unsaved changes by match ID
+        self.deleted = set()  # IDs of matches whose checkpoints should be removed
+        self.task = None
+        self.logger = logging.getLogger('csgoleague.checkpoint')
+
+    def mark(self, match) -> None:
+        """ Schedule a match's current state to be written on the next flush. """
+        self.deleted.discard(match.id)
+        self.pending[match.id] = match
+
+    def discard(self, match_id) -> None:
+        """ Schedule a finished match's checkpoint to be deleted on the next flush. """
+        self.pending.pop(match_id, None)
+        self.deleted.add(match_id)
+
+    def start(self) -> None:
+        """ Start flushing checkpoints in the background. """
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """ Periodically flush the pending checkpoints. """
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f'Unable to write match checkpoints: {e}')
+
+    async def flush(self) -> None:
+        """ Write all pending checkpoints and deletions in a single transaction each. """
+        if not self.pending and not self.deleted:
+            return
+
+        # Snapshot the rows now so changes made while writing are picked up by the next flush
+        matches = list(self.pending.values())
+        rows = [match.checkpoint_row for match in matches]
+        deleted = list(self.deleted)
+        self.pending.clear()
+        self.deleted.clear()
+
+        try:
+            async with self.bot.db_pool.acquire() as conn:
+                db_helper = DBHelper(conn)
+
+                if rows:
+                    await db_helper.upsert_matches(*rows)
+
+                if deleted:
+                    await db_helper.delete_matches(*deleted)
+        except Exception:
+            # Retry on the next flush unless the match has changed or finished in the meantime
+            for match in matches:
+                if match.id not in self.deleted:
+                    self.pending.setdefault(match.id, match)
+
+            self.deleted.update(match_id for match_id in deleted if match_id not in self.pending)
+            raise
+
+        self.logger.debug(f'Wrote {len(rows)} match checkpoints and deleted {len(deleted)}')
+
+    async def close(self) -> None:
+        """ Stop the background task and write anything that is still pending. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        await self.flush()
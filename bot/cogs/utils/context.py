@@ -1,5 +1,6 @@
 # context.py
 
+import asyncio
 import datetime
 import discord
 from discord.ext import commands
@@ -8,17 +9,45 @@ from typing import Dict, List
 from .config import GuildConfig
 from .db import DBHelper
 from .map import MapPool
+from .outbound import Priority
 
 
 class LeagueContext(commands.Context):
     """
     Custom context for the bot to implement streamlined database access.
     """
+    typing_task = None
+
+    def defer_typing(self, delay: float) -> None:
+        """ Start the typing indicator only if the command hasn't sent anything after a delay. """
+        self.cancel_typing()
+        self.typing_task = self.bot.loop.create_task(self._delayed_typing(delay))
+
+    def cancel_typing(self) -> None:
+        """ Stop a deferred typing indicator from starting. """
+        if self.typing_task is not None:
+            self.typing_task.cancel()
+            self.typing_task = None
+
+    async def _delayed_typing(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self.bot.typing_metrics['fired'] += 1
+
+        try:
+            await self.trigger_typing()
+        except discord.HTTPException:
+            pass
+
+    async def send(self, *args, priority: Priority = Priority.NORMAL, **kwargs) -> discord.Message:
+        """ Override parent method to send through the outbound scheduler and stop the deferred typing indicator. """
+        self.cancel_typing()
+        return await self.bot.outbound.submit(self.channel, super().send(*args, **kwargs), priority)
+
     def _get_members(self, user_ids: List[int]) -> List[discord.Member]:
         return [self.guild.get_member(user_id) for user_id in user_ids]
 
     async def queued_users(self) -> List[discord.Member]:
-        async with self.bot.db_pool.acquire() as conn:
+        async with self.bot.db_reads.acquire(self.guild.id) as conn:
             user_ids = await DBHelper(conn).get_queued_users(self.guild.id)
 
         return self._get_members(user_ids)
@@ -31,20 +60,26 @@ class LeagueContext(commands.Context):
             await db_helper.insert_users(*user_ids)
             await db_helper.insert_queued_users(self.guild.id, *user_ids)
 
+        self.bot.db_reads.wrote(self.guild.id)
+
     async def dequeue_users(self, *users: discord.User) -> List[discord.Member]:
         async with self.bot.db_pool.acquire() as conn:
             dequeued_ids = await DBHelper(conn).delete_queued_users(self.guild.id, *[user.id for user in users])
 
+        self.bot.db_reads.wrote(self.guild.id)
+
         return self._get_members(dequeued_ids)
 
     async def empty_queue(self) -> List[discord.Member]:
         async with self.bot.db_pool.acquire() as conn:
             cleared_ids = await DBHelper(conn).clear_queued_users(self.guild.id)
 
+        self.bot.db_reads.wrote(self.guild.id)
+
         return self._get_members(cleared_ids)
 
     async def queue_banlist(self) -> Dict[discord.Member, datetime.datetime]:
-        async with self.bot.db_pool.acquire() as conn:
+        async with self.bot.db_reads.acquire(self.guild.id) as conn:
             banned_dict = await DBHelper(conn).get_banned_users(self.guild.id)
 
         return {self.guild.get_member(user_id): time for user_id, time in banned_dict.items()}
@@ -57,14 +92,18 @@ class LeagueContext(commands.Context):
             await db_helper.insert_users(*user_ids)
             await db_helper.insert_banned_users(self.guild.id, *user_ids, unban_time=unban_time)
 
+        self.bot.db_reads.wrote(self.guild.id)
+
     async def unban_from_queue(self, *users: discord.User) -> List[discord.Member]:
         async with self.bot.db_pool.acquire() as conn:
             unbanned_ids = await DBHelper(conn).delete_banned_users(self.guild.id, *[user.id for user in users])
 
+        self.bot.db_reads.wrote(self.guild.id)
+
         return self._get_members(unbanned_ids)
 
     async def guild_config(self) -> GuildConfig:
-        async with self.bot.db_pool.acquire() as conn:
+        async with self.bot.db_reads.acquire(self.guild.id) as conn:
             guild_data = await DBHelper(conn).get_guild(self.guild.id)
 
         return GuildConfig.from_dict(guild_data)
@@ -79,3 +118,5 @@ class LeagueContext(commands.Context):
 
         async with self.bot.db_pool.acquire() as conn:
             await DBHelper(conn).update_guild(self.guild.id, **guild_data)
+
+        self.bot.db_reads.wrote(self.guild.id)
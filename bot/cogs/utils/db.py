@@ -1,6 +1,13 @@
 # db.py
 
+import datetime
 
+from .metrics import DB_QUERY_SECONDS, timed_methods
+from .tracing import traced_methods
+
+
+@timed_methods(DB_QUERY_SECONDS)
+@traced_methods('db')
 class DBHelper:
     """ Class to contain database query wrapper functions. """
 
@@ -44,7 +51,7 @@ class DBHelper:
 
     async def insert_guilds(self, *guild_ids):
         """ Add a list of guilds into the guilds table and return the ones successfully added. """
-        rows = [tuple([guild_id] + [None] * 14) for guild_id in guild_ids]
+        rows = [tuple([guild_id] + [None] * 16) for guild_id in guild_ids]
         statement = (
             'INSERT INTO guilds (id)\n'
             '    (SELECT id FROM unnest($1::guilds[]))\n'
@@ -70,10 +77,21 @@ class DBHelper:
 
         return self._get_record_attrs(deleted, 'id')
 
-    async def sync_guilds(self, *guild_ids):
-        """ Synchronizes the guilds table with the guilds in the bot. """
+    async def get_applied_migrations(self):
+        """ Get the IDs of the migrations that have been applied to the database. """
+        statement = (
+            'SELECT migration_id FROM _yoyo_migration;'
+        )
+
+        async with self.conn.transaction():
+            applied = await self.conn.fetch(statement)
+
+        return self._get_record_attrs(applied, 'migration_id')
+
+    async def sync_guilds(self, *guild_ids, shard_ids=None, shard_count=None):
+        """ Synchronizes the guilds table with the guilds in the bot, only deleting guilds of the given shards. """
 
-        insert_rows = [tuple([guild_id] + [None] * 14) for guild_id in guild_ids]
+        insert_rows = [tuple([guild_id] + [None] * 16) for guild_id in guild_ids]
         insert_statement = (
             'INSERT INTO guilds (id)\n'
             '    (SELECT id FROM unnest($1::guilds[]))\n'
@@ -83,12 +101,13 @@ class DBHelper:
         delete_statement = (
             'DELETE FROM guilds\n'
             '    WHERE id::BIGINT != ALL($1::BIGINT[])\n'
+            '    AND ($2::INTEGER[] IS NULL OR ((id >> 22) % $3)::INTEGER = ANY($2::INTEGER[]))\n'
             '    RETURNING id;'
         )
 
         async with self.conn.transaction():
             inserted = await self.conn.fetch(insert_statement, insert_rows)
-            deleted = await self.conn.fetch(delete_statement, guild_ids)
+            deleted = await self.conn.fetch(delete_statement, guild_ids, shard_ids, shard_count)
 
         return self._get_record_attrs(inserted, 'id'), self._get_record_attrs(deleted, 'id')
 
@@ -169,21 +188,14 @@ class DBHelper:
         return self._get_record_attrs(deleted, 'user_id')
 
     async def get_banned_users(self, guild_id):
-        """ Get all the banned users of the guild from the banned_users table. """
-        delete_statement = (
-            'DELETE FROM banned_users\n'
-            '    WHERE guild_id = $1 AND CURRENT_TIMESTAMP > unban_time;'
-        )
-        select_statement = (
+        """ Get the users of the guild whose ban hasn't expired from the banned_users table. """
+        statement = (
             'SELECT * FROM banned_users\n'
-            '    WHERE guild_id = $1;'
+            '    WHERE guild_id = $1 AND (unban_time IS NULL OR unban_time >= CURRENT_TIMESTAMP);'
         )
 
         async with self.conn.transaction():
-            await self.conn.execute(delete_statement, guild_id)
-
-        async with self.conn.transaction():
-            queue = await self.conn.fetch(select_statement, guild_id)
+            queue = await self.conn.fetch(statement, guild_id)
 
         return dict(zip(self._get_record_attrs(queue, 'user_id'), self._get_record_attrs(queue, 'unban_time')))
 
@@ -214,6 +226,18 @@ class DBHelper:
 
         return self._get_record_attrs(deleted, 'user_id')
 
+    async def delete_expired_banned_users(self):
+        """ Delete the bans that have expired in every guild from the banned_users table and return how many. """
+        statement = (
+            'DELETE FROM banned_users\n'
+            '    WHERE unban_time < CURRENT_TIMESTAMP;'
+        )
+
+        async with self.conn.transaction():
+            deleted = await self.conn.execute(statement)
+
+        return int(deleted.split()[-1])
+
     async def get_guild(self, guild_id):
         """ Get a guild's row from the guilds table. """
         return await self._get_row('guilds', guild_id)
@@ -221,3 +245,306 @@ class DBHelper:
     async def update_guild(self, guild_id, **data):
         """ Update a guild's row in the guilds table. """
         return await self._update_row('guilds', guild_id, **data)
+
+    async def get_matches(self, *guild_ids):
+        """ Get the checkpointed matches of a list of guilds from the matches table. """
+        statement = (
+            'SELECT * FROM matches\n'
+            '    WHERE guild_id = ANY($1::BIGINT[]);'
+        )
+
+        async with self.conn.transaction():
+            matches = await self.conn.fetch(statement, guild_ids)
+
+        return [{col: val for col, val in rec.items()} for rec in matches]
+
+    async def upsert_matches(self, *rows):
+        """ Insert or update multiple match checkpoints in the matches table. """
+        statement = (
+            'INSERT INTO matches (id, guild_id, channel_id, message_id, state, users, team_one, team_two, map_pick,\n'
+            '                     draft, deadline)\n'
+            '    VALUES($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)\n'
+            '    ON CONFLICT (id) DO UPDATE\n'
+            '    SET message_id = EXCLUDED.message_id,\n'
+            '        state = EXCLUDED.state,\n'
+            '        team_one = EXCLUDED.team_one,\n'
+            '        team_two = EXCLUDED.team_two,\n'
+            '        map_pick = EXCLUDED.map_pick,\n'
+            '        draft = EXCLUDED.draft,\n'
+            '        deadline = EXCLUDED.deadline,\n'
+            '        updated_at = CURRENT_TIMESTAMP;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.executemany(statement, rows)
+
+    async def delete_matches(self, *match_ids):
+        """ Delete multiple match checkpoints from the matches table. """
+        statement = (
+            'DELETE FROM matches\n'
+            '    WHERE id = ANY($1::UUID[])\n'
+            '    RETURNING id;'
+        )
+
+        async with self.conn.transaction():
+            deleted = await self.conn.fetch(statement, match_ids)
+
+        return self._get_record_attrs(deleted, 'id')
+
+    async def get_game_servers(self):
+        """ Get all the rows of the game_servers table. """
+        statement = 'SELECT * FROM game_servers;'
+
+        async with self.conn.transaction():
+            servers = await self.conn.fetch(statement)
+
+        return [{col: val for col, val in rec.items()} for rec in servers]
+
+    async def get_match_game_server(self, match_id):
+        """ Get the row of the game server hosting a match from the game_servers table, if any. """
+        statement = 'SELECT * FROM game_servers WHERE match_id = $1;'
+
+        async with self.conn.transaction():
+            server = await self.conn.fetchrow(statement, match_id)
+
+        return None if server is None else {col: val for col, val in server.items()}
+
+    async def insert_game_servers(self, *addresses):
+        """ Insert multiple (ip, port) addresses into the game_servers table and return the new rows. """
+        statement = (
+            'INSERT INTO game_servers (ip, port)\n'
+            '    VALUES($1, $2)\n'
+            '    ON CONFLICT (ip, port) DO UPDATE\n'
+            '    SET updated_at = CURRENT_TIMESTAMP\n'
+            '    RETURNING *;'
+        )
+        inserted = []
+
+        async with self.conn.transaction():
+            for ip, port in addresses:
+                inserted.append(await self.conn.fetchrow(statement, ip, port))
+
+        return [{col: val for col, val in rec.items()} for rec in inserted]
+
+    async def claim_game_server(self, server_id, expires_at):
+        """ Reserve a game server if it is still free and return whether it was. """
+        statement = (
+            'UPDATE game_servers\n'
+            '    SET state = \'reserved\', expires_at = $2, updated_at = CURRENT_TIMESTAMP\n'
+            '    WHERE id = $1 AND state = \'free\'\n'
+            '    RETURNING id;'
+        )
+
+        async with self.conn.transaction():
+            claimed = await self.conn.fetchval(statement, server_id, expires_at)
+
+        return claimed is not None
+
+    async def update_game_server(self, server_id, **data):
+        """ Update a game server's row in the game_servers table. """
+        data['updated_at'] = datetime.datetime.now(datetime.timezone.utc)
+        return await self._update_row('game_servers', server_id, **data)
+
+    async def reclaim_game_servers(self):
+        """ Free the reserved or in-match game servers whose timeout has passed and return their IDs. """
+        statement = (
+            'UPDATE game_servers\n'
+            '    SET state = \'free\', match_id = null, expires_at = null, updated_at = CURRENT_TIMESTAMP\n'
+            '    WHERE expires_at < CURRENT_TIMESTAMP AND state IN (\'reserved\', \'in_match\')\n'
+            '    RETURNING id;'
+        )
+
+        async with self.conn.transaction():
+            reclaimed = await self.conn.fetch(statement)
+
+        return self._get_record_attrs(reclaimed, 'id')
+
+    async def delete_game_servers(self, *server_ids):
+        """ Delete multiple game servers from the game_servers table. """
+        statement = (
+            'DELETE FROM game_servers\n'
+            '    WHERE id = ANY($1::INTEGER[])\n'
+            '    RETURNING id;'
+        )
+
+        async with self.conn.transaction():
+            deleted = await self.conn.fetch(statement, server_ids)
+
+        return self._get_record_attrs(deleted, 'id')
+
+    async def get_ratings(self, *user_ids):
+        """ Get the ratings and rated match counts of multiple users from the player_ratings table. """
+        statement = (
+            'SELECT user_id, rating, matches FROM player_ratings\n'
+            '    WHERE user_id = ANY($1::BIGINT[]);'
+        )
+
+        async with self.conn.transaction():
+            ratings = await self.conn.fetch(statement, user_ids)
+
+        return {rec['user_id']: (rec['rating'], rec['matches']) for rec in ratings}
+
+    async def upsert_ratings(self, *rows):
+        """ Insert or update multiple (user_id, rating, matches) rows in the player_ratings table. """
+        statement = (
+            'INSERT INTO player_ratings (user_id, rating, matches)\n'
+            '    (SELECT * FROM unnest($1::player_ratings[]))\n'
+            '    ON CONFLICT (user_id) DO UPDATE\n'
+            '    SET rating = EXCLUDED.rating, matches = EXCLUDED.matches;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.execute(statement, rows)
+
+    async def replace_ratings(self, rows):
+        """ Replace the whole player_ratings table with a list of (user_id, rating, matches) rows. """
+        async with self.conn.transaction():
+            await self.conn.execute('DELETE FROM player_ratings;')
+            await self.conn.copy_records_to_table('player_ratings', records=rows,
+                                                  columns=['user_id', 'rating', 'matches'])
+
+    async def insert_match_history(self, match_id, guild_id, map_name, team_one, team_two):
+        """ Insert a match that just started into the match_history table. """
+        statement = (
+            'INSERT INTO match_history (id, guild_id, map, team_one, team_two)\n'
+            '    VALUES($1, $2, $3, $4, $5)\n'
+            '    ON CONFLICT (id) DO NOTHING;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.execute(statement, match_id, guild_id, map_name, team_one, team_two)
+
+    async def finish_match_history(self, match_id, team_one, team_two, winner):
+        """ Set the result of a match in the match_history table and return whether it wasn't already set. """
+        statement = (
+            'INSERT INTO match_history (id, team_one, team_two, winner, finished_at)\n'
+            '    VALUES($1, $2, $3, $4, CURRENT_TIMESTAMP)\n'
+            '    ON CONFLICT (id) DO UPDATE\n'
+            '    SET winner = EXCLUDED.winner, finished_at = EXCLUDED.finished_at\n'
+            '    WHERE match_history.winner IS NULL\n'
+            '    RETURNING id;'
+        )
+
+        async with self.conn.transaction():
+            finished = await self.conn.fetchval(statement, match_id, team_one, team_two, winner)
+
+        return finished is not None
+
+    async def get_match_results(self):
+        """ Get the teams and winner of every finished match in the match_history table in the order they finished. """
+        statement = (
+            'SELECT team_one, team_two, winner FROM match_history\n'
+            '    WHERE winner IS NOT NULL\n'
+            '    ORDER BY finished_at, id;'
+        )
+
+        async with self.conn.transaction():
+            return await self.conn.fetch(statement)
+
+    async def insert_match_players(self, *rows):
+        """ Insert the stat lines of multiple players in a finished match into the match_players table. """
+        statement = (
+            'INSERT INTO match_players\n'
+            '    (SELECT * FROM unnest($1::match_players[]))\n'
+            '    ON CONFLICT (match_id, user_id) DO NOTHING;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.execute(statement, rows)
+
+    async def add_player_stats(self, *rows):
+        """ Add the results of multiple players in a finished match to their totals in the player_stats table. """
+        statement = (
+            'INSERT INTO player_stats\n'
+            '    (SELECT * FROM unnest($1::player_stats[]))\n'
+            '    ON CONFLICT (user_id) DO UPDATE\n'
+            '    SET wins = player_stats.wins + EXCLUDED.wins,\n'
+            '        draws = player_stats.draws + EXCLUDED.draws,\n'
+            '        losses = player_stats.losses + EXCLUDED.losses,\n'
+            '        kills = player_stats.kills + EXCLUDED.kills,\n'
+            '        deaths = player_stats.deaths + EXCLUDED.deaths,\n'
+            '        assists = player_stats.assists + EXCLUDED.assists,\n'
+            '        headshots = player_stats.headshots + EXCLUDED.headshots,\n'
+            '        damage = player_stats.damage + EXCLUDED.damage,\n'
+            '        rounds = player_stats.rounds + EXCLUDED.rounds,\n'
+            '        first_bloods = player_stats.first_bloods + EXCLUDED.first_bloods;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.execute(statement, rows)
+
+    async def get_player_stats(self, *user_ids):
+        """ Get the aggregated stats and rating of multiple users who have finished a match. """
+        statement = (
+            'SELECT player_stats.*, player_ratings.rating FROM player_stats\n'
+            '    LEFT JOIN player_ratings ON player_stats.user_id = player_ratings.user_id\n'
+            '    WHERE player_stats.user_id = ANY($1::BIGINT[]);'
+        )
+
+        async with self.conn.transaction():
+            stats = await self.conn.fetch(statement, user_ids)
+
+        return {rec['user_id']: dict(rec) for rec in stats}
+
+    async def get_leaders(self, limit, *user_ids):
+        """ Get the aggregated stats and rating of the highest rated of multiple users, highest first. """
+        statement = (
+            'SELECT player_stats.*, player_ratings.rating FROM player_stats\n'
+            '    JOIN player_ratings ON player_stats.user_id = player_ratings.user_id\n'
+            '    WHERE player_stats.user_id = ANY($1::BIGINT[])\n'
+            '    ORDER BY player_ratings.rating DESC, player_ratings.matches DESC\n'
+            '    LIMIT $2;'
+        )
+
+        async with self.conn.transaction():
+            leaders = await self.conn.fetch(statement, user_ids, limit)
+
+        return [dict(rec) for rec in leaders]
+
+    async def get_in_match(self):
+        """ Get the user ID, match ID and expiry time of every player in the in_match table that hasn't expired. """
+        statement = (
+            'SELECT user_id, match_id, expires_at FROM in_match\n'
+            '    WHERE expires_at > CURRENT_TIMESTAMP;'
+        )
+
+        async with self.conn.transaction():
+            return await self.conn.fetch(statement)
+
+    async def upsert_in_match(self, match_id, expires_at, *user_ids):
+        """ Insert or move multiple players into a match in the in_match table. """
+        statement = (
+            'INSERT INTO in_match (user_id, match_id, expires_at)\n'
+            '    (SELECT *, $2::BIGINT, $3::TIMESTAMP WITH TIME ZONE FROM unnest($1::BIGINT[]))\n'
+            '    ON CONFLICT (user_id) DO UPDATE\n'
+            '    SET match_id = EXCLUDED.match_id, expires_at = EXCLUDED.expires_at;'
+        )
+
+        async with self.conn.transaction():
+            await self.conn.execute(statement, user_ids, match_id, expires_at)
+
+    async def delete_in_match(self, *match_ids):
+        """ Delete the players of multiple matches from the in_match table and return their user IDs. """
+        statement = (
+            'DELETE FROM in_match\n'
+            '    WHERE match_id = ANY($1::BIGINT[])\n'
+            '    RETURNING user_id;'
+        )
+
+        async with self.conn.transaction():
+            deleted = await self.conn.fetch(statement, match_ids)
+
+        return self._get_record_attrs(deleted, 'user_id')
+
+    async def delete_expired_in_match(self):
+        """ Delete the players whose match has timed out from the in_match table and return their user IDs. """
+        statement = (
+            'DELETE FROM in_match\n'
+            '    WHERE expires_at <= CURRENT_TIMESTAMP\n'
+            '    RETURNING user_id;'
+        )
+
+        async with self.conn.transaction():
+            deleted = await self.conn.fetch(statement)
+
+        return self._get_record_attrs(deleted, 'user_id')
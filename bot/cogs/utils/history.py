@@ -0,0 +1,168 @@
+# history.py
+
+import discord
+import logging
+from typing import Dict, List
+
+from .db import DBHelper
+from .player import LocalPlayerStats, PlayerStats
+from .rating import TEAM_ONE_WIN, TEAM_TWO_WIN, DRAW
+
+
+class MatchResult:
+    """
+    Represents the reported result of a finished match.
+    """
+
+    outcomes = {TEAM_ONE_WIN: ((1, 0, 0), (0, 0, 1)), TEAM_TWO_WIN: ((0, 0, 1), (1, 0, 0)),
+                DRAW: ((0, 1, 0), (0, 1, 0))}  # (wins, draws, losses) of each team
+
+    def __init__(self, match_id: int, team_one: List[int], team_two: List[int], winner: int,
+                 players: Dict[int, dict] = None):
+        self.match_id = match_id
+        self.team_one = team_one
+        self.team_two = team_two
+        self.winner = winner
+        self.players = players or {}  # Stat lines by user ID
+
+        if winner not in self.outcomes:
+            raise ValueError(f'Winner "{winner}" isn\'t valid')
+
+    @classmethod
+    def from_dict(cls, result_data: dict) -> 'MatchResult':
+        """Create a MatchResult from a dictionary as posted by a game server.
+
+        Parameters
+        ----------
+        result_data : dict
+            Dictionary with the match ID, the Discord IDs of both teams, the
+            winner and optionally the players' stat lines by Discord ID.
+
+        Returns
+        -------
+        MatchResult
+        """
+        players = {int(user_id): {field: int(stat) for field, stat in line.items()}
+                   for user_id, line in result_data.get('players', {}).items()}
+        return cls(int(result_data['match_id']), [int(user_id) for user_id in result_data['team_one']],
+                   [int(user_id) for user_id in result_data['team_two']], int(result_data['winner']), players)
+
+    @property
+    def users(self) -> List[int]:
+        return self.team_one + self.team_two
+
+    def match_rows(self, fields):
+        """ Get the players' rows for the match_players table. """
+        return [(self.match_id, user_id, team_number, *self._line(user_id, fields))
+                for team_number, team in enumerate((self.team_one, self.team_two), start=1) for user_id in team]
+
+    def stats_rows(self, fields):
+        """ Get the rows to add to the players' totals in the player_stats table. """
+        return [(user_id, *outcome, *self._line(user_id, fields))
+                for team, outcome in zip((self.team_one, self.team_two), self.outcomes[self.winner])
+                for user_id in team]
+
+    def _line(self, user_id, fields):
+        """ Get a player's stat line with missing stats set to 0. """
+        line = self.players.get(user_id, {})
+        return [int(line.get(field, 0)) for field in fields]
+
+
+class MatchHistory:
+    """
+    Records the bot's matches and their results in the database and keeps
+    each player's stats aggregated so they can be read without the API.
+    """
+
+    stat_fields = ('kills', 'deaths', 'assists', 'headshots', 'damage', 'rounds', 'first_bloods')
+
+    def __init__(self, bot):
+        """ Set attributes. """
+        self.bot = bot
+        self.logger = logging.getLogger('csgoleague.history')
+
+    async def record_start(self, match_id: int, guild: discord.Guild, map_name: str, team_one: List[discord.Member],
+                           team_two: List[discord.Member]) -> None:
+        """ Save the teams and map of a match that just went live. """
+        async with self.bot.db_pool.acquire() as conn:
+            await DBHelper(conn).insert_match_history(match_id, guild.id, map_name,
+                                                      [user.id for user in team_one], [user.id for user in team_two])
+
+    async def record_result(self, result: 'MatchResult') -> bool:
+        """ Save the result of a finished match and return whether it was new. """
+        return bool(await self.record_results(result))
+
+    async def record_results(self, *results: 'MatchResult') -> List[int]:
+        """Save the results of finished matches in one transaction and update their players' stats and ratings.
+
+        Parameters
+        ----------
+        *results : MatchResult
+            Results in the order the matches finished. Results that were
+            already saved are skipped so reporting a match twice only counts
+            it once.
+
+        Returns
+        -------
+        list
+            IDs of the matches whose results were new.
+        """
+        ratings = self.bot.ratings
+        recorded = []
+        updated = {}
+
+        async with ratings.lock:
+            async with self.bot.db_pool.acquire() as conn:
+                db_helper = DBHelper(conn)
+
+                async with conn.transaction():
+                    for result in results:
+                        if not await db_helper.finish_match_history(result.match_id, result.team_one,
+                                                                    result.team_two, result.winner):
+                            continue
+
+                        await db_helper.insert_users(*result.team_one, *result.team_two)
+                        await db_helper.insert_match_players(*result.match_rows(self.stat_fields))
+                        await db_helper.add_player_stats(*result.stats_rows(self.stat_fields))
+                        updated.update(await ratings.update_ratings(db_helper, result.team_one, result.team_two,
+                                                                    result.winner))
+                        recorded.append(result.match_id)
+
+        ratings.cache_ratings(updated)
+
+        if recorded:
+            self.logger.info(f'Recorded the results of {len(recorded)} matches')
+
+        return recorded
+
+    async def get_leaders(self, guild: discord.Guild, limit: int) -> List[LocalPlayerStats]:
+        """ Get the stats of the highest rated members of a guild, only ranking those with local history. """
+        async with self.bot.db_reads.acquire(guild.id) as conn:
+            leaders = await DBHelper(conn).get_leaders(limit, *(member.id for member in guild.members))
+
+        return [LocalPlayerStats(stats_data) for stats_data in leaders]
+
+    async def get_stats(self, users: List[discord.abc.User]) -> List[PlayerStats]:
+        """Get the stats of multiple users, falling back to the API for users without any local match history.
+
+        Parameters
+        ----------
+        users : list
+            Users to get the stats of.
+
+        Returns
+        -------
+        list
+            The stats of the users with local history or a linked account,
+            in the same order as the users.
+        """
+        async with self.bot.db_pool.acquire() as conn:
+            local = await DBHelper(conn).get_player_stats(*(user.id for user in users))
+
+        stats = {user_id: LocalPlayerStats(stats_data) for user_id, stats_data in local.items()}
+        missing = [user for user in users if user.id not in stats]
+
+        if missing:
+            stats.update({x.discord: x async for x in PlayerStats.from_users(missing)})
+
+        return [stats[user.id] for user in users if user.id in stats]
@@ -0,0 +1,95 @@
+# in_match.py
+
+import asyncio
+import datetime
+import discord
+import logging
+from typing import Iterable, List
+
+from .db import DBHelper
+
+
+class InMatchRegistry:
+    """
+    Keeps the set of players on live match servers in memory so the queue
+    can check it without any round trip, and in the in_match table so it
+    survives restarts.
+    """
+
+    def __init__(self, bot, match_timeout: float = 5400, interval: float = 60):
+        """ Set attributes. """
+        self.bot = bot
+        self.match_timeout = match_timeout  # Longest a match is assumed to last without an end event
+        self.interval = interval
+        self.players = {}  # Match ID by user ID
+        self.task = None
+        self.logger = logging.getLogger('csgoleague.in_match')
+
+    def __contains__(self, user: discord.abc.User) -> bool:
+        return user.id in self.players
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    async def start(self) -> None:
+        """ Load the players still in a match and start expiring timed out matches in the background. """
+        await self.refresh()
+
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self._expire_loop())
+
+    async def close(self) -> None:
+        """ Stop expiring matches. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def refresh(self) -> None:
+        """ Reload the players in a match so changes made by other bot processes are picked up. """
+        async with self.bot.db_pool.acquire() as conn:
+            rows = await DBHelper(conn).get_in_match()
+
+        self.players = {row['user_id']: row['match_id'] for row in rows}
+
+    async def add(self, match_id: int, user_ids: Iterable[int]) -> None:
+        """ Mark the players of a match as in it until it ends or times out. """
+        user_ids = list(user_ids)
+        self.players.update(dict.fromkeys(user_ids, match_id))
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.match_timeout)
+
+        async with self.bot.db_pool.acquire() as conn:
+            await DBHelper(conn).upsert_in_match(match_id, expires_at, *user_ids)
+
+    async def remove(self, match_id: int) -> List[int]:
+        """ Clear the players of a match that ended and return their user IDs. """
+        self._forget(user_id for user_id, player_match in list(self.players.items()) if player_match == match_id)
+
+        async with self.bot.db_pool.acquire() as conn:
+            return await DBHelper(conn).delete_in_match(match_id)
+
+    async def expire(self) -> List[int]:
+        """ Clear the players of matches that timed out and return their user IDs. """
+        async with self.bot.db_pool.acquire() as conn:
+            expired = await DBHelper(conn).delete_expired_in_match()
+
+        self._forget(expired)
+
+        if expired:
+            self.logger.info(f'Cleared {len(expired)} players from matches that timed out')
+
+        return expired
+
+    def _forget(self, user_ids: Iterable[int]) -> None:
+        for user_id in list(user_ids):
+            self.players.pop(user_id, None)
+
+    async def _expire_loop(self):
+        """ Periodically clear timed out matches and resync the registry. """
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.expire()
+                await self.refresh()
+            except Exception as e:
+                self.logger.error(f'Unable to expire timed out matches: {e}')
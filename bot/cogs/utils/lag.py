@@ -0,0 +1,144 @@
+# lag.py
+
+import asyncio
+import collections
+from discord.ext import commands
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional
+
+from .metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+
+class LoopLagMonitor:
+    """
+    Samples how late the event loop runs a ticker to measure its scheduling
+    delay. A watchdog thread catches the loop while it's blocked for longer
+    than a threshold and captures the stack it's stuck in, so the stall can be
+    blamed on the cog and command that were running.
+    """
+
+    def __init__(self, bot, interval: float = 0.1, threshold: float = 0.25, max_stalls: int = 20):
+        """ Set attributes. """
+        self.bot = bot
+        self.interval = interval  # Seconds between ticks
+        self.threshold = threshold  # Seconds the loop has to be blocked for to capture the stall
+        self.samples = collections.deque(maxlen=600)  # Recent lags in seconds
+        self.stalls = collections.deque(maxlen=max_stalls)  # Recent stalls, newest last
+        self.beat = None  # Monotonic time of the last tick
+        self.captured = None  # Stall captured by the watchdog that the ticker hasn't reported yet
+        self.loop_thread_id = None
+        self.task = None
+        self.stopped = None
+        self.watchdog = None
+        self.logger = logging.getLogger('csgoleague.lag')
+
+    @property
+    def running(self) -> bool:
+        """ Check if the monitor is running. """
+        return self.task is not None
+
+    def start(self, threshold: float = None) -> None:
+        """ Start monitoring, optionally with a new stall threshold. """
+        if threshold is not None:
+            self.threshold = threshold
+
+        if self.running:
+            return
+
+        self.loop_thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self.captured = None
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(target=self._watch, args=(self.stopped,), name='loop-lag-watchdog',
+                                         daemon=True)
+        self.watchdog.start()
+        self.task = self.bot.loop.create_task(self._tick())
+
+    def stop(self) -> None:
+        """ Stop monitoring. """
+        if not self.running:
+            return
+
+        self.task.cancel()
+        self.task = None
+        self.stopped.set()
+        self.watchdog = None
+
+    def percentiles(self) -> Optional[dict]:
+        """ Get the median, 99th percentile and maximum of the recent lags in seconds. """
+        if not self.samples:
+            return None
+
+        ordered = sorted(self.samples)
+        return {
+            'p50': ordered[len(ordered) // 2],
+            'p99': ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+            'max': ordered[-1]
+        }
+
+    def recent_stalls(self, count: int = 5) -> List[dict]:
+        """ Get the most recent stalls, newest first. """
+        return list(reversed(self.stalls))[:count]
+
+    async def _tick(self):
+        """ Measure how late the loop wakes up from a sleep and report the stalls the watchdog captured. """
+        loop = self.bot.loop
+
+        while True:
+            expected = loop.time() + self.interval
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.samples.append(lag)
+            stall, self.captured = self.captured, None
+
+            if stall is not None:
+                stall['seconds'] = lag
+                self.stalls.append(stall)
+                LOOP_STALLS.inc(stall['cog'] or 'unknown', stall['command'] or 'none')
+                self.logger.warning(f'Event loop was blocked for {lag:.3f}s in cog {stall["cog"]} running command '
+                                    f'{stall["command"]}:\n' + ''.join(stall['stack']))
+
+    def _watch(self, stopped):
+        """ Capture the stack of the loop's thread once each time it's blocked for longer than the threshold. """
+        last_captured = None
+
+        while not stopped.wait(max(0.01, self.threshold / 4)):
+            beat = self.beat
+            blocked = time.monotonic() - beat - self.interval
+
+            if blocked < self.threshold or beat == last_captured:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+
+            if frame is not None:
+                last_captured = beat
+                self.captured = self._attribute(frame)
+
+    @staticmethod
+    def _attribute(frame) -> dict:
+        """ Find the innermost cog and command running in a stack. """
+        cog = command = None
+        stack = traceback.format_stack(frame)[-25:]
+
+        while frame is not None:
+            frame_locals = frame.f_locals
+            owner = frame_locals.get('self')
+
+            if cog is None and isinstance(owner, commands.Cog):
+                cog = owner.qualified_name
+
+            ctx = frame_locals.get('ctx')
+
+            if command is None and isinstance(ctx, commands.Context) and ctx.command is not None:
+                command = ctx.command.qualified_name
+
+            frame = frame.f_back
+
+        return {'time': time.time(), 'cog': cog, 'command': command, 'stack': stack}
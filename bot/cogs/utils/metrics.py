@@ -0,0 +1,259 @@
+# metrics.py
+
+import aiohttp
+import bisect
+import collections
+import discord
+import functools
+import inspect
+import re
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ''
+
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    """
+    Value that only goes up, counted separately for each combination of label
+    values. Counts kept elsewhere, e.g. in a Counter the bot already has, can
+    be read from a function when the metric is collected instead.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 function: Callable[[], Dict[Tuple[str, ...], float]] = None):
+        """ Set attributes. """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.function = function  # Returns the values by label values when the metric is collected
+        self.values = collections.defaultdict(float)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """ Add to the count of the label values. """
+        self.values[label_values] += amount
+
+    def samples(self) -> Iterable[str]:
+        values = self.values if self.function is None else self.function()
+
+        for label_values, value in values.items():
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    """ Value that can go up and down, set directly or read from a function when it's collected. """
+
+    type = 'gauge'
+
+    def set(self, value: float, *label_values: str) -> None:
+        """ Set the value of the label values. """
+        self.values[label_values] = value
+
+
+class Histogram:
+    """ Distribution of observed values, e.g. latencies, counted into cumulative buckets. """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """ Set attributes. """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = {}  # Observations in each bucket, the last one unbounded, by label values
+        self.sums = collections.defaultdict(float)  # Sum of the observations by label values
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """ Count an observation of the label values. """
+        counts = self.counts.get(label_values)
+
+        if counts is None:
+            counts = self.counts[label_values] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+
+    def samples(self) -> Iterable[str]:
+        for label_values, counts in self.counts.items():
+            total = 0
+
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                labels = _format_labels(self.labels, label_values, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {total}'
+
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(self.sums[label_values])}'
+            yield f'{self.name}_count{labels} {total}'
+
+
+class MetricsRegistry:
+    """ Collection of the metrics exposed by the bot. """
+
+    def __init__(self):
+        """ Set attributes. """
+        self.metrics = {}  # Metrics by name
+
+    def register(self, metric):
+        """ Add a metric, replacing any other with the same name, and return it. """
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """ Get the metrics in the Prometheus text exposition format. """
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+COMMAND_SECONDS = METRICS.register(Histogram('csgoleague_command_duration_seconds',
+                                             'Seconds from a command being invoked to it finishing',
+                                             ('command', 'outcome')))
+DB_QUERY_SECONDS = METRICS.register(Histogram('csgoleague_db_query_duration_seconds',
+                                              'Seconds each database helper method took', ('method', 'outcome')))
+DB_ACQUIRE_SECONDS = METRICS.register(Histogram('csgoleague_db_pool_acquire_seconds',
+                                                'Seconds spent waiting for a connection from the database pool'))
+API_REQUEST_SECONDS = METRICS.register(Histogram('csgoleague_api_request_duration_seconds',
+                                                 'Seconds each League API request took',
+                                                 ('method', 'endpoint', 'status')))
+DISCORD_REQUEST_SECONDS = METRICS.register(Histogram('csgoleague_discord_request_duration_seconds',
+                                                     'Seconds each Discord REST call took, including retries',
+                                                     ('method', 'route', 'status')))
+LOOP_LAG_SECONDS = METRICS.register(Histogram('csgoleague_loop_lag_seconds',
+                                              'Seconds the event loop ran the lag monitor\'s ticks late'))
+LOOP_STALLS = METRICS.register(Counter('csgoleague_loop_stalls_total',
+                                       'Times the event loop was blocked for longer than the lag threshold',
+                                       ('cog', 'command')))
+
+
+def timed_methods(histogram: Histogram):
+    """Class decorator that observes how long each of the class's public coroutine methods take.
+
+    Parameters
+    ----------
+    histogram : Histogram
+        Histogram with method and outcome labels to observe the durations in.
+    """
+    def wrap(method):
+        @functools.wraps(method)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+
+            try:
+                result = await method(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                histogram.observe(time.perf_counter() - start, method.__name__, outcome)
+
+        return timed
+
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(method):
+                setattr(cls, name, wrap(method))
+
+        return cls
+
+    return decorate
+
+
+class _TimedAcquire:
+    """ Pool acquire context that observes how long getting the connection took. """
+
+    def __init__(self, context):
+        self.context = context
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        conn = await self.context.__aenter__()
+        DB_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        return conn
+
+    async def __aexit__(self, *exc_info):
+        return await self.context.__aexit__(*exc_info)
+
+
+class MeteredPool:
+    """ Wraps an asyncpg pool to observe the time spent waiting for connections. """
+
+    def __init__(self, pool):
+        """ Set attributes. """
+        self.pool = pool
+
+    def acquire(self, *, timeout: float = None) -> _TimedAcquire:
+        """ Acquire a connection to use with ``async with``. """
+        return _TimedAcquire(self.pool.acquire(timeout=timeout))
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+def instrument_http(http: discord.http.HTTPClient) -> None:
+    """ Observe how long each of a discord.py HTTP client's REST calls take by route. """
+    request = http.request
+
+    @functools.wraps(request)
+    async def timed_request(route, **kwargs):
+        start = time.perf_counter()
+        status = 'error'
+
+        try:
+            result = await request(route, **kwargs)
+            status = 'ok'
+            return result
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        finally:
+            DISCORD_REQUEST_SECONDS.observe(time.perf_counter() - start, route.method, route.path, status)
+
+    http.request = timed_request
+
+
+async def _api_request_start(session, ctx, params):
+    ctx.start = time.perf_counter()
+
+
+async def _api_request_end(session, ctx, params):
+    endpoint = _ID_SEGMENT.sub('/{id}', params.url.path)  # Keep the number of label values bounded
+    API_REQUEST_SECONDS.observe(time.perf_counter() - ctx.start, params.method, endpoint,
+                                str(params.response.status))
+
+
+async def _api_request_exception(session, ctx, params):
+    endpoint = _ID_SEGMENT.sub('/{id}', params.url.path)
+    status = str(params.exception.status) if isinstance(params.exception, aiohttp.ClientResponseError) else 'error'
+    API_REQUEST_SECONDS.observe(time.perf_counter() - ctx.start, params.method, endpoint, status)
+
+
+API_TRACE_CONFIG = aiohttp.TraceConfig()
+API_TRACE_CONFIG.on_request_start.append(_api_request_start)
+API_TRACE_CONFIG.on_request_end.append(_api_request_end)
+API_TRACE_CONFIG.on_request_exception.append(_api_request_exception)
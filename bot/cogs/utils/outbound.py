@@ -0,0 +1,192 @@
+# outbound.py
+
+import asyncio
+import collections
+import discord
+import enum
+import logging
+from typing import Any, Awaitable, Dict
+
+from .tracing import TRACER
+
+
+class Priority(enum.IntEnum):
+    """ Enumerations of the classes of Discord writes, sent in this order. """
+    CRITICAL = 0  # Match flow players are waiting on
+    NORMAL = 1  # Command replies
+    INFO = 2  # Queue displays, error embeds and cleanup
+
+
+class OutboundScheduler:
+    """
+    Sends the bot's Discord writes from a fixed number of workers so bursts of
+    informational writes can't hold up the match flow. Waiting writes are sent
+    highest priority first, channels waiting with the same priority take turns
+    and each rate limit bucket only has one write in flight so a rate limited
+    channel can't tie up the workers other channels could use.
+    """
+
+    def __init__(self, bot, concurrency: int = 8):
+        """ Set attributes. """
+        self.bot = bot
+        self.concurrency = concurrency
+        self.lanes = [collections.OrderedDict() for _ in Priority]  # Waiting writes by bucket for each priority
+        self.busy = set()  # Buckets with a write in flight
+        self.cooldowns = {}  # Loop time rate limited buckets can be written to again by bucket
+        self.metrics = collections.Counter()  # Number of writes submitted, sent, failed and rate limited
+        self.wakeup = None
+        self.workers = []
+        self.logger = logging.getLogger('csgoleague.outbound')
+
+    async def submit(self, channel: discord.abc.Snowflake, coro: Awaitable, priority: Priority = Priority.NORMAL,
+                     route: str = 'messages') -> Any:
+        """Wait for a turn to send a Discord write and return its result.
+
+        Parameters
+        ----------
+        channel : discord.abc.Snowflake
+            Channel the write is made in.
+        coro : awaitable
+            The write, e.g. ``message.edit(embed=embed)``. It's only awaited
+            once it's dispatched and is closed if the submitter stops waiting
+            before then.
+        priority : Priority
+            Class of the write.
+        route : str
+            Discord rate limits writes to a channel's messages and reactions
+            separately so each gets its own bucket.
+
+        Returns
+        -------
+        Any
+            The result of the write.
+        """
+        self._start()
+        future = self.bot.loop.create_future()
+
+        # The time spent waiting for a turn is traced apart from the write, which runs in the span from a worker
+        with TRACER.span('outbound', 'outbound', priority=priority.name.lower()) as span:
+            self.lanes[priority].setdefault((channel.id, route), collections.deque()).append((coro, future, span))
+            self.metrics['submitted'] += 1
+            self.wakeup.set()
+            return await future
+
+    def depths(self) -> Dict[str, int]:
+        """ Get the number of waiting writes of each priority and the number in flight. """
+        depths = {priority.name.lower(): sum(len(requests) for requests in self.lanes[priority].values())
+                  for priority in Priority}
+        depths['in_flight'] = len(self.busy)
+        return depths
+
+    def channel_depths(self) -> Dict[int, int]:
+        """ Get the number of waiting writes of every channel with any. """
+        depths = collections.Counter()
+
+        for lane in self.lanes:
+            for (channel_id, _), requests in lane.items():
+                depths[channel_id] += len(requests)
+
+        return dict(depths)
+
+    async def close(self) -> None:
+        """ Stop the workers and cancel the writes that haven't been sent. """
+        for worker in self.workers:
+            worker.cancel()
+
+        self.workers = []
+
+        for lane in self.lanes:
+            for requests in lane.values():
+                for coro, future, _ in requests:
+                    coro.close()
+                    future.cancel()
+
+            lane.clear()
+
+    def _start(self):
+        """ Start the workers or replace those that have exited. """
+        if not self.workers:
+            self.wakeup = asyncio.Event()
+
+        # A write raising CancelledError without its worker being cancelled still ends the worker
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        self.workers.extend(self.bot.loop.create_task(self._worker())
+                            for _ in range(self.concurrency - len(self.workers)))
+
+    def _next(self):
+        """ Pop the next write to send or get the seconds until a rate limited bucket frees up if there is none. """
+        now = self.bot.loop.time()
+        delay = None
+
+        for lane in self.lanes:
+            for bucket, requests in lane.items():
+                if bucket in self.busy:
+                    continue
+
+                cooldown = self.cooldowns.get(bucket, 0) - now
+
+                if cooldown > 0:
+                    delay = cooldown if delay is None else min(delay, cooldown)
+                    continue
+
+                self.cooldowns.pop(bucket, None)
+                coro, future, span = requests.popleft()
+
+                # Give the other channels waiting with the same priority a turn before this one's next write
+                if requests:
+                    lane.move_to_end(bucket)
+                else:
+                    del lane[bucket]
+
+                if future.cancelled():  # Submitter stopped waiting
+                    coro.close()
+                    return self._next()
+
+                return (bucket, coro, future, span), None
+
+        return None, delay
+
+    async def _worker(self):
+        """ Send writes as long as there are any waiting. """
+        while True:
+            request, delay = self._next()
+
+            if request is None:
+                self.wakeup.clear()
+
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            bucket, coro, future, span = request
+            self.busy.add(bucket)
+
+            try:
+                with TRACER.use_span(span):
+                    result = await coro
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.metrics['failed'] += 1
+
+                # discord.py retries rate limited writes itself so keep the bucket clear once it gives up
+                if isinstance(e, discord.HTTPException) and e.status == 429:
+                    self.metrics['rate_limited'] += 1
+                    retry_after = float(e.response.headers.get('Retry-After', 1))
+                    self.cooldowns[bucket] = self.bot.loop.time() + retry_after
+                    self.logger.warning(f'Holding writes to channel {bucket[0]} for {retry_after}s')
+
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.metrics['sent'] += 1
+
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.busy.discard(bucket)
+                self.wakeup.set()
@@ -21,6 +21,8 @@ def catch_ZeroDivisionError(func):
 class PlayerStats:
     """ Represents a player with the contents returned by the API. """
 
+    score_name = 'RankMe Score'
+
     def __init__(self, player_data):
         """ Set attributes. """
 
@@ -203,6 +205,33 @@ class PlayerStats:
                 yield cls(player)
 
 
+class LocalPlayerStats(PlayerStats):
+    """ Represents a player with the stats aggregated from their match history in the database. """
+
+    score_name = 'Rating'
+
+    def __init__(self, stats_data):
+        """ Set attributes. """
+        self.discord = stats_data['user_id']
+        self.score = round(stats_data['rating'] or 0)
+        self.kills = stats_data['kills']
+        self.deaths = stats_data['deaths']
+        self.assists = stats_data['assists']
+        self.headshots = stats_data['headshots']
+        self.damage = stats_data['damage']
+        self.rounds_tr = stats_data['rounds']  # Rounds aren't split by side locally
+        self.rounds_ct = 0
+        self.first_blood = stats_data['first_bloods']
+        self.match_win = stats_data['wins']
+        self.match_draw = stats_data['draws']
+        self.match_lose = stats_data['losses']
+
+    @property
+    def league_profile(self):
+        """ Players are only known by their Discord ID locally so there's no profile link. """
+        return None
+
+
 class Player:
     def __init__(self, member: discord.Member) -> None:
         """
@@ -0,0 +1,166 @@
+# profiler.py
+
+import collections
+import datetime
+import functools
+import os
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple
+
+_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+_IDLE_FUNCTIONS = {('selectors.py', 'select'), ('selectors.py', 'poll'), ('selectors.py', 'control')}
+
+
+@functools.lru_cache(maxsize=None)
+def _short_path(path):
+    """ Shorten a source path to be relative to the repository or the installed package it's in. """
+    path = os.path.abspath(path)
+
+    if path.startswith(_ROOT_DIR + os.sep):
+        return os.path.relpath(path, _ROOT_DIR)
+
+    return os.path.join(*path.split(os.sep)[-2:])
+
+
+def _timestamp():
+    return datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+
+
+class SamplingProfiler:
+    """
+    Statistical CPU profiler that samples the stack of a thread, e.g. the
+    event loop's, from another thread. Nothing is traced between samples so
+    the profiled thread runs at full speed, and nothing runs at all while no
+    profile is being taken.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        """ Set attributes. """
+        self.thread_id = thread_id
+        self.interval = interval  # Seconds between samples
+        self.stacks = collections.Counter()  # Number of samples of each stack, outermost frame first
+        self.samples = 0
+        self.idle = 0  # Samples of the thread waiting for I/O
+
+    def run(self, duration: float) -> 'SamplingProfiler':
+        """ Sample the thread for a number of seconds, blocking the calling thread. """
+        end = time.monotonic() + duration
+
+        while time.monotonic() < end:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append((_short_path(code.co_filename), code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+
+            if stack:
+                self.samples += 1
+                leaf_file, _, leaf_name = stack[0]
+
+                if (os.path.basename(leaf_file), leaf_name) in _IDLE_FUNCTIONS:
+                    self.idle += 1
+                else:
+                    self.stacks[tuple(reversed(stack))] += 1
+
+            time.sleep(self.interval)
+
+        return self
+
+    def top_functions(self, count: int = 10) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """Get the functions the thread spent the most busy samples in.
+
+        Returns
+        -------
+        tuple
+            The functions with the most samples at the top of the stack and the
+            functions with the most samples anywhere in the stack, each as a list
+            of labels and sample counts.
+        """
+        own = collections.Counter()
+        cumulative = collections.Counter()
+
+        for stack, samples in self.stacks.items():
+            own[self._label(stack[-1])] += samples
+
+            # Leave out the event loop and the launcher that every sample passes through
+            for label in {self._label(frame) for frame in stack
+                          if frame[2] != '<module>' and frame[0].split(os.sep)[0] != 'asyncio'}:
+                cumulative[label] += samples
+
+        return own.most_common(count), cumulative.most_common(count)
+
+    def write(self, directory: str) -> str:
+        """ Write the sampled stacks in the collapsed format flame graph tools read and return the file's path. """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'cpu-{_timestamp()}.folded')
+
+        with open(path, 'w') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(';'.join(self._label(frame) for frame in stack) + f' {samples}\n')
+
+        return path
+
+    @staticmethod
+    def _label(frame):
+        path, line, name = frame
+        return f'{name} ({path}:{line})'
+
+
+class AllocationTracer:
+    """
+    Compares tracemalloc snapshots taken before and after a period to find the
+    code that allocated the most memory in between. Tracing is only switched on
+    for the period unless it was already on.
+    """
+
+    def __init__(self, frames: int = 10):
+        """ Set attributes. """
+        self.frames = frames  # Frames of traceback stored for each allocation
+        self.started = False  # Tracing was switched on by this tracer
+        self.before = None
+        self.after = None
+
+    def start(self) -> None:
+        """ Start tracing allocations and take the first snapshot. """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.started = True
+
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self) -> None:
+        """ Take the second snapshot and stop tracing if this tracer started it. """
+        self.after = tracemalloc.take_snapshot()
+
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+    def top_allocations(self, count: int = 10) -> List[tracemalloc.StatisticDiff]:
+        """ Get the source lines whose allocated memory grew the most between the snapshots. """
+        return self._diff('lineno')[:count]
+
+    def write(self, directory: str) -> str:
+        """ Write both snapshots and a report of the differences between them, returning the report's path. """
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f'memory-{_timestamp()}')
+        self.before.dump(f'{prefix}-before.snapshot')
+        self.after.dump(f'{prefix}-after.snapshot')
+        path = f'{prefix}-diff.txt'
+
+        with open(path, 'w') as f:
+            for stat in self._diff('traceback')[:100]:
+                f.write(f'{stat}\n')
+
+                for line in stat.traceback.format():
+                    f.write(f'    {line}\n')
+
+        return path
+
+    def _diff(self, key_type):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<unknown>')]
+        return self.after.filter_traces(filters).compare_to(self.before.filter_traces(filters), key_type)
@@ -0,0 +1,116 @@
+# queue_display.py
+
+import discord
+import logging
+
+from .db import DBHelper
+from .outbound import Priority
+
+
+class QueueDisplay:
+    """
+    Keeps a single queue embed per guild up to date by editing it in place
+    while it's still near the bottom of its channel, only re-posting it once
+    it has scrolled away. Updates requested while a render is in flight are
+    coalesced into one render of the latest queue.
+    """
+
+    def __init__(self, bot, make_embed, recent_messages: int = 5):
+        """ Set attributes. """
+        self.bot = bot
+        self.make_embed = make_embed  # Coroutine function taking a context and title that returns the queue embed
+        self.recent_messages = recent_messages  # Messages after the display before it's considered scrolled away
+        self.displays = {}  # [channel ID, message ID, messages sent after it] by guild ID
+        self.pending = {}  # Latest requested (context, title) by guild ID
+        self.tasks = {}
+        self.logger = logging.getLogger('csgoleague.queue')
+
+    def update(self, ctx, title: str = None):
+        """ Request a render of the guild's queue, returning the task that will render it. """
+        self.pending[ctx.guild.id] = (ctx, title)
+        task = self.tasks.get(ctx.guild.id)
+
+        if task is None or task.done():
+            task = self.tasks[ctx.guild.id] = self.bot.loop.create_task(self._render_loop(ctx.guild))
+
+        return task
+
+    def message_sent(self, message: discord.Message) -> None:
+        """ Count a message sent in a guild to tell when its display has scrolled away. """
+        display = self.displays.get(message.guild.id)
+
+        if display is not None and display[0] == message.channel.id and display[1] != message.id:
+            display[2] += 1
+
+    async def _render_loop(self, guild):
+        """ Render until no updates were requested during the last render. """
+        while guild.id in self.pending:
+            ctx, title = self.pending.pop(guild.id)
+
+            try:
+                await self._render(ctx, title)
+            except discord.HTTPException as e:
+                self.logger.warning(f'Unable to update the queue display in guild {guild.id}: {e}')
+
+    async def _load(self, guild):
+        """ Get the display saved for a guild, counting the messages sent after it while the bot was down. """
+        if guild.id in self.displays:
+            return self.displays[guild.id]
+
+        async with self.bot.db_reads.acquire(guild.id) as conn:
+            guild_data = await DBHelper(conn).get_guild(guild.id)
+
+        channel = guild.get_channel(guild_data['queue_channel_id'] or 0)
+        display = None
+
+        if channel is not None and guild_data['queue_message_id'] is not None:
+            message_id = guild_data['queue_message_id']
+
+            if channel.last_message_id == message_id:
+                messages_since = 0
+            else:
+                history = channel.history(limit=self.recent_messages + 1, after=discord.Object(message_id))
+
+                try:
+                    messages_since = len(await history.flatten())
+                except discord.HTTPException:
+                    messages_since = self.recent_messages + 1  # Re-post it if the channel can't be read
+
+            display = [channel.id, message_id, messages_since]
+
+        self.displays[guild.id] = display
+        return display
+
+    async def _render(self, ctx, title):
+        """ Edit the display in place if it's recent in the command's channel, otherwise re-post it. """
+        embed = await self.make_embed(ctx, title)
+        display = await self._load(ctx.guild)
+
+        if display is not None:
+            channel_id, message_id, messages_since = display
+
+            if channel_id == ctx.channel.id and messages_since <= self.recent_messages:
+                try:
+                    message = ctx.channel.get_partial_message(message_id)
+                    await self.bot.outbound.submit(ctx.channel, message.edit(embed=embed), Priority.INFO)
+                    return
+                except discord.NotFound:
+                    pass
+            else:
+                channel = ctx.guild.get_channel(channel_id)
+
+                try:
+                    if channel is not None:
+                        message = channel.get_partial_message(message_id)
+                        await self.bot.outbound.submit(channel, message.delete(), Priority.INFO)
+                except discord.NotFound:
+                    pass
+
+        message = await ctx.send(embed=embed, priority=Priority.INFO)
+        self.displays[ctx.guild.id] = [message.channel.id, message.id, 0]
+
+        async with self.bot.db_pool.acquire() as conn:
+            await DBHelper(conn).update_guild(ctx.guild.id, queue_channel_id=message.channel.id,
+                                              queue_message_id=message.id)
+
+        self.bot.db_reads.wrote(ctx.guild.id)
@@ -0,0 +1,276 @@
+# rating.py
+
+import asyncio
+import itertools
+import logging
+import numpy as np
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from .db import DBHelper
+
+TEAM_ONE_WIN = 1
+TEAM_TWO_WIN = 2
+DRAW = 0
+
+
+def _pad_teams(teams: Sequence[Sequence[int]]) -> np.ndarray:
+    """ Pack teams of player indexes into a 2D array padded with -1. """
+    sizes = np.fromiter(map(len, teams), dtype=np.int64, count=len(teams))
+    padded = np.full((len(teams), sizes.max(initial=0)), -1, dtype=np.int64)
+    mask = np.arange(padded.shape[1]) < sizes[:, None]
+    padded[mask] = np.fromiter(itertools.chain.from_iterable(teams), dtype=np.int64, count=sizes.sum())
+    return padded
+
+
+def schedule_waves(team_one: np.ndarray, team_two: np.ndarray, num_players: int) -> np.ndarray:
+    """Group matches into waves in which no player appears twice.
+
+    Every match is put in the wave after the latest wave any of its players
+    last played in, so processing the waves in order updates each player's
+    rating in the same order as replaying the matches one by one.
+
+    Parameters
+    ----------
+    team_one : np.ndarray
+        Player indexes of each match's first team, padded with -1.
+    team_two : np.ndarray
+        Player indexes of each match's second team, padded with -1.
+    num_players : int
+        Number of distinct players.
+
+    Returns
+    -------
+    np.ndarray
+        The wave number of each match.
+    """
+    last_wave = [-1] * (num_players + 1)  # Padding indexes the extra slot at the end, which is never set
+    get_wave = last_wave.__getitem__
+    waves = []
+
+    for row in np.concatenate((team_one, team_two), axis=1).tolist():
+        wave = max(map(get_wave, row)) + 1
+
+        for player in row:
+            if player >= 0:
+                last_wave[player] = wave
+
+        waves.append(wave)
+
+    return np.asarray(waves, dtype=np.int64)
+
+
+def apply_matches(ratings: np.ndarray, team_one: np.ndarray, team_two: np.ndarray, winners: np.ndarray,
+                  k: float = 32.0) -> None:
+    """Apply Elo updates in place for a batch of matches that share no players.
+
+    Each team is rated by its average rating and every player on a team
+    gains or loses the same amount.
+
+    Parameters
+    ----------
+    ratings : np.ndarray
+        Rating of every player, updated in place.
+    team_one : np.ndarray
+        Player indexes of each match's first team, padded with -1.
+    team_two : np.ndarray
+        Player indexes of each match's second team, padded with -1.
+    winners : np.ndarray
+        TEAM_ONE_WIN, TEAM_TWO_WIN or DRAW for each match.
+    k : float, optional
+        Largest possible rating change, by default 32.0
+    """
+    mask_one = team_one >= 0
+    mask_two = team_two >= 0
+    rating_one = np.where(mask_one, ratings[team_one], 0).sum(axis=1) / mask_one.sum(axis=1)
+    rating_two = np.where(mask_two, ratings[team_two], 0).sum(axis=1) / mask_two.sum(axis=1)
+    expected = 1 / (1 + 10 ** ((rating_two - rating_one) / 400))
+    score = np.where(winners == TEAM_ONE_WIN, 1.0, np.where(winners == TEAM_TWO_WIN, 0.0, 0.5))
+    delta = k * (score - expected)
+    ratings[team_one[mask_one]] += np.broadcast_to(delta[:, None], team_one.shape)[mask_one]
+    ratings[team_two[mask_two]] -= np.broadcast_to(delta[:, None], team_two.shape)[mask_two]
+
+
+def recompute_ratings(results: Iterable[Tuple[Sequence[int], Sequence[int], int]], initial: float = 1000.0,
+                      k: float = 32.0) -> Dict[int, Tuple[float, int]]:
+    """Compute every player's rating from scratch by replaying a match history.
+
+    Parameters
+    ----------
+    results : iterable
+        (team_one, team_two, winner) tuples of user IDs in the order the
+        matches finished.
+    initial : float, optional
+        Rating of a player before their first match, by default 1000.0
+    k : float, optional
+        Largest possible rating change per match, by default 32.0
+
+    Returns
+    -------
+    dict
+        (rating, matches played) of every player by user ID.
+    """
+    results = list(results)
+
+    if not results:
+        return {}
+
+    teams_one = [team_one for team_one, _, _ in results]
+    teams_two = [team_two for _, team_two, _ in results]
+    winners = np.fromiter((winner for _, _, winner in results), dtype=np.int64, count=len(results))
+    team_one = _pad_teams(teams_one)
+    team_two = _pad_teams(teams_two)
+    split = team_one.shape[1]
+
+    # Map the 64-bit user IDs to dense indexes, leaving -1 for padding
+    players = np.concatenate((team_one, team_two), axis=1)
+    user_ids, inverse = np.unique(players, return_inverse=True)
+    inverse = inverse.reshape(players.shape)
+
+    if user_ids[0] == -1:
+        user_ids = user_ids[1:]
+        inverse -= 1
+
+    team_one, team_two = inverse[:, :split], inverse[:, split:]
+    num_players = len(user_ids)
+    matches = np.bincount(inverse[inverse >= 0], minlength=num_players)
+    waves = schedule_waves(team_one, team_two, num_players)
+
+    # Sort the matches by wave once so every wave is a contiguous slice
+    order = np.argsort(waves, kind='stable')
+    bounds = np.searchsorted(waves[order], np.arange(waves.max() + 2))
+    team_one, team_two = team_one[order], team_two[order]
+    size_one, size_two = (team_one >= 0).sum(axis=1), (team_two >= 0).sum(axis=1)
+    score = np.where(winners == TEAM_ONE_WIN, 1.0, np.where(winners == TEAM_TWO_WIN, 0.0, 0.5))[order]
+
+    # Padding indexes an extra rating at the end which is kept at 0 so it doesn't count towards team ratings
+    ratings = np.full(num_players + 1, initial, dtype=np.float64)
+    ratings[-1] = 0
+
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        wave_one, wave_two = team_one[start:stop], team_two[start:stop]
+        rating_one = ratings[wave_one].sum(axis=1) / size_one[start:stop]
+        rating_two = ratings[wave_two].sum(axis=1) / size_two[start:stop]
+        delta = k * (score[start:stop] - 1 / (1 + 10 ** ((rating_two - rating_one) / 400)))
+        ratings[wave_one] += delta[:, None]
+        ratings[wave_two] -= delta[:, None]
+        ratings[-1] = 0
+
+    return {user_id: (rating, count) for user_id, rating, count in zip(user_ids.tolist(), ratings.tolist(),
+                                                                       matches.tolist())}
+
+
+class RatingEngine:
+    """
+    Keeps Elo ratings computed from the match results in the database and
+    caches them for the queue's autobalance and captain picks.
+    """
+
+    def __init__(self, bot, initial: float = 1000.0, k: float = 32.0, cache_ttl: float = 300):
+        """ Set attributes. """
+        self.bot = bot
+        self.initial = initial
+        self.k = k
+        self.cache_ttl = cache_ttl
+        self.cache = {}  # (rating, matches, loop time cached) by user ID
+        self.lock = asyncio.Lock()  # Serializes rating writes so concurrent results don't overwrite each other
+        self.logger = logging.getLogger('csgoleague.ratings')
+
+    def _cached(self, user_ids: Iterable[int]) -> Tuple[Dict[int, Tuple[float, int]], List[int]]:
+        """ Split user IDs into the fresh cached ratings and the IDs that need to be fetched. """
+        now = self.bot.loop.time()
+        cached = {}
+        missing = []
+
+        for user_id in user_ids:
+            entry = self.cache.get(user_id)
+
+            if entry is not None and now - entry[2] < self.cache_ttl:
+                cached[user_id] = entry[:2]
+            else:
+                missing.append(user_id)
+
+        return cached, missing
+
+    def cache_ratings(self, ratings: Dict[int, Tuple[float, int]]) -> None:
+        """ Store fetched or updated ratings in the cache. """
+        now = self.bot.loop.time()
+        self.cache.update({user_id: (rating, matches, now) for user_id, (rating, matches) in ratings.items()})
+
+    async def get_ratings(self, user_ids: Iterable[int]) -> Dict[int, Tuple[float, int]]:
+        """Get the rating of multiple users.
+
+        Parameters
+        ----------
+        user_ids : iterable
+            IDs of the users to get.
+
+        Returns
+        -------
+        dict
+            (rating, matches played) by user ID. Users who haven't played a
+            rated match have the initial rating and 0 matches.
+        """
+        ratings, missing = self._cached(user_ids)
+
+        if missing:
+            async with self.bot.db_pool.acquire() as conn:
+                fetched = await DBHelper(conn).get_ratings(*missing)
+
+            fetched.update({user_id: (self.initial, 0) for user_id in missing if user_id not in fetched})
+            self.cache_ratings(fetched)
+            ratings.update(fetched)
+
+        return ratings
+
+    async def update_ratings(self, db_helper: DBHelper, team_one: List[int], team_two: List[int],
+                             winner: int) -> Dict[int, Tuple[float, int]]:
+        """Update the ratings of a finished match's players.
+
+        This must be called while holding the engine's lock, in the same
+        transaction that saved the result. The returned ratings should be
+        passed to cache_ratings() once the transaction is committed.
+
+        Parameters
+        ----------
+        db_helper : DBHelper
+            Helper of the connection saving the result.
+        team_one : list
+            User IDs of the first team.
+        team_two : list
+            User IDs of the second team.
+        winner : int
+            TEAM_ONE_WIN, TEAM_TWO_WIN or DRAW.
+
+        Returns
+        -------
+        dict
+            The updated (rating, matches played) by user ID.
+        """
+        user_ids = team_one + team_two
+        current = await db_helper.get_ratings(*user_ids)
+        current.update({user_id: (self.initial, 0) for user_id in user_ids if user_id not in current})
+        ratings = np.array([current[user_id][0] for user_id in user_ids])
+        indexes = np.arange(len(user_ids))
+        apply_matches(ratings, indexes[None, :len(team_one)], indexes[None, len(team_one):], np.array([winner]),
+                      self.k)
+        updated = {user_id: (rating, current[user_id][1] + 1) for user_id, rating in zip(user_ids, ratings.tolist())}
+        await db_helper.upsert_ratings(*((user_id, rating, matches) for user_id, (rating, matches) in updated.items()))
+        return updated
+
+    async def recompute(self) -> int:
+        """ Recompute every rating from the whole match history and return the number of players rated. """
+        async with self.lock:
+            async with self.bot.db_pool.acquire() as conn:
+                results = await DBHelper(conn).get_match_results()
+
+            results = [(rec['team_one'], rec['team_two'], rec['winner']) for rec in results]
+            # The recompute is CPU bound so keep it off the event loop
+            ratings = await self.bot.loop.run_in_executor(None, recompute_ratings, results, self.initial, self.k)
+            rows = [(user_id, rating, matches) for user_id, (rating, matches) in ratings.items()]
+
+            async with self.bot.db_pool.acquire() as conn:
+                await DBHelper(conn).replace_ratings(rows)
+
+        self.cache.clear()
+        self.logger.info(f'Recomputed ratings of {len(rows)} players from {len(results)} matches')
+        return len(rows)
@@ -0,0 +1,143 @@
+# recording.py
+
+import asyncio
+import discord
+import json
+import re
+import time
+from typing import Iterable, List, Optional
+
+VERSION = 1
+MENTION = re.compile(r'<(@!?|@&|#)(\d+)>|\b(\d{15,21})\b')  # Mentions and raw Discord IDs
+CUSTOM_EMOJI = re.compile(r':(\w+):')
+
+
+class EventRecorder:
+    """
+    Appends the messages and reactions the bot receives to a file so they can
+    be replayed against the benchmark harness. Every ID is replaced by a number
+    counted from 1 each time the recorder starts, with the bot itself as 0, and
+    only the commands of the messages are kept with their mentions rewritten,
+    so a recording has the shape of the traffic without who sent it or what
+    they said. Each line is a JSON array:
+
+    * ``["s", version, unix time]`` starts a session of the recorder
+    * ``["m", seconds, guild, channel, author, command]`` for a message, with
+      an empty command if it isn't one
+    * ``["r", seconds, guild, channel, user, message, emoji]`` for a reaction,
+      with custom emojis as ``:name:``
+    """
+
+    def __init__(self, path: str, bot_id: int, prefixes: Iterable[str], loop: asyncio.AbstractEventLoop):
+        """ Set attributes. """
+        self.path = path
+        self.loop = loop  # Event loop whose executor writes the file
+        self.prefixes = tuple(prefixes)
+        self.aliases = {bot_id: 0}  # Number replacing each ID seen this session
+        self.lines = []  # Lines waiting to be written
+        self.started = None  # Monotonic time the session started
+        self.recorded = 0  # Number of events recorded
+
+    def _alias(self, snowflake):
+        return self.aliases.setdefault(snowflake, len(self.aliases))
+
+    def _seconds(self):
+        if self.started is None:
+            self.started = time.monotonic()
+            self._append(['s', VERSION, round(time.time(), 3)])
+
+        return round(time.monotonic() - self.started, 3)
+
+    def _append(self, record):
+        self.lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _anonymize(self, content):
+        """ Keep a command with the IDs it mentions replaced by aliases, raw IDs becoming user mentions. """
+        if not content.startswith(self.prefixes):
+            return ''
+
+        def replace(match):
+            kind, snowflake = (match[1], match[2]) if match[2] else ('@', match[3])
+            return f'<{kind}{self._alias(int(snowflake))}>'
+
+        return MENTION.sub(replace, content)
+
+    def record_message(self, message: discord.Message) -> None:
+        """ Record a message sent in a guild. """
+        seconds = self._seconds()
+        self._append(['m', seconds, self._alias(message.guild.id), self._alias(message.channel.id),
+                      self._alias(message.author.id), self._anonymize(message.content)])
+        self.recorded += 1
+
+    def record_reaction(self, reaction: discord.Reaction, user: discord.abc.User) -> None:
+        """ Record a reaction added to a message in a guild. """
+        seconds = self._seconds()
+        emoji = f':{reaction.emoji.name}:' if reaction.custom_emoji else str(reaction.emoji)
+        message = reaction.message
+        self._append(['r', seconds, self._alias(message.guild.id), self._alias(message.channel.id),
+                      self._alias(user.id), self._alias(message.id), emoji])
+        self.recorded += 1
+
+    async def flush(self) -> None:
+        """ Append the recorded events to the file without blocking the event loop. """
+        if not self.lines:
+            return
+
+        data, self.lines = ''.join(self.lines), []
+
+        def write():
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+        await self.loop.run_in_executor(None, write)
+
+
+def read_recording(path: str) -> List[List[list]]:
+    """Read a recording.
+
+    Parameters
+    ----------
+    path : str
+        File written by an ``EventRecorder``.
+
+    Returns
+    -------
+    list
+        The events of each session of the recorder in the order they were
+        recorded.
+    """
+    sessions = []
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+
+            if record[0] == 's':
+                if record[1] != VERSION:
+                    raise ValueError(f'Recording version {record[1]} isn\'t supported')
+
+                sessions.append([])
+            elif sessions:
+                sessions[-1].append(record)
+
+    return sessions
+
+
+def mentioned_aliases(command: str) -> List[tuple]:
+    """ Get the kind and alias of each mention in a recorded command. """
+    return [(match[1], int(match[2])) for match in MENTION.finditer(command) if match[2]]
+
+
+def restore_mentions(command: str, ids: dict) -> str:
+    """ Replace the aliases mentioned in a recorded command with the IDs they stand for in a replay. """
+    return MENTION.sub(lambda match: f'<{match[1]}{ids.get(int(match[2]), match[2])}>' if match[2] else match[0],
+                       command)
+
+
+def custom_emoji_name(emoji: str) -> Optional[str]:
+    """ Get the name of a recorded custom emoji or None if it's a unicode emoji. """
+    match = CUSTOM_EMOJI.fullmatch(emoji)
+    return match[1] if match else None
@@ -0,0 +1,135 @@
+# replica.py
+
+import asyncio
+import asyncpg
+import collections
+import logging
+import time
+from typing import Optional
+
+from .metrics import MeteredPool
+
+
+class ReplicaRouter:
+    """
+    Routes reads to a streaming replica of the database when one is set and
+    has caught up closely enough, and to the primary pool otherwise. The
+    primary's WAL position is sampled periodically and the replica counts as
+    caught up to the last sample it has replayed, so reads of a guild that
+    was written to after that time go to the primary until the replica has
+    replayed the write. Writes always go through the bot's primary pool.
+    """
+
+    def __init__(self, bot, replica_url: str = None, max_lag: float = 5.0, interval: float = 0.5):
+        """ Set attributes. """
+        self.bot = bot
+        self.replica_url = replica_url
+        self.max_lag = max_lag  # Most seconds the replica may be behind to serve reads
+        self.interval = interval  # Seconds between samples of the WAL positions
+        self.pool = None
+        # Monotonic time and primary WAL position of the samples the replica hasn't replayed, dropping the oldest
+        # only makes the lag look longer
+        self.samples = collections.deque(maxlen=1000)
+        self.replayed_at = None  # Monotonic time of the last sample the replica replayed
+        self.writes = {}  # Monotonic time each guild was last written to by guild ID
+        self.reads = collections.Counter()  # Number of reads routed to each pool
+        self.task = None
+        self.logger = logging.getLogger('csgoleague.replica')
+
+    @property
+    def lag(self) -> Optional[float]:
+        """ Upper bound of the seconds the replica is behind the primary or None if it hasn't been measured. """
+        return None if self.replayed_at is None else time.monotonic() - self.replayed_at
+
+    async def start(self) -> None:
+        """ Create the replica pool and start measuring its lag in the background. """
+        if self.replica_url is None or self.pool is not None:
+            return
+
+        self.pool = MeteredPool(await asyncpg.create_pool(self.replica_url))
+        self.task = self.bot.loop.create_task(self._sample_loop())
+
+    async def close(self) -> None:
+        """ Stop measuring the lag and close the replica pool. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def acquire(self, guild_id: int = None):
+        """Acquire a connection to read with ``async with``.
+
+        Parameters
+        ----------
+        guild_id : int, optional
+            ID of the guild the read is about. It goes to the primary if the
+            guild was written to since the last position the replica replayed.
+        """
+        lag = self.lag
+
+        if lag is not None and lag <= self.max_lag and self.writes.get(guild_id, 0) < self.replayed_at:
+            self.reads['replica'] += 1
+            return self.pool.acquire()
+
+        self.reads['primary'] += 1
+        return self.bot.db_pool.acquire()
+
+    def wrote(self, *guild_ids: int) -> None:
+        """ Send the reads of guilds to the primary until the replica has replayed what was just written to them. """
+        if self.pool is None:
+            return
+
+        now = time.monotonic()
+
+        for guild_id in guild_ids:
+            self.writes[guild_id] = now
+
+    async def _sample(self):
+        """ Sample the primary's WAL position and advance to the samples the replica has replayed. """
+        sampled_at = time.monotonic()
+
+        async with self.bot.db_pool.acquire() as conn:
+            position = await conn.fetchval('SELECT (pg_current_wal_lsn() - \'0/0\'::PG_LSN)::BIGINT;')
+
+        if self.samples and self.samples[-1][1] == position:  # Nothing was written since the last sample
+            self.samples.pop()
+
+        self.samples.append((sampled_at, position))
+
+        async with self.pool.acquire() as conn:
+            standby, replayed = await conn.fetchrow(
+                'SELECT pg_is_in_recovery(), (pg_last_wal_replay_lsn() - \'0/0\'::PG_LSN)::BIGINT;'
+            )
+
+        if not standby:
+            raise ValueError('the replica isn\'t a standby server so its lag can\'t be measured')
+
+        while self.samples and self.samples[0][1] <= replayed:
+            self.replayed_at, _ = self.samples.popleft()
+
+        if self.replayed_at is not None:  # Writes from before the replayed sample are visible on the replica
+            self.writes = {guild_id: wrote_at for guild_id, wrote_at in self.writes.items()
+                           if wrote_at >= self.replayed_at}
+
+    async def _sample_loop(self):
+        """ Periodically measure the replica's lag, sending every read to the primary while it can't be measured. """
+        failing = False
+
+        while True:
+            try:
+                await self._sample()
+                failing = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not failing:
+                    self.logger.error(f'Unable to measure the replica lag, reading from the primary: {e}')
+
+                failing = True
+                self.samples.clear()
+                self.replayed_at = None
+
+            await asyncio.sleep(self.interval)
@@ -1,5 +1,6 @@
-# api.py
+# server.py
 
+import aiohttp
 import discord
 from typing import List
 
@@ -74,3 +75,107 @@ class MatchServer:
         async with Sessions.requests.post(url=url, json=data) as resp:
             json = await resp.json()
             return cls(**json)
+
+
+class ServerReservation:
+    """
+    Represents a match server reserved from the API before the teams and map
+    have been decided, so it can be provisioned while the players draft.
+
+    If the API has no reservation endpoints the reservation is a local
+    stand-in and the server is only provisioned by MatchServer.new_match()
+    on commit, which needs the teams and map. Provisioning then stays on the
+    critical path between the draft finishing and the server being posted.
+    """
+
+    supported = True  # Set to False once the API shows it has no reservation endpoints
+
+    def __init__(self, reservation_id: int = None):
+        self.id = reservation_id
+
+    @property
+    def is_local(self):
+        """
+        Whether this is a local stand-in for an API that can't reserve servers.
+        """
+
+        return self.id is None
+
+    @classmethod
+    async def reserve(cls) -> 'ServerReservation':
+        """Reserve a match server from the API.
+
+        Falls back to a local stand-in that starts the match with
+        MatchServer.new_match() on commit if the API can't reserve servers.
+
+        Returns
+        -------
+        ServerReservation
+        """
+
+        if not cls.supported:
+            return cls()
+
+        url = f'{Config.api_url}/match/reserve'
+
+        try:
+            async with Sessions.requests.post(url=url) as resp:
+                json = await resp.json()
+        except aiohttp.ClientResponseError as e:
+            if e.status not in (404, 405, 501):
+                raise
+
+            cls.supported = False
+            return cls()
+
+        return cls(json['id'])
+
+    async def commit(
+        self,
+        team_one: List[discord.Member],
+        team_two: List[discord.Member],
+        map_pick: str = None
+    ) -> MatchServer:
+        """Start the match on the reserved server.
+
+        Parameters
+        ----------
+        team_one : list
+        team_two : list
+        map_pick : str, optional
+            by default None
+
+        Returns
+        -------
+        MatchServer
+        """
+
+        if self.is_local:
+            return await MatchServer.new_match(team_one, team_two, map_pick)
+
+        url = f'{Config.api_url}/match/start'
+        data = {
+            'reservation': self.id,
+            'team_one': {f'{user.id}': user.display_name for user in team_one},
+            'team_two': {f'{user.id}': user.display_name for user in team_two}
+        }
+
+        if map_pick:
+            data['maps'] = [f'{map_pick}']
+
+        async with Sessions.requests.post(url=url, json=data) as resp:
+            json = await resp.json()
+            return MatchServer(**json)
+
+    async def release(self) -> None:
+        """
+        Give the reserved server back to the API.
+        """
+
+        if self.is_local:
+            return
+
+        url = f'{Config.api_url}/match/release/{self.id}'
+
+        async with Sessions.requests.post(url=url):
+            pass
@@ -0,0 +1,434 @@
+# server_pool.py
+
+import asyncio
+import collections
+import datetime
+import discord
+import enum
+import logging
+from typing import Dict, List, Tuple
+
+from .db import DBHelper
+from .server import MatchServer, ServerReservation
+from ...resources import Config, Sessions
+
+
+class ServerState(enum.Enum):
+    """
+    Enum for the states a game server in the pool can be in.
+    """
+    FREE = enum.auto()
+    RESERVED = enum.auto()
+    IN_MATCH = enum.auto()
+    DRAINING = enum.auto()
+
+    def __str__(self):
+        return self.name.lower()
+
+
+class PoolExhausted(Exception):
+    """ Raised when there are no free game servers left in the pool. """
+
+
+class GameServer:
+    """
+    Represents a game server tracked by the server pool.
+    """
+
+    def __init__(self, server_id: int, ip: str, port: int, state: ServerState = ServerState.FREE,
+                 match_id: int = None, expires_at: datetime.datetime = None):
+        self.id = server_id
+        self.ip = ip
+        self.port = port
+        self.state = state
+        self.match_id = match_id
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_dict(cls, server_data: dict) -> 'GameServer':
+        """Create a GameServer from a dictionary as returned by the database.
+
+        Parameters
+        ----------
+        server_data : dict
+            Dictionary with game server information from the database.
+
+        Returns
+        -------
+        GameServer
+        """
+        return cls(server_data['id'], server_data['ip'], server_data['port'],
+                   ServerState[server_data['state'].upper()], server_data['match_id'], server_data['expires_at'])
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.ip, self.port
+
+
+class ServerRegistry:
+    """
+    Base class for the sources of game servers the pool can add spares from.
+    """
+
+    async def provision(self, count: int) -> List[Tuple[str, int]]:
+        """Bring up new game servers.
+
+        Parameters
+        ----------
+        count : int
+            Number of servers wanted.
+
+        Returns
+        -------
+        list
+            (ip, port) addresses of the servers that were brought up, which
+            may be fewer than asked for.
+        """
+        raise NotImplementedError
+
+    async def decommission(self, server: GameServer) -> None:
+        """ Shut down a drained game server. """
+        raise NotImplementedError
+
+
+class ApiServerRegistry(ServerRegistry):
+    """
+    Server registry backed by the CS:GO League web API.
+    """
+
+    async def provision(self, count: int) -> List[Tuple[str, int]]:
+        url = f'{Config.api_url}/servers/provision'
+
+        async with Sessions.requests.post(url=url, json={'count': count}) as resp:
+            servers = await resp.json()
+
+        return [(server['ip'], int(server['port'])) for server in servers]
+
+    async def decommission(self, server: GameServer) -> None:
+        url = f'{Config.api_url}/servers/decommission'
+
+        async with Sessions.requests.post(url=url, json={'ip': server.ip, 'port': server.port}):
+            pass
+
+
+class FakeServerRegistry(ServerRegistry):
+    """
+    Local stand-in registry that hands out made up loopback servers, for
+    running the pool without any real game servers.
+    """
+
+    def __init__(self, capacity: int = 100, delay: float = 0.0, ip: str = '127.0.0.1', base_port: int = 27015):
+        self.capacity = capacity
+        self.delay = delay
+        self.ip = ip
+        self.base_port = base_port
+        self.running = set()
+
+    async def provision(self, count: int) -> List[Tuple[str, int]]:
+        await asyncio.sleep(self.delay)
+        ports = [port for port in range(self.base_port, self.base_port + self.capacity) if port not in self.running]
+        ports = ports[:count]
+        self.running.update(ports)
+        return [(self.ip, port) for port in ports]
+
+    async def decommission(self, server: GameServer) -> None:
+        await asyncio.sleep(self.delay)
+        self.running.discard(server.port)
+
+
+class PoolReservation(ServerReservation):
+    """
+    Represents a game server reserved from the local server pool.
+    """
+
+    def __init__(self, pool: 'ServerPool', server: GameServer):
+        super().__init__(server.id)
+        self.pool = pool
+        self._server = server
+
+    @property
+    def server(self) -> GameServer:
+        """ The pool's current copy of the reserved server, since refreshing the pool replaces them. """
+        return self.pool.servers.get(self.id, self._server)
+
+    @property
+    def is_local(self):
+        return False
+
+    async def commit(
+        self,
+        team_one: List[discord.Member],
+        team_two: List[discord.Member],
+        map_pick: str = None
+    ) -> MatchServer:
+        """Start the match on the pooled server.
+
+        Parameters
+        ----------
+        team_one : list
+        team_two : list
+        map_pick : str, optional
+            by default None
+
+        Returns
+        -------
+        MatchServer
+        """
+
+        url = f'{Config.api_url}/match/start'
+        data = {
+            'server': {'ip': self.server.ip, 'port': self.server.port},
+            'team_one': {f'{user.id}': user.display_name for user in team_one},
+            'team_two': {f'{user.id}': user.display_name for user in team_two}
+        }
+
+        if map_pick:
+            data['maps'] = [f'{map_pick}']
+
+        async with Sessions.requests.post(url=url, json=data) as resp:
+            json = await resp.json()
+            match_server = MatchServer(**json)
+
+        await self.pool.start_match(self.server, match_server.id)
+        return match_server
+
+    async def release(self) -> None:
+        await self.pool.release(self.server)
+
+
+class ServerPool:
+    """
+    Tracks the known game servers and their state in the game_servers table,
+    keeps a number of free spares warm and hands them out to new matches.
+    """
+
+    def __init__(self, bot, registry: ServerRegistry, spares: int = 2, reserve_timeout: float = 900,
+                 no_show_timeout: float = 300, match_timeout: float = 5400, interval: float = 30):
+        """ Set attributes. """
+        self.bot = bot
+        self.registry = registry
+        self.spares = spares
+        self.reserve_timeout = reserve_timeout  # Longest a server can stay reserved during a draft
+        self.no_show_timeout = no_show_timeout  # How long players have to join the server
+        self.match_timeout = match_timeout  # Longest a match is assumed to last without an end event
+        self.interval = interval
+        self.servers: Dict[int, GameServer] = {}
+        self.free = collections.deque()  # IDs of the free servers, in allocation order
+        self.task = None
+        self.warming = None
+        self.logger = logging.getLogger('csgoleague.servers')
+
+    async def start(self) -> None:
+        """ Load the pool, warm up spares and start reclaiming servers in the background. """
+        await self.refresh()
+
+        if self.task is None:
+            self.task = self.bot.loop.create_task(self._maintain_loop())
+
+    async def close(self) -> None:
+        """ Stop maintaining the pool. """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def refresh(self) -> None:
+        """ Reload the pool from the database so changes made by other bot processes are picked up. """
+        async with self.bot.db_pool.acquire() as conn:
+            rows = await DBHelper(conn).get_game_servers()
+
+        self.servers = {row['id']: GameServer.from_dict(row) for row in rows}
+        self.free = collections.deque(server.id for server in self.servers.values() if server.state is ServerState.FREE)
+        self.warm_up()
+
+    async def _maintain_loop(self):
+        """ Periodically reclaim no-show servers and resync the pool. """
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.reclaim()
+                await self.refresh()
+            except Exception as e:
+                self.logger.error(f'Unable to maintain the server pool: {e}')
+
+    def warm_up(self) -> None:
+        """ Provision servers in the background until there are enough free spares. """
+        if self.warming is None or self.warming.done():
+            self.warming = self.bot.loop.create_task(self._provision_spares())
+
+    async def _provision_spares(self):
+        """ Top the pool up to the configured number of free spares. """
+        missing = self.spares - len(self.free)
+
+        if missing <= 0:
+            return
+
+        try:
+            addresses = await self.registry.provision(missing)
+
+            if not addresses:
+                return
+
+            async with self.bot.db_pool.acquire() as conn:
+                rows = await DBHelper(conn).insert_game_servers(*addresses)
+        except Exception as e:
+            self.logger.error(f'Unable to provision spare servers: {e}')
+            return
+
+        for row in rows:
+            server = GameServer.from_dict(row)
+
+            if server.id not in self.servers and server.state is ServerState.FREE:
+                self.free.append(server.id)
+
+            self.servers[server.id] = server
+
+        self.logger.info(f'Provisioned {len(rows)} spare servers ({len(self.free)} free)')
+
+    async def allocate(self) -> GameServer:
+        """Reserve a free server from the pool.
+
+        Raises
+        ------
+        PoolExhausted
+            There are no free servers left.
+
+        Returns
+        -------
+        GameServer
+        """
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.reserve_timeout)
+
+        try:
+            while self.free:
+                server = self.servers[self.free.popleft()]
+
+                # Another bot process may have claimed this server since the pool was last refreshed
+                async with self.bot.db_pool.acquire() as conn:
+                    claimed = await DBHelper(conn).claim_game_server(server.id, expires_at)
+
+                if claimed:
+                    server.state = ServerState.RESERVED
+                    server.expires_at = expires_at
+                    return server
+        finally:
+            self.warm_up()
+
+        raise PoolExhausted('No free servers in the pool')
+
+    async def reserve(self) -> ServerReservation:
+        """ Reserve a pooled server, falling back to the API when the pool is exhausted. """
+        try:
+            return PoolReservation(self, await self.allocate())
+        except PoolExhausted:
+            self.logger.warning('Server pool exhausted, reserving a server from the API instead')
+            return await ServerReservation.reserve()
+
+    async def start_match(self, server: GameServer, match_id: int) -> None:
+        """Mark a reserved server as hosting a match.
+
+        Players have to join before the no-show timeout when the game servers
+        send match events, which confirm the server once they have and
+        release it when the match ends. Without events the server is held for
+        the match timeout instead since nothing would confirm it.
+
+        Parameters
+        ----------
+        server : GameServer
+            Server reserved for the match.
+        match_id : int
+            ID of the match the server is hosting.
+        """
+        timeout = self.no_show_timeout if self.bot.settings.events_port is not None else self.match_timeout
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=timeout)
+        await self._set_state(server, ServerState.IN_MATCH, match_id=match_id, expires_at=expires_at)
+
+    async def match_server(self, match_id: int) -> GameServer:
+        """ Get the pooled server hosting a match, if any, looking it up if it isn't known since the last refresh. """
+        server = next((server for server in self.servers.values() if server.match_id == match_id), None)
+
+        if server is not None:
+            return server
+
+        # Another bot process may have allocated the server since the pool was last refreshed
+        async with self.bot.db_pool.acquire() as conn:
+            row = await DBHelper(conn).get_match_game_server(match_id)
+
+        if row is None:
+            return None
+
+        server = self.servers[row['id']] = GameServer.from_dict(row)
+
+        if server.id in self.free:
+            self.free.remove(server.id)
+
+        return server
+
+    def find(self, ip: str, port: int) -> GameServer:
+        """ Get the pooled server at an address, if any. """
+        return next((server for server in self.servers.values() if server.address == (ip, port)), None)
+
+    async def confirm(self, server: GameServer) -> None:
+        """ Stop the no-show timeout once players have joined the server, holding it until the match ends. """
+        await self._set_state(server, server.state, expires_at=None)
+
+    async def release(self, server: GameServer) -> None:
+        """ Return a server to the pool, or decommission it if it was draining. """
+        if server.state is ServerState.DRAINING:
+            await self.registry.decommission(server)
+
+            async with self.bot.db_pool.acquire() as conn:
+                await DBHelper(conn).delete_game_servers(server.id)
+
+            self.servers.pop(server.id, None)
+            return
+
+        await self._set_state(server, ServerState.FREE, match_id=None, expires_at=None)
+        self.free.append(server.id)
+
+    async def drain(self, server: GameServer) -> None:
+        """ Stop handing out a server, decommissioning it once it is no longer used. """
+        if server.state is ServerState.FREE:
+            if server.id in self.free:
+                self.free.remove(server.id)
+
+            server.state = ServerState.DRAINING
+            await self.release(server)
+        else:
+            await self._set_state(server, ServerState.DRAINING)
+
+    async def reclaim(self) -> List[int]:
+        """ Free the servers whose reservation, no-show or match timeout has passed and return their IDs. """
+        async with self.bot.db_pool.acquire() as conn:
+            reclaimed = await DBHelper(conn).reclaim_game_servers()
+
+        if reclaimed:
+            self.logger.info(f'Reclaimed {len(reclaimed)} servers after their reservation or match timed out')
+
+        return reclaimed
+
+    async def _set_state(self, server: GameServer, state: ServerState, **data) -> None:
+        """ Update a server's state in the pool and the database. """
+        async with self.bot.db_pool.acquire() as conn:
+            await DBHelper(conn).update_game_server(server.id, state=str(state), **data)
+
+        server.state = state
+
+        for attr, val in data.items():
+            setattr(server, attr, val)
+
+    def utilisation(self) -> Dict[str, float]:
+        """Get the pool's utilisation metrics.
+
+        Returns
+        -------
+        dict
+            Number of servers in each state, the total and the fraction of
+            servers that are reserved or hosting a match.
+        """
+        counts = collections.Counter(server.state for server in self.servers.values())
+        metrics = {str(state): counts[state] for state in ServerState}
+        metrics['total'] = len(self.servers)
+        busy = counts[ServerState.RESERVED] + counts[ServerState.IN_MATCH]
+        metrics['utilisation'] = busy / len(self.servers) if self.servers else 0.0
+        return metrics
@@ -0,0 +1,199 @@
+# tracing.py
+
+import asyncio
+import contextlib
+import contextvars
+import discord
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """ One timed operation of a trace, e.g. a command, a query or a request. """
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'attributes', 'start', 'started', 'duration')
+
+    def __init__(self, trace, parent_id, name, kind, attributes):
+        """ Set attributes and start timing. """
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind  # One of command, db, api, discord, outbound or internal
+        self.attributes = attributes
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'duration_ms': self.duration * 1000,
+            'attributes': self.attributes
+        }
+
+
+class _Trace:
+    """ Spans of one sampled command, exported together once its root span finishes. """
+
+    __slots__ = ('trace_id', 'spans', 'finished')
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.finished = False
+
+
+class Tracer:
+    """
+    Records a sample of commands as trees of spans for the database, API and
+    Discord calls they make and appends them to a JSON lines file. The current
+    span is kept in a context variable so it follows the command into the tasks
+    it creates. Outside a sampled command starting a span costs one context
+    variable lookup.
+    """
+
+    def __init__(self):
+        """ Set attributes. """
+        self.path = None  # File the spans are appended to
+        self.sample_rate = 0.0  # Fraction of commands traced
+        self.loop = None  # Event loop whose executor writes the traces
+        self.exported = 0  # Number of traces written
+        self.logger = logging.getLogger('csgoleague.tracing')
+
+    def configure(self, path: Optional[str], sample_rate: float, loop: asyncio.AbstractEventLoop = None) -> None:
+        """ Set the file to export to, the fraction of commands to trace and the loop of the traced commands. """
+        self.path = path
+        self.sample_rate = sample_rate if path else 0.0
+        self.loop = loop
+
+    @contextlib.contextmanager
+    def trace(self, name: str, kind: str = 'command', **attributes):
+        """ Start a new trace with a root span if this one is sampled. """
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        trace = _Trace()
+        span = Span(trace, None, name, kind, attributes)
+        token = _current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            trace.spans.append(span)
+            trace.finished = True
+            self._export(trace)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = 'internal', **attributes):
+        """ Time a child of the current span if there is one in a trace that's still open. """
+        parent = _current_span.get()
+
+        if parent is None or parent.trace.finished:
+            yield None
+            return
+
+        span = Span(parent.trace, parent.span_id, name, kind, attributes)
+        token = _current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            span.trace.spans.append(span)
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        """ Get the span the calling code runs in. """
+        return _current_span.get()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def use_span(span: Optional[Span]):
+        """ Run code in another task as part of a span, e.g. a write sent for a command by the outbound scheduler. """
+        token = _current_span.set(span)
+
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+
+    def _export(self, trace):
+        """ Append a finished trace's spans to the export file without blocking the event loop. """
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in trace.spans)
+
+        def write():
+            with open(self.path, 'a') as f:
+                f.write(lines)
+
+        if self.loop is not None and self.loop.is_running():
+            self.loop.run_in_executor(None, write).add_done_callback(self._exported)
+        else:
+            write()
+
+    def _exported(self, future):
+        if future.exception() is not None:
+            self.logger.error(f'Unable to export a trace to {self.path}: {future.exception()}')
+        else:
+            self.exported += 1
+
+
+TRACER = Tracer()
+
+
+def traced_methods(kind: str):
+    """ Class decorator that runs each of the class's public coroutine methods in a span of a kind. """
+    def wrap(method):
+        @functools.wraps(method)
+        async def traced(*args, **kwargs):
+            with TRACER.span(method.__name__, kind):
+                return await method(*args, **kwargs)
+
+        return traced
+
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(method):
+                setattr(cls, name, wrap(method))
+
+        return cls
+
+    return decorate
+
+
+def trace_http(http: discord.http.HTTPClient) -> None:
+    """ Run each of a discord.py HTTP client's REST calls in a span. """
+    request = http.request
+
+    @functools.wraps(request)
+    async def traced_request(route, **kwargs):
+        with TRACER.span(f'{route.method} {route.path}', 'discord'):
+            return await request(route, **kwargs)
+
+    http.request = traced_request
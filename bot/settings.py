@@ -0,0 +1,46 @@
+# settings.py
+
+from dataclasses import dataclass
+import os.path
+from typing import Optional
+
+from .cogs.utils.server_pool import ServerRegistry
+
+_CWD = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.path.join(_CWD, os.pardir, 'profiles')
+
+
+@dataclass
+class BotSettings:
+    """ Optional features and tuning of the bot, built once by the launcher from the environment. """
+
+    # Match server pool
+    server_registry: Optional[ServerRegistry] = None  # Registry of the pooled match servers, no pool if not set
+    server_spares: int = 0  # Free servers to keep warm in the pool
+
+    # Match events endpoint
+    events_port: Optional[int] = None  # Port to accept match events from game servers on if set
+    events_host: str = '127.0.0.1'
+    events_key: Optional[str] = None  # Key game servers authenticate with, required with the port
+
+    # Metrics and diagnostics
+    metrics_port: Optional[int] = None  # Port to serve Prometheus metrics on if set
+    metrics_host: str = '127.0.0.1'
+    lag_threshold: Optional[float] = None  # Seconds of lag that start the lag monitor at startup if set
+    profile_dir: str = PROFILE_DIR  # Directory the admin commands write profiles and snapshots to
+    trace_file: Optional[str] = None  # File to append traces of a sample of the commands to if set
+    trace_sample_rate: float = 0.01  # Fraction of the commands traced
+    record_file: Optional[str] = None  # File to record the messages and reactions the bot receives to if set
+
+    # Database read replica
+    db_replica_url: Optional[str] = None  # Streaming replica to read from if set
+    db_replica_max_lag: float = 5.0  # Most seconds the replica may be behind to be read from
+
+    # Discord
+    typing_delay: float = 1.0  # Seconds a command can take to reply before the bot shows it's typing
+    message_cache_size: int = 1000  # Reactions are only dispatched for cached messages
+    defer_startup: bool = False  # Sync guilds and warm up the server pool after the first ready
+
+    def __post_init__(self):
+        if self.events_port is not None and not self.events_key:
+            raise ValueError('An events key (EVENTS_KEY) is required to accept match events')
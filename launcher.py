@@ -1,10 +1,13 @@
 # launcher.py
 
 from bot.bot import LeagueBot
+from bot.cluster import ClusterSupervisor
+from bot.cogs import LogPipeline
+from bot.cogs.utils import ApiServerRegistry, FakeServerRegistry
+from bot.settings import BotSettings
 
 import argparse
 import asyncio
-import asyncpg
 import discord
 from dotenv import load_dotenv
 import json
@@ -13,11 +16,26 @@ import os
 
 ABS_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 EMOJI_FILE = os.path.join(ABS_ROOT_DIR, 'emojis.json')
+DB_CONNECT_URL = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
 BOT_LOGGER = logging.getLogger('csgoleague.bot')
 load_dotenv()  # Load the environment variables in the local .env file
 
-if os.name == 'nt':
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+def _set_event_loop_policy():
+    """ Use the event loop chosen in the environment, falling back to asyncio's own if it's unavailable. """
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    if os.environ.get('EVENT_LOOP', 'asyncio').lower() == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            BOT_LOGGER.warning('EVENT_LOOP is uvloop but it isn\'t installed, falling back to the asyncio event loop')
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+_set_event_loop_policy()  # At import so the cluster's spawned workers use the same loop
 
 
 def _get_loop():
@@ -26,11 +44,48 @@ def _get_loop():
     return loop
 
 
-def run_bot():
-    """ Parse the config file and run the bot. """
-    # Get database pool for bot
-    db_connect_url = 'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}/{POSTGRESQL_DB}'
-    db_pool = _get_loop().run_until_complete(asyncpg.create_pool(db_connect_url.format(**os.environ)))
+def load_settings():
+    """ Build the bot's settings from the environment. """
+    # Get read replica URL, its credentials default to the primary's
+    db_replica_url = None
+
+    if os.environ.get('POSTGRESQL_REPLICA_HOST'):
+        db_replica_url = DB_CONNECT_URL.format(
+            POSTGRESQL_USER=os.environ.get('POSTGRESQL_REPLICA_USER', os.environ['POSTGRESQL_USER']),
+            POSTGRESQL_PASSWORD=os.environ.get('POSTGRESQL_REPLICA_PASSWORD', os.environ['POSTGRESQL_PASSWORD']),
+            POSTGRESQL_HOST=os.environ['POSTGRESQL_REPLICA_HOST'],
+            POSTGRESQL_DB=os.environ.get('POSTGRESQL_REPLICA_DB', os.environ['POSTGRESQL_DB'])
+        )
+
+    # Get server pool registry
+    server_registries = {'api': ApiServerRegistry, 'fake': FakeServerRegistry}
+    registry_name = os.environ.get('SERVER_POOL_REGISTRY')
+
+    return BotSettings(
+        server_registry=server_registries[registry_name]() if registry_name else None,
+        server_spares=int(os.environ.get('SERVER_POOL_SPARES', 2)),
+        events_port=int(os.environ['EVENTS_PORT']) if os.environ.get('EVENTS_PORT') else None,
+        events_host=os.environ.get('EVENTS_HOST', '127.0.0.1'),
+        events_key=os.environ.get('EVENTS_KEY'),
+        metrics_port=int(os.environ['METRICS_PORT']) if os.environ.get('METRICS_PORT') else None,
+        metrics_host=os.environ.get('METRICS_HOST', '127.0.0.1'),
+        lag_threshold=float(os.environ['LAG_THRESHOLD']) / 1000 if os.environ.get('LAG_THRESHOLD') else None,
+        profile_dir=os.environ.get('PROFILE_DIR', os.path.join(ABS_ROOT_DIR, 'profiles')),
+        trace_file=os.environ.get('TRACE_FILE'),
+        trace_sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 0.01)),
+        record_file=os.environ.get('RECORD_FILE'),
+        db_replica_url=db_replica_url,
+        db_replica_max_lag=float(os.environ.get('POSTGRESQL_REPLICA_MAX_LAG', 5.0)),
+        typing_delay=float(os.environ.get('TYPING_DELAY', 1.0)),
+        message_cache_size=int(os.environ.get('MESSAGE_CACHE_SIZE', 1000)),
+        defer_startup=os.environ.get('DEFER_STARTUP', '').lower() in ('1', 'true', 'yes')
+    )
+
+
+def run_bot(shard_ids=None, shard_count=None, cluster_id=None, health_queue=None):
+    """ Parse the config file and run the bot, optionally as one worker of a cluster. """
+    # Get database URL
+    db_url = DB_CONNECT_URL.format(**os.environ)
 
     # Check API URL
     api_url = os.environ['CSGO_LEAGUE_API_URL']
@@ -38,13 +93,48 @@ def run_bot():
     if api_url.endswith('/'):
         api_url = api_url[:-1]
 
-    # Get emojis
-    with open(EMOJI_FILE) as f:
-        emoji_dict = json.load(f)
+    settings = load_settings()
+
+    # Write logs from a background thread
+    log_pipeline = LogPipeline(queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+                               json_format=os.environ.get('LOG_FORMAT', '').lower() == 'json')
+    log_pipeline.start()
+
+    # Run bot on a fresh event loop, it creates its database pool on it when it starts
+    _get_loop()
+    bot = LeagueBot(os.environ['DISCORD_BOT_TOKEN'], api_url, os.environ['CSGO_LEAGUE_API_KEY'], db_url, EMOJI_FILE,
+                    settings=settings, shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id,
+                    health_queue=health_queue)
+
+    try:
+        bot.run()
+    finally:
+        log_pipeline.stop()
+
+
+def recommended_shard_count():
+    """ Get the number of shards Discord recommends for the bot. """
+    async def get_bot_gateway():
+        http = discord.http.HTTPClient()
+
+        try:
+            await http.static_login(os.environ['DISCORD_BOT_TOKEN'], bot=True)
+            shard_count, _ = await http.get_bot_gateway()
+        finally:
+            await http.close()
+
+        return shard_count
+
+    return _get_loop().run_until_complete(get_bot_gateway())
+
+
+def run_cluster(clusters, shard_count=None, health_file=None):
+    """ Run the bot's shards split across multiple supervised worker processes. """
+    if shard_count is None:
+        shard_count = recommended_shard_count()
 
-    # Run bot
-    bot = LeagueBot(os.environ['DISCORD_BOT_TOKEN'], api_url, os.environ['CSGO_LEAGUE_API_KEY'], db_pool, emoji_dict)
-    bot.run()
+    supervisor = ClusterSupervisor(run_bot, shard_count, clusters, health_file=health_file)
+    supervisor.run()
 
 
 def create_emojis(guild_id):
@@ -110,10 +200,19 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run the CS:GO League bot')
     parser.add_argument('-e', '--emojis', type=int, required=False, metavar='serverID',
                         help='create necessary bot emojis in the specified server and save the info to a JSON file')
+    parser.add_argument('-c', '--cluster', type=int, required=False, metavar='workers',
+                        help='run the shards across the specified number of supervised worker processes')
+    parser.add_argument('-s', '--shards', type=int, required=False, metavar='count',
+                        help='total number of shards to run in cluster mode, defaults to the recommended count')
+    parser.add_argument('--health-file', required=False, metavar='path',
+                        help='file to write the health aggregated across the cluster\'s workers to')
     args = parser.parse_args()
 
     if args.emojis:
         guild_id = args.emojis
         create_emojis(guild_id)
 
-    run_bot()
+    if args.cluster:
+        run_cluster(args.cluster, args.shards, args.health_file)
+    else:
+        run_bot()
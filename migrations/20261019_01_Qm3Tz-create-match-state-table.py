@@ -0,0 +1,42 @@
+"""
+Create match state table
+"""
+
+from yoyo import step
+
+__depends__ = {'20210619_01_3lEoT-add-map-de-ancient'}
+
+steps = [
+    step(
+        (
+            'CREATE TYPE match_state AS ENUM(\n'
+            '    \'ready_check\', \'team_selection\', \'map_selection\', \'server_allocation\', \'live\',\n'
+            '    \'cancelled\', \'failed\'\n'
+            ');'
+        ),
+        'DROP TYPE match_state;'
+    ),
+    step(
+        (
+            'CREATE TABLE matches(\n'
+            '    id UUID PRIMARY KEY,\n'
+            '    guild_id BIGINT REFERENCES guilds (id) ON DELETE CASCADE,\n'
+            '    channel_id BIGINT NOT NULL,\n'
+            '    message_id BIGINT DEFAULT null,\n'
+            '    state match_state NOT NULL,\n'
+            '    users BIGINT[] NOT NULL,\n'
+            '    team_one BIGINT[] DEFAULT null,\n'
+            '    team_two BIGINT[] DEFAULT null,\n'
+            '    map_pick VARCHAR(32) DEFAULT null,\n'
+            '    draft JSONB NOT NULL DEFAULT \'{}\',\n'
+            '    deadline TIMESTAMP WITH TIME ZONE DEFAULT null,\n'
+            '    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP\n'
+            ');'
+        ),
+        'DROP TABLE matches;'
+    ),
+    step(
+        'CREATE INDEX matches_guild_id_idx ON matches (guild_id);',
+        'DROP INDEX matches_guild_id_idx;'
+    )
+]
@@ -0,0 +1,33 @@
+"""
+Create game servers table
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_01_Qm3Tz-create-match-state-table'}
+
+steps = [
+    step(
+        'CREATE TYPE server_state AS ENUM(\'free\', \'reserved\', \'in_match\', \'draining\');',
+        'DROP TYPE server_state;'
+    ),
+    step(
+        (
+            'CREATE TABLE game_servers(\n'
+            '    id SERIAL PRIMARY KEY,\n'
+            '    ip VARCHAR(64) NOT NULL,\n'
+            '    port INTEGER NOT NULL,\n'
+            '    state server_state NOT NULL DEFAULT \'free\',\n'
+            '    match_id BIGINT DEFAULT null,\n'
+            '    expires_at TIMESTAMP WITH TIME ZONE DEFAULT null,\n'
+            '    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,\n'
+            '    CONSTRAINT game_server_address_key UNIQUE (ip, port)\n'
+            ');'
+        ),
+        'DROP TABLE game_servers;'
+    ),
+    step(
+        'CREATE INDEX game_servers_expires_at_idx ON game_servers (expires_at) WHERE expires_at IS NOT NULL;',
+        'DROP INDEX game_servers_expires_at_idx;'
+    )
+]
@@ -0,0 +1,36 @@
+"""
+Create rating tables
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_02_Vr8Kd-create-game-servers-table'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE match_results(\n'
+            '    id BIGINT PRIMARY KEY,\n'
+            '    team_one BIGINT[] NOT NULL,\n'
+            '    team_two BIGINT[] NOT NULL,\n'
+            '    winner SMALLINT NOT NULL,\n'
+            '    finished_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP\n'
+            ');'
+        ),
+        'DROP TABLE match_results;'
+    ),
+    step(
+        'CREATE INDEX match_results_finished_at_idx ON match_results (finished_at, id);',
+        'DROP INDEX match_results_finished_at_idx;'
+    ),
+    step(
+        (
+            'CREATE TABLE player_ratings(\n'
+            '    user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,\n'
+            '    rating DOUBLE PRECISION NOT NULL,\n'
+            '    matches INTEGER NOT NULL DEFAULT 0\n'
+            ');'
+        ),
+        'DROP TABLE player_ratings;'
+    )
+]
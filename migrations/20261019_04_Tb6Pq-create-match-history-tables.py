@@ -0,0 +1,79 @@
+"""
+Create match history tables
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_03_Hn2Wc-create-rating-tables'}
+
+steps = [
+    step(
+        'ALTER TABLE match_results RENAME TO match_history;',
+        'ALTER TABLE match_history RENAME TO match_results;'
+    ),
+    step(
+        'ALTER INDEX match_results_finished_at_idx RENAME TO match_history_finished_at_idx;',
+        'ALTER INDEX match_history_finished_at_idx RENAME TO match_results_finished_at_idx;'
+    ),
+    step(
+        (
+            'ALTER TABLE match_history\n'
+            '    ADD COLUMN guild_id BIGINT REFERENCES guilds (id) ON DELETE SET NULL,\n'
+            '    ADD COLUMN map VARCHAR(32),\n'
+            '    ADD COLUMN started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,\n'
+            '    ALTER COLUMN winner DROP NOT NULL,\n'
+            '    ALTER COLUMN finished_at DROP NOT NULL,\n'
+            '    ALTER COLUMN finished_at DROP DEFAULT;'
+        ),
+        (
+            'DELETE FROM match_history WHERE winner IS NULL;\n'
+            'ALTER TABLE match_history\n'
+            '    DROP COLUMN guild_id,\n'
+            '    DROP COLUMN map,\n'
+            '    DROP COLUMN started_at,\n'
+            '    ALTER COLUMN winner SET NOT NULL,\n'
+            '    ALTER COLUMN finished_at SET NOT NULL,\n'
+            '    ALTER COLUMN finished_at SET DEFAULT CURRENT_TIMESTAMP;'
+        )
+    ),
+    step(
+        (
+            'CREATE TABLE match_players(\n'
+            '    match_id BIGINT REFERENCES match_history (id) ON DELETE CASCADE,\n'
+            '    user_id BIGINT REFERENCES users (id) ON DELETE CASCADE,\n'
+            '    team SMALLINT NOT NULL,\n'
+            '    kills INTEGER NOT NULL DEFAULT 0,\n'
+            '    deaths INTEGER NOT NULL DEFAULT 0,\n'
+            '    assists INTEGER NOT NULL DEFAULT 0,\n'
+            '    headshots INTEGER NOT NULL DEFAULT 0,\n'
+            '    damage INTEGER NOT NULL DEFAULT 0,\n'
+            '    rounds INTEGER NOT NULL DEFAULT 0,\n'
+            '    first_bloods INTEGER NOT NULL DEFAULT 0,\n'
+            '    PRIMARY KEY (match_id, user_id)\n'
+            ');'
+        ),
+        'DROP TABLE match_players;'
+    ),
+    step(
+        'CREATE INDEX match_players_user_id_idx ON match_players (user_id);',
+        'DROP INDEX match_players_user_id_idx;'
+    ),
+    step(
+        (
+            'CREATE TABLE player_stats(\n'
+            '    user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,\n'
+            '    wins INTEGER NOT NULL DEFAULT 0,\n'
+            '    draws INTEGER NOT NULL DEFAULT 0,\n'
+            '    losses INTEGER NOT NULL DEFAULT 0,\n'
+            '    kills INTEGER NOT NULL DEFAULT 0,\n'
+            '    deaths INTEGER NOT NULL DEFAULT 0,\n'
+            '    assists INTEGER NOT NULL DEFAULT 0,\n'
+            '    headshots INTEGER NOT NULL DEFAULT 0,\n'
+            '    damage INTEGER NOT NULL DEFAULT 0,\n'
+            '    rounds INTEGER NOT NULL DEFAULT 0,\n'
+            '    first_bloods INTEGER NOT NULL DEFAULT 0\n'
+            ');'
+        ),
+        'DROP TABLE player_stats;'
+    )
+]
@@ -0,0 +1,28 @@
+"""
+Create in match table
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_04_Tb6Pq-create-match-history-tables'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE in_match(\n'
+            '    user_id BIGINT PRIMARY KEY,\n'
+            '    match_id BIGINT NOT NULL,\n'
+            '    expires_at TIMESTAMP WITH TIME ZONE NOT NULL\n'
+            ');'
+        ),
+        'DROP TABLE in_match;'
+    ),
+    step(
+        'CREATE INDEX in_match_match_id_idx ON in_match (match_id);',
+        'DROP INDEX in_match_match_id_idx;'
+    ),
+    step(
+        'CREATE INDEX in_match_expires_at_idx ON in_match (expires_at);',
+        'DROP INDEX in_match_expires_at_idx;'
+    )
+]
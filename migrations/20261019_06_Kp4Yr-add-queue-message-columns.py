@@ -0,0 +1,22 @@
+"""
+Add queue message columns
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_05_Wd3Jx-create-in-match-table'}
+
+steps = [
+    step(
+        (
+            'ALTER TABLE guilds\n'
+            'ADD COLUMN queue_channel_id BIGINT DEFAULT NULL,\n'
+            'ADD COLUMN queue_message_id BIGINT DEFAULT NULL;'
+        ),
+        (
+            'ALTER TABLE guilds\n'
+            'DROP COLUMN queue_channel_id,\n'
+            'DROP COLUMN queue_message_id;'
+        )
+    )
+]
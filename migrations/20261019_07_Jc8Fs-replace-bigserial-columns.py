@@ -0,0 +1,31 @@
+"""
+Replace bigserial columns
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_06_Kp4Yr-add-queue-message-columns'}
+
+# Discord IDs are always given so the sequences of these columns were never used
+COLUMNS = [
+    ('guilds', 'id'),
+    ('users', 'id'),
+    ('queued_users', 'guild_id'),
+    ('queued_users', 'user_id'),
+    ('banned_users', 'guild_id'),
+    ('banned_users', 'user_id')
+]
+
+steps = [
+    step(
+        (
+            f'ALTER TABLE {table} ALTER COLUMN {column} DROP DEFAULT;\n'
+            f'DROP SEQUENCE {table}_{column}_seq;'
+        ),
+        (
+            f'CREATE SEQUENCE {table}_{column}_seq OWNED BY {table}.{column};\n'
+            f'ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT nextval(\'{table}_{column}_seq\');'
+        )
+    )
+    for table, column in COLUMNS
+]
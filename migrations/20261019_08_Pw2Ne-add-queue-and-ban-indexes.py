@@ -0,0 +1,30 @@
+"""
+Add queue and ban indexes
+"""
+
+from yoyo import step
+
+__depends__ = {'20261019_07_Jc8Fs-replace-bigserial-columns'}
+
+steps = [
+    step(
+        'CREATE INDEX banned_users_unban_time_idx ON banned_users (unban_time) WHERE unban_time IS NOT NULL;',
+        'DROP INDEX banned_users_unban_time_idx;'
+    ),
+    step(
+        # Covers deleting a guild's expired bans and reading the rest without touching the table
+        'CREATE INDEX banned_users_guild_id_unban_time_idx ON banned_users (guild_id, unban_time) INCLUDE (user_id);',
+        'DROP INDEX banned_users_guild_id_unban_time_idx;'
+    ),
+    step(
+        # Covers getting the players in a match that hasn't expired
+        (
+            'DROP INDEX in_match_expires_at_idx;\n'
+            'CREATE INDEX in_match_expires_at_idx ON in_match (expires_at) INCLUDE (user_id, match_id);'
+        ),
+        (
+            'DROP INDEX in_match_expires_at_idx;\n'
+            'CREATE INDEX in_match_expires_at_idx ON in_match (expires_at);'
+        )
+    )
+]
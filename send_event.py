@@ -0,0 +1,55 @@
+# send_event.py
+
+import aiohttp
+import argparse
+import asyncio
+from dotenv import load_dotenv
+import json
+import os
+
+WINNERS = {'draw': 0, 'team_one': 1, 'team_two': 2}
+
+
+def build_event(args):
+    """ Build the match event described by the command line arguments. """
+    event = {'type': f'match_{args.type}', 'match_id': args.match_id}
+
+    if args.type in ('start', 'result'):
+        event['team_one'] = args.team_one
+        event['team_two'] = args.team_two
+
+    if args.type == 'result':
+        event['winner'] = WINNERS[args.winner]
+
+        if args.players:
+            with open(args.players) as f:
+                event['players'] = json.load(f)
+
+    return event
+
+
+async def send_event(url, key, event):
+    """ Post a match event to the bot and return the response status and body. """
+    async with aiohttp.ClientSession(headers={'authentication': key}) as session:
+        async with session.post(url, json=event) as resp:
+            return resp.status, await resp.json()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Post a match event to a running CS:GO League bot')
+    parser.add_argument('type', choices=['start', 'end', 'result'], help='type of match event to post')
+    parser.add_argument('match_id', type=int, help='ID of the match')
+    parser.add_argument('--team-one', type=int, nargs='+', default=[], metavar='discordID',
+                        help='Discord IDs of the first team')
+    parser.add_argument('--team-two', type=int, nargs='+', default=[], metavar='discordID',
+                        help='Discord IDs of the second team')
+    parser.add_argument('--winner', choices=list(WINNERS), default='draw', help='winner of the match')
+    parser.add_argument('--players', metavar='file', help='JSON file with the stat lines of players by Discord ID')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{os.environ.get("EVENTS_PORT", 8080)}/events',
+                        help='URL of the bot\'s events endpoint')
+    args = parser.parse_args()
+
+    key = os.environ['EVENTS_KEY']
+    status, body = asyncio.get_event_loop().run_until_complete(send_event(args.url, key, build_event(args)))
+    print(status, body)
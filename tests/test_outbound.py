@@ -0,0 +1,205 @@
+# test_outbound.py
+
+from bot.cogs.utils.outbound import OutboundScheduler, Priority
+
+import asyncio
+import discord
+from discord.http import HTTPClient
+import types
+
+
+class FakeResponse:
+    """ Stand-in for the aiohttp response discord.py builds its HTTP exceptions from. """
+
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.reason = 'Too Many Requests' if status == 429 else 'OK'
+        self.headers = headers or {}
+
+
+class FakeHTTPClient(HTTPClient):
+    """
+    Stand-in for discord.py's HTTP client that answers the REST calls after a
+    latency, records the order they were made in and the most made at once to
+    each channel, and can be told to fail the next calls to a channel.
+    """
+
+    def __init__(self, latency=0.01, loop=None):
+        super().__init__(loop=loop)
+        self.latency = latency  # Seconds each call takes
+        self.sent = []  # (channel ID, content) of the calls in the order they were made
+        self.in_flight = {}  # Number of calls being made to each channel
+        self.most_in_flight = {}  # Most calls made at once to each channel
+        self.failures = {}  # Exceptions to raise from the next calls to each channel
+        self.gate = None  # Event the calls wait for when set
+
+    async def request(self, route, **kwargs):
+        channel_id = route.channel_id
+        self.sent.append((channel_id, kwargs.get('json', {}).get('content')))
+        self.in_flight[channel_id] = self.in_flight.get(channel_id, 0) + 1
+        self.most_in_flight[channel_id] = max(self.most_in_flight.get(channel_id, 0), self.in_flight[channel_id])
+
+        try:
+            if self.gate is not None:
+                await self.gate.wait()
+
+            await asyncio.sleep(self.latency)
+
+            if self.failures.get(channel_id):
+                raise self.failures[channel_id].pop(0)
+
+            return {'id': str(len(self.sent)), 'channel_id': str(channel_id)}
+        finally:
+            self.in_flight[channel_id] -= 1
+
+
+def run(test):
+    """ Run a test coroutine with a scheduler and fake HTTP client on a new event loop. """
+    def wrapper():
+        loop = asyncio.new_event_loop()
+        http = FakeHTTPClient(loop=loop)
+        scheduler = OutboundScheduler(types.SimpleNamespace(loop=loop), concurrency=4)
+
+        async def run_test():
+            try:
+                await test(scheduler, http)
+            finally:
+                await scheduler.close()
+
+        try:
+            loop.run_until_complete(run_test())
+        finally:
+            loop.close()
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+def channel(channel_id):
+    return discord.Object(id=channel_id)
+
+
+@run
+async def test_sends_writes_and_returns_results(scheduler, http):
+    result = await scheduler.submit(channel(1), http.send_message(1, 'hello'))
+
+    assert result['channel_id'] == '1'
+    assert http.sent == [(1, 'hello')]
+    assert scheduler.metrics['submitted'] == scheduler.metrics['sent'] == 1
+
+
+@run
+async def test_sends_higher_priorities_first(scheduler, http):
+    scheduler.concurrency = 1
+    http.gate = asyncio.Event()
+    blocker = asyncio.ensure_future(scheduler.submit(channel(1), http.send_message(1, 'blocker')))
+    await asyncio.sleep(0)
+    writes = [
+        scheduler.submit(channel(2), http.send_message(2, 'info'), Priority.INFO),
+        scheduler.submit(channel(3), http.send_message(3, 'normal'), Priority.NORMAL),
+        scheduler.submit(channel(4), http.send_message(4, 'critical'), Priority.CRITICAL)
+    ]
+    waiting = asyncio.ensure_future(asyncio.gather(*writes))
+    await asyncio.sleep(0.01)
+    http.gate.set()
+    await asyncio.gather(blocker, waiting)
+
+    assert [content for _, content in http.sent] == ['blocker', 'critical', 'normal', 'info']
+
+
+@run
+async def test_channels_take_turns(scheduler, http):
+    scheduler.concurrency = 1
+    http.gate = asyncio.Event()
+    blocker = asyncio.ensure_future(scheduler.submit(channel(1), http.send_message(1, 'blocker')))
+    await asyncio.sleep(0)
+    writes = [scheduler.submit(channel(2), http.send_message(2, f'a{i}')) for i in range(3)]
+    writes += [scheduler.submit(channel(3), http.send_message(3, f'b{i}')) for i in range(3)]
+    waiting = asyncio.ensure_future(asyncio.gather(*writes))
+    await asyncio.sleep(0.01)
+    http.gate.set()
+    await asyncio.gather(blocker, waiting)
+
+    assert [content for _, content in http.sent[1:]] == ['a0', 'b0', 'a1', 'b1', 'a2', 'b2']
+
+
+@run
+async def test_one_write_in_flight_per_bucket(scheduler, http):
+    await asyncio.gather(*(scheduler.submit(channel(1), http.send_message(1, str(i))) for i in range(4)),
+                         *(scheduler.submit(channel(1), http.add_reaction(1, 10, '✅'), route='reactions')
+                           for _ in range(2)),
+                         *(scheduler.submit(channel(2), http.send_message(2, str(i))) for i in range(4)))
+
+    assert http.most_in_flight == {1: 2, 2: 1}  # The channel's messages and reactions are separate buckets
+    assert scheduler.depths() == {'critical': 0, 'normal': 0, 'info': 0, 'in_flight': 0}
+
+
+@run
+async def test_holds_rate_limited_bucket(scheduler, http):
+    retry_after = 0.1
+    http.failures[1] = [discord.HTTPException(FakeResponse(429, {'Retry-After': str(retry_after)}), 'rate limited')]
+    loop = asyncio.get_event_loop()
+
+    try:
+        await scheduler.submit(channel(1), http.send_message(1, 'limited'))
+    except discord.HTTPException as e:
+        assert e.status == 429
+    else:
+        raise AssertionError('the rate limited write didn\'t raise')
+
+    limited_at = loop.time()
+    other = await scheduler.submit(channel(2), http.send_message(2, 'other'))
+    assert other is not None and loop.time() - limited_at < retry_after
+    await scheduler.submit(channel(1), http.send_message(1, 'retried'))
+
+    assert loop.time() - limited_at >= retry_after * 0.9  # Loop time is only as precise as the selector
+    assert scheduler.metrics['rate_limited'] == scheduler.metrics['failed'] == 1
+
+
+@run
+async def test_skips_writes_of_submitters_that_stopped_waiting(scheduler, http):
+    scheduler.concurrency = 1
+    http.gate = asyncio.Event()
+    blocker = asyncio.ensure_future(scheduler.submit(channel(1), http.send_message(1, 'blocker')))
+    await asyncio.sleep(0)
+    abandoned = asyncio.ensure_future(scheduler.submit(channel(2), http.send_message(2, 'abandoned')))
+    await asyncio.sleep(0)
+    abandoned.cancel()
+    http.gate.set()
+    await blocker
+    await scheduler.submit(channel(3), http.send_message(3, 'after'))
+
+    assert [content for _, content in http.sent] == ['blocker', 'after']
+
+
+@run
+async def test_replaces_workers_ended_by_a_cancelled_write(scheduler, http):
+    http.failures[1] = [asyncio.CancelledError() for _ in range(scheduler.concurrency)]
+
+    for _ in range(scheduler.concurrency):
+        try:
+            await scheduler.submit(channel(1), http.send_message(1, 'cancelled'))
+        except asyncio.CancelledError:
+            pass
+
+    await asyncio.sleep(0)
+    await asyncio.wait_for(asyncio.gather(*(scheduler.submit(channel(i), http.send_message(i, 'after'))
+                                            for i in range(2, 6))), 1)
+
+    assert len(scheduler.workers) == scheduler.concurrency
+    assert http.most_in_flight[2] == 1 and len(http.sent) == scheduler.concurrency + 4
+
+
+@run
+async def test_close_cancels_waiting_writes(scheduler, http):
+    scheduler.concurrency = 1
+    http.gate = asyncio.Event()
+    blocker = asyncio.ensure_future(scheduler.submit(channel(1), http.send_message(1, 'blocker')))
+    await asyncio.sleep(0)
+    waiting = asyncio.ensure_future(scheduler.submit(channel(2), http.send_message(2, 'waiting')))
+    await asyncio.sleep(0)
+    await scheduler.close()
+    await asyncio.wait([blocker, waiting], timeout=1)
+
+    assert blocker.cancelled() and waiting.cancelled()
+    assert http.sent == [(1, 'blocker')]
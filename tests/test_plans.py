@@ -0,0 +1,24 @@
+# test_plans.py
+
+from benchmarks.plans import check_plans
+
+import asyncio
+import os
+import pytest
+
+DB_DSN = os.environ.get('TEST_PRIMARY_DSN')  # Database the scratch schema is created in
+
+pytestmark = pytest.mark.skipif(not DB_DSN, reason='TEST_PRIMARY_DSN isn\'t set')
+
+
+def test_hot_statements_use_indexes():
+    loop = asyncio.new_event_loop()
+
+    try:
+        # A quarter of the check's default size, large enough for the planner to prefer the indexes
+        regressions = loop.run_until_complete(check_plans(DB_DSN, guilds=5_000, users=50_000, min_rows=2_500))
+    finally:
+        loop.close()
+
+    assert regressions == [], '\n'.join(f'{name} scans {", ".join(tables)} sequentially: {statement}'
+                                        for name, statement, tables in regressions)
@@ -0,0 +1,148 @@
+# test_queue.py
+
+from bot.cogs.match import Match
+from bot.cogs.queue import QueueCog
+from bot.cogs.utils import Player, PlayerStats
+
+import aiohttp
+import asyncio
+import types
+
+CAPACITY = 10
+
+
+class FakeMember:
+    """ Stand-in for a guild member that can be queued. """
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f'player{user_id}'
+        self.mention = f'<@{user_id}>'
+
+
+class FakeStatsAPI:
+    """ Stand-in for the stats API that answers after a latency and records the users of each fetch. """
+
+    def __init__(self, latency=0.05):
+        self.latency = latency  # Seconds each fetch takes
+        self.fetches = []  # IDs of the users fetched by each fetch in the order they were made
+        self.failures = []  # Exceptions to raise from the next fetches
+
+    async def from_users(self, users):
+        self.fetches.append([user.id for user in users])
+        await asyncio.sleep(self.latency)
+
+        if self.failures:
+            raise self.failures.pop(0)
+
+        for user in users:
+            yield types.SimpleNamespace(discord=user.id, score=1000)
+
+    def fetched(self):
+        return sorted(user_id for fetch in self.fetches for user_id in fetch)
+
+
+class FakeQueue:
+    """ Stand-in for a guild's queue that builds the contexts of members joining it. """
+
+    def __init__(self, cog):
+        self.cog = cog
+        self.guild = types.SimpleNamespace(id=1)
+        self.users = []
+        self.matches = []  # (users, stats) of each match the queue popped into
+
+    async def queued_users(self):
+        return list(self.users)
+
+    async def enqueue_users(self, *users):
+        self.users += users
+
+    async def dequeue_users(self, *users):
+        removed = [user for user in users if user in self.users]
+        self.users = [user for user in self.users if user not in removed]
+        return removed
+
+    async def guild_config(self):
+        return types.SimpleNamespace(capacity=CAPACITY)
+
+    async def queue_banlist(self):
+        return {}
+
+    def start_match(self, ctx, users, stats):
+        self.matches.append((users, stats))
+
+    async def join(self, member):
+        ctx = types.SimpleNamespace(author=member, guild=self.guild, queued_users=self.queued_users,
+                                    enqueue_users=self.enqueue_users, dequeue_users=self.dequeue_users,
+                                    guild_config=self.guild_config, queue_banlist=self.queue_banlist)
+        await QueueCog.join.callback(self.cog, ctx)
+
+
+def run(test):
+    """ Run a test coroutine with a queue and fake stats API on a new event loop. """
+    def wrapper(monkeypatch):
+        loop = asyncio.new_event_loop()
+        api = FakeStatsAPI()
+        monkeypatch.setattr(PlayerStats, 'from_users', api.from_users)
+        monkeypatch.setattr(Player, 'is_linked', lambda self: asyncio.sleep(0, result=True))
+        match_cog = types.SimpleNamespace(player_match=lambda user: None)
+        bot = types.SimpleNamespace(loop=loop, in_match=set(), get_cog=lambda name: match_cog)
+        cog = QueueCog(bot)
+        cog.display = types.SimpleNamespace(update=lambda ctx, title=None: None)
+        queue = FakeQueue(cog)
+        match_cog.start_match = queue.start_match
+
+        try:
+            loop.run_until_complete(test(queue, api))
+        finally:
+            loop.close()
+
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+async def assert_match_fetches_nothing(queue, api):
+    """ Assert the queue popped into a match that has every player's stats without fetching any. """
+    assert len(queue.matches) == 1
+    users, stats = queue.matches[0]
+    fetches = len(api.fetches)
+    match = types.SimpleNamespace(users=users, stats=stats)
+
+    assert sorted(stats) == [user.id for user in users]
+    assert [x.discord for x in await Match.players_stats(match)] == [user.id for user in users]
+    assert len(api.fetches) == fetches
+
+
+@run
+async def test_prefetches_stats_before_pop(queue, api):
+    members = [FakeMember(i) for i in range(CAPACITY)]
+
+    for member in members[:-1]:
+        await queue.join(member)
+        await asyncio.sleep(api.latency * 2)  # Every prefetch finishes before the next player joins
+
+    assert api.fetched() == list(range(CAPACITY - 1))  # Everyone queued once it was about to pop
+    fetches = len(api.fetches)
+    await queue.join(members[-1])
+
+    assert api.fetches[fetches:] == [[CAPACITY - 1]]  # Only the player whose join filled the queue
+    await assert_match_fetches_nothing(queue, api)
+
+
+@run
+async def test_pops_with_prefetch_in_flight(queue, api):
+    for i in range(CAPACITY):  # Players keep joining while the prefetches are in flight
+        await queue.join(FakeMember(i))
+
+    assert api.fetched() == list(range(CAPACITY))  # Each player once
+    await assert_match_fetches_nothing(queue, api)
+
+
+@run
+async def test_pop_fetches_stats_prefetch_failed_to(queue, api):
+    api.failures.append(aiohttp.ClientError('unavailable'))
+
+    for i in range(CAPACITY):
+        await queue.join(FakeMember(i))
+
+    await assert_match_fetches_nothing(queue, api)
@@ -0,0 +1,167 @@
+# test_replica.py
+
+from bot.cogs.utils import MeteredPool, ReplicaRouter
+
+import asyncio
+import asyncpg
+import os
+import pytest
+import time
+import types
+
+PRIMARY_DSN = os.environ.get('TEST_PRIMARY_DSN')
+REPLICA_DSN = os.environ.get('TEST_REPLICA_DSN')  # Streaming replica of the primary
+
+pytestmark = pytest.mark.skipif(not PRIMARY_DSN or not REPLICA_DSN,
+                                reason='TEST_PRIMARY_DSN and TEST_REPLICA_DSN aren\'t set')
+
+
+def run(max_lag=1.0, replica_dsn=None):
+    """ Run a test coroutine with a router between the test primary and replica on a new event loop. """
+    def decorator(test):
+        def wrapper():
+            loop = asyncio.new_event_loop()
+
+            async def run_test():
+                primary = MeteredPool(await asyncpg.create_pool(PRIMARY_DSN))
+                bot = types.SimpleNamespace(loop=loop, db_pool=primary)
+                router = ReplicaRouter(bot, replica_dsn or REPLICA_DSN, max_lag=max_lag, interval=0.05)
+
+                try:
+                    await test(router)
+                finally:
+                    await router.close()
+                    await primary.close()
+
+            try:
+                loop.run_until_complete(run_test())
+            finally:
+                loop.close()
+
+        wrapper.__name__ = test.__name__
+        return wrapper
+
+    return decorator
+
+
+async def read_from(router, guild_id):
+    """ Get which database a read of a guild is routed to. """
+    async with router.acquire(guild_id) as conn:
+        return 'replica' if await conn.fetchval('SELECT pg_is_in_recovery();') else 'primary'
+
+
+async def write(router):
+    """ Write to the primary and get its WAL position after the write. """
+    async with router.bot.db_pool.acquire() as conn:
+        await conn.execute(
+            'CREATE TABLE IF NOT EXISTS replica_test (written_at TIMESTAMP);\n'
+            'INSERT INTO replica_test VALUES (CURRENT_TIMESTAMP);'
+        )
+        return await conn.fetchval('SELECT (pg_current_wal_lsn() - \'0/0\'::PG_LSN)::BIGINT;')
+
+
+async def until(predicate, timeout=10.0):
+    """ Wait for a predicate to hold. """
+    deadline = time.monotonic() + timeout
+
+    while not predicate():
+        assert time.monotonic() < deadline, f'timed out after {timeout}s'
+        await asyncio.sleep(0.05)
+
+
+async def caught_up(router, timeout=10.0):
+    """ Sample the WAL positions until the router sees the replica replay a sample taken from now on. """
+    sampled_at = time.monotonic()
+
+    while router.replayed_at is None or router.replayed_at < sampled_at:
+        assert time.monotonic() < sampled_at + timeout, f'the replica didn\'t catch up within {timeout}s'
+        await router._sample()
+        await asyncio.sleep(0.05)
+
+
+async def stopped(router):
+    """ Start the router without its sampling loop so the test samples by hand. """
+    await router.start()
+    router.task.cancel()
+    router.task = None
+
+
+@run()
+async def test_reads_from_primary_until_lag_measured(router):
+    await stopped(router)
+
+    assert router.lag is None
+    assert await read_from(router, 1) == 'primary'
+    assert router.reads == {'primary': 1}
+
+
+@run()
+async def test_samples_replayed_wal_position(router):
+    await stopped(router)
+    position = await write(router)
+    sampled_at = time.monotonic()
+    await caught_up(router)
+
+    assert router.replayed_at >= sampled_at  # A sample from after the write has been replayed
+    assert 0 <= router.lag < 10
+    assert all(sample_position > position for _, sample_position in router.samples)  # Only unreplayed samples
+
+
+@run()
+async def test_sampling_loop_measures_lag(router):
+    await router.start()
+    await until(lambda: router.lag is not None)
+
+    assert router.lag <= router.max_lag
+
+
+@run()
+async def test_routes_reads_to_caught_up_replica(router):
+    await router.start()
+    await until(lambda: router.lag is not None)
+
+    assert await read_from(router, 1) == 'replica'
+    assert router.reads == {'replica': 1}
+
+
+@run()
+async def test_reads_written_guild_from_primary_until_replayed(router):
+    await stopped(router)
+    await caught_up(router)
+    router.wrote(1)
+
+    assert await read_from(router, 1) == 'primary'
+    assert await read_from(router, 2) == 'replica'
+
+    await write(router)
+    await caught_up(router)
+
+    assert 1 not in router.writes
+    assert await read_from(router, 1) == 'replica'
+
+
+@run(max_lag=0.2)
+async def test_falls_back_to_primary_when_replica_stale(router):
+    await stopped(router)
+    await caught_up(router)
+
+    assert await read_from(router, 1) == 'replica'
+
+    await asyncio.sleep(0.3)  # No sample newer than the lag limit has been replayed
+
+    assert router.lag > router.max_lag
+    assert await read_from(router, 1) == 'primary'
+
+
+@run(replica_dsn=PRIMARY_DSN)
+async def test_rejects_primary_as_replica(router):
+    await stopped(router)
+
+    with pytest.raises(ValueError):
+        await router._sample()
+
+    router.task = router.bot.loop.create_task(router._sample_loop())
+    await asyncio.sleep(0.2)
+
+    assert router.lag is None
+    assert await read_from(router, 1) == 'primary'
@@ -0,0 +1,195 @@
+# test_server_pool.py
+
+from benchmarks.harness import scratch_database
+from bot.cogs.utils import DBHelper
+from bot.cogs.utils.server_pool import FakeServerRegistry, PoolExhausted, ServerPool, ServerState
+
+import asyncio
+import asyncpg
+import datetime
+import os
+import pytest
+import types
+
+DB_DSN = os.environ.get('TEST_PRIMARY_DSN')  # Database the scratch schema is created in
+
+pytestmark = pytest.mark.skipif(not DB_DSN, reason='TEST_PRIMARY_DSN isn\'t set')
+
+
+def run(spares=2, events=True):
+    """ Run a test coroutine with a server pool on a fake registry and a scratch schema on a new event loop. """
+    def decorator(test):
+        def wrapper():
+            loop = asyncio.new_event_loop()
+
+            async def run_test():
+                async with scratch_database(DB_DSN) as scratch_url:
+                    db_pool = await asyncpg.create_pool(scratch_url)
+                    settings = types.SimpleNamespace(events_port=27000 if events else None)
+                    bot = types.SimpleNamespace(loop=loop, db_pool=db_pool, settings=settings)
+                    pool = ServerPool(bot, FakeServerRegistry(capacity=10), spares=spares, interval=3600)
+
+                    try:
+                        await test(pool)
+                    finally:
+                        await pool.close()
+
+                        if pool.warming is not None:
+                            pool.warming.cancel()
+
+                        await db_pool.close()
+
+            try:
+                loop.run_until_complete(run_test())
+            finally:
+                loop.close()
+
+        wrapper.__name__ = test.__name__
+        return wrapper
+
+    return decorator
+
+
+async def db_state(pool, server):
+    """ Get a pooled server's state in the database. """
+    async with pool.bot.db_pool.acquire() as conn:
+        return await conn.fetchval('SELECT state::TEXT FROM game_servers WHERE id = $1;', server.id)
+
+
+async def insert_servers(pool, count):
+    """ Add free servers to the database without the pool's registry and return their IDs. """
+    async with pool.bot.db_pool.acquire() as conn:
+        rows = await DBHelper(conn).insert_game_servers(*(('10.0.0.1', 27015 + port) for port in range(count)))
+
+    return [row['id'] for row in rows]
+
+
+@run()
+async def test_allocates_from_spares(pool):
+    await pool.start()
+    await pool.warming
+    spares = list(pool.free)
+    server = await pool.allocate()
+
+    assert len(spares) == 2 and server.id == spares[0]
+    assert server.state is ServerState.RESERVED and server.expires_at is not None
+    assert server.id not in pool.free
+    assert await db_state(pool, server) == 'reserved'
+
+
+@run()
+async def test_refills_spares(pool):
+    await pool.start()
+    await pool.warming
+    allocated = [await pool.allocate() for _ in range(pool.spares)]
+    await pool.warming  # Each allocation tops the spares up in the background
+
+    assert len(pool.free) == pool.spares and not set(pool.free).intersection(server.id for server in allocated)
+    assert len(pool.registry.running) == len(allocated) + pool.spares
+    assert pool.utilisation() == {'free': 2, 'reserved': 2, 'in_match': 0, 'draining': 0, 'total': 4,
+                                  'utilisation': 0.5}
+
+
+@run()
+async def test_reclaims_no_show_servers(pool):
+    pool.no_show_timeout = 0.1
+    await pool.start()
+    await pool.warming
+    no_show = await pool.allocate()
+    joined = await pool.allocate()
+    await pool.start_match(no_show, 1)
+    await pool.start_match(joined, 2)
+    await pool.confirm(joined)
+
+    assert await pool.reclaim() == []  # The no-show timeout hasn't passed yet
+
+    await asyncio.sleep(0.2)
+
+    assert await pool.reclaim() == [no_show.id]
+
+    await pool.refresh()
+
+    assert pool.servers[no_show.id].state is ServerState.FREE and pool.servers[no_show.id].match_id is None
+    assert no_show.id in pool.free
+    assert pool.servers[joined.id].state is ServerState.IN_MATCH and (await pool.match_server(2)).id == joined.id
+
+
+@run(events=False)
+async def test_holds_servers_for_match_timeout_without_events(pool):
+    pool.no_show_timeout = 0.1
+    await pool.start()
+    await pool.warming
+    server = await pool.allocate()
+    await pool.start_match(server, 1)
+    await asyncio.sleep(0.2)
+
+    assert await pool.reclaim() == []  # Nothing would confirm the players joined
+
+
+@run(spares=0)
+async def test_never_allocates_draining_server(pool):
+    await insert_servers(pool, 3)
+    await pool.start()
+    in_match = await pool.allocate()
+    await pool.start_match(in_match, 1)
+    free = pool.servers[pool.free[0]]
+    await pool.drain(in_match)
+    await pool.drain(free)
+
+    assert free.id not in pool.servers  # A free server is decommissioned right away
+    assert await db_state(pool, in_match) == 'draining'
+
+    await pool.refresh()
+    allocated = await pool.allocate()
+
+    assert allocated.id not in (in_match.id, free.id)
+
+    with pytest.raises(PoolExhausted):
+        await pool.allocate()
+
+    await pool.release(pool.servers[in_match.id])  # The match ended
+
+    assert in_match.id not in pool.servers and in_match.id not in pool.free
+    assert await db_state(pool, in_match) is None
+
+    with pytest.raises(PoolExhausted):
+        await pool.allocate()
+
+
+@run(spares=0)
+async def test_claims_are_exclusive(pool):
+    server_ids = await insert_servers(pool, 3)
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=pool.reserve_timeout)
+
+    async def claim(server_id):
+        async with pool.bot.db_pool.acquire() as conn:
+            return await DBHelper(conn).claim_game_server(server_id, expires_at)
+
+    claims = await asyncio.gather(*(claim(server_ids[0]) for _ in range(5)))
+
+    assert sorted(claims) == [False] * 4 + [True]
+
+    # Processes with the same view of the pool allocate each of the other servers once between them
+    other = ServerPool(pool.bot, pool.registry, spares=0, interval=3600)
+    await pool.refresh()
+    await other.refresh()
+    results = await asyncio.gather(*(each.allocate() for each in (pool, other) * 2), return_exceptions=True)
+    allocated = [result.id for result in results if not isinstance(result, Exception)]
+
+    assert sorted(allocated) == server_ids[1:]
+    assert sum(isinstance(result, PoolExhausted) for result in results) == 2
+
+
+@run(spares=0)
+async def test_looks_up_servers_other_processes_allocated(pool):
+    await insert_servers(pool, 2)
+    other = ServerPool(pool.bot, pool.registry, spares=0, interval=3600)
+    await pool.refresh()
+    await other.refresh()
+    server = await other.allocate()
+    await other.start_match(server, 1)
+
+    assert pool.servers[server.id].state is ServerState.FREE  # Stale until the next refresh
+    assert (await pool.match_server(1)).id == server.id
+    assert pool.servers[server.id].state is ServerState.IN_MATCH and server.id not in pool.free
+    assert await pool.match_server(2) is None
@@ -0,0 +1,149 @@
+# trace_report.py
+
+import argparse
+import collections
+import json
+import sys
+
+
+def load_traces(paths):
+    """ Read the spans exported by the bot and group them by trace. """
+    traces = collections.defaultdict(list)
+
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    span = json.loads(line)
+                    span['end'] = span['start'] + span['duration_ms'] / 1000
+                    traces[span['trace_id']].append(span)
+
+    return traces
+
+
+def critical_path(span, children, end=None):
+    """Walk back from the end of a span through the children that finished last.
+
+    Parameters
+    ----------
+    span : dict
+        Span to walk.
+    children : dict
+        Lists of spans by their parent's span ID.
+    end : float
+        Time to start walking back from if it's earlier than the span's end,
+        e.g. when the span outlived the parent that was waiting on it.
+
+    Returns
+    -------
+    list
+        Tuples of each span on the critical path and the seconds of the path
+        spent in the span itself rather than in its children.
+    """
+    cursor = span['end'] if end is None else min(end, span['end'])
+    own = 0.0
+    path = []
+
+    for child in sorted(children.get(span['span_id'], []), key=lambda child: child['end'], reverse=True):
+        if child['start'] >= cursor:  # Ran after the part of the path already walked
+            continue
+
+        child_end = min(child['end'], cursor)
+        own += cursor - child_end
+        path.extend(critical_path(child, children, child_end))
+        cursor = child['start']
+
+    own += max(0.0, cursor - span['start'])
+    path.append((span, own))
+    return path
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(traces, top=5):
+    """ Summarize the latency of each command and where its critical path spent the time. """
+    commands = collections.defaultdict(lambda: {'durations': [], 'kinds': collections.Counter(),
+                                                'spans': collections.Counter(), 'failed': 0})
+
+    for spans in traces.values():
+        roots = [span for span in spans if span['parent_id'] is None]
+
+        if len(roots) != 1:  # Partly written trace
+            continue
+
+        root = roots[0]
+        children = collections.defaultdict(list)
+
+        for span in spans:
+            if span['parent_id'] is not None:
+                children[span['parent_id']].append(span)
+
+        command = commands[root['name']]
+        command['durations'].append(root['duration_ms'])
+        command['failed'] += bool(root['attributes'].get('failed') or root['attributes'].get('error'))
+
+        for span, own in critical_path(root, children):
+            command['kinds'][span['kind']] += own * 1000
+
+            if span is not root:
+                command['spans'][f'{span["kind"]}: {span["name"]}'] += own * 1000
+
+    summary = {}
+
+    for name, command in commands.items():
+        count = len(command['durations'])
+        ordered = sorted(command['durations'])
+        summary[name] = {
+            'count': count,
+            'failed': command['failed'],
+            'p50_ms': percentile(ordered, 0.5),
+            'p95_ms': percentile(ordered, 0.95),
+            'max_ms': ordered[-1],
+            'critical_path_ms': {kind: total / count for kind, total in command['kinds'].most_common()},
+            'top_spans_ms': {span: total / count for span, total in command['spans'].most_common(top)}
+        }
+
+    return dict(sorted(summary.items(), key=lambda item: item[1]['count'] * item[1]['p50_ms'], reverse=True))
+
+
+def print_summary(summary):
+    """ Print a summary as a table per command. """
+    for name, command in summary.items():
+        print(f'{name}: {command["count"]} traced, {command["failed"]} failed, p50 {command["p50_ms"]:.1f}ms, '
+              f'p95 {command["p95_ms"]:.1f}ms, max {command["max_ms"]:.1f}ms')
+        total = sum(command['critical_path_ms'].values()) or 1
+        print('    Mean critical path by kind')
+
+        for kind, ms in command['critical_path_ms'].items():
+            print(f'    {ms:>10.1f}ms {ms / total:>6.1%}  {kind}')
+
+        print('    Spans taking the most of it')
+
+        for span, ms in command['top_spans_ms'].items():
+            print(f'    {ms:>10.1f}ms {ms / total:>6.1%}  {span}')
+
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the command traces written by a CS:GO League bot')
+    parser.add_argument('files', nargs='+', metavar='file', help='JSON lines trace files (TRACE_FILE)')
+    parser.add_argument('--command', help='only summarize this command')
+    parser.add_argument('--top', type=int, default=5, help='number of spans to list per command')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args()
+
+    summary = summarize(load_traces(args.files), args.top)
+
+    if args.command is not None:
+        summary = {name: command for name, command in summary.items() if name == args.command}
+
+    if not summary:
+        sys.exit('No complete traces found')
+
+    if args.json:
+        print(json.dumps(summary, indent=4))
+    else:
+        print_summary(summary)